@@ -0,0 +1,93 @@
+import sqlite3
+import argparse
+
+from db import DB_PATH, db_query
+from migrations import STATS_DIMENSIONS
+
+# Названия ключей измерений; неделя — сам ключ
+NAME_QUERIES = {
+    "student": "SELECT user_id, username FROM USERS WHERE user_id IN ({})",
+    "group": 'SELECT group_id, group_name FROM "GROUP" WHERE group_id IN ({})',
+    "subject": "SELECT subject_id, subject_name FROM SUBJECT WHERE subject_id IN ({})",
+    "teacher": "SELECT user_id, username FROM USERS WHERE user_id IN ({})",
+}
+
+# -------------------------
+# Attendance rates
+# -------------------------
+def attendance_rates(dim, keys=None, query=db_query):
+    """
+    Посещаемость по измерению из сводной таблицы ATTENDANCE_STATS (без GROUP BY по ATTENDANCE).
+    - dim: student / group / subject / teacher / week
+    - keys: ограничить список ключей (например, одной группой)
+    - возвращает список dict {key, name, total, attended, by_status, rate}, отсортированный по name
+    """
+    if dim not in STATS_DIMENSIONS:
+        raise ValueError(f"Неизвестное измерение: {dim}")
+    # что считать посещением, решает STATUS.attended
+    sql = """
+        SELECT x.key, st.name, st.attended, x.cnt
+        FROM ATTENDANCE_STATS x JOIN STATUS st ON st.status_id = x.status_id
+        WHERE x.dim = ? AND x.cnt > 0"""
+    params = [dim]
+    if keys is not None:
+        keys = list(keys)
+        if not keys:
+            return []
+        sql += f" AND x.key IN ({','.join('?' * len(keys))})"
+        params += keys
+    result = {}
+    for key, status, attended, cnt in query(sql, tuple(params)):
+        item = result.setdefault(key, {"key": key, "name": key, "total": 0, "attended": 0, "by_status": {}})
+        item["total"] += cnt
+        item["by_status"][status] = item["by_status"].get(status, 0) + cnt
+        if attended:
+            item["attended"] += cnt
+
+    ids = list(result) if dim in NAME_QUERIES else []
+    for i in range(0, len(ids), 900):  # порциями — лимит параметров SQLite
+        chunk = ids[i:i + 900]
+        for id_, name in query(NAME_QUERIES[dim].format(",".join("?" * len(chunk))), tuple(chunk)):
+            result[id_]["name"] = name
+    for item in result.values():
+        item["rate"] = item["attended"] / item["total"] if item["total"] else None
+    return sorted(result.values(), key=lambda item: str(item["name"]))
+
+def verify(conn):
+    """
+    Сверяет сводную таблицу с пересчётом через GROUP BY по ATTENDANCE.
+    Возвращает список расхождений (dim, key, status_id, в сводке, фактически).
+    """
+    mismatches = []
+    for dim, expr in STATS_DIMENSIONS.items():
+        actual = {(key, status): cnt for key, status, cnt in conn.execute(f"""
+            SELECT {expr}, a.status_id, COUNT(*)
+            FROM ATTENDANCE a JOIN SCHEDULE s ON s.schedule_id = a.schedule_id
+            GROUP BY {expr}, a.status_id
+        """)}
+        stored = {(key, status): cnt for key, status, cnt in conn.execute(
+            "SELECT key, status_id, cnt FROM ATTENDANCE_STATS WHERE dim = ? AND cnt <> 0", (dim,))}
+        for k in actual.keys() | stored.keys():
+            if actual.get(k, 0) != stored.get(k, 0):
+                mismatches.append((dim, k[0], k[1], stored.get(k, 0), actual.get(k, 0)))
+    return mismatches
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Статистика посещаемости")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--by", choices=list(STATS_DIMENSIONS), default="group")
+    parser.add_argument("--verify", action="store_true", help="сверить сводку с ATTENDANCE")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    if args.verify:
+        problems = verify(conn)
+        for p in problems:
+            print("mismatch:", p)
+        print("OK" if not problems else f"{len(problems)} расхождений")
+    else:
+        query = lambda sql, params=(): conn.execute(sql, params).fetchall()
+        for item in attendance_rates(args.by, query=query):
+            rate = f"{item['rate'] * 100:.1f}%" if item["rate"] is not None else "-"
+            print(f"{str(item['name']):<30} {item['attended']:>8}/{item['total']:<8} {rate}")
+    conn.close()
@@ -1,68 +1,72 @@
 import sqlite3
 import tkinter as tk
-from tkinter import ttk, messagebox, simpledialog
+from tkinter import ttk, messagebox, simpledialog, filedialog
 import os
-from datetime import datetime
-import time
+from datetime import datetime, timedelta
+
+from db import DB_PATH, db_query, close_pools
+from migrations import migrate
+from attendance import queue_marks, STATUSES, PRESENT
+from reports import attendance_page
+from widgets import PagedTreeview, LoadingOverlay
+from async_db import AsyncDB
+from writequeue import WriteQueue
+from refcache import refs
+from analytics import attendance_rates
+from auth import authenticate, db_rehash, hash_password
+from profiler import profiler
+from replica import Replica
+from timetable import WEEKDAYS, expand, generate_schedule, describe, teacher_window, next_session
+from dashboard import student_dashboard
+from archive import History, archive_files
 
-DB_PATH = "src/attendance.db"
 current_user = None  # dict {id, username, role}
+adb = None           # AsyncDB, создаётся в main_window()
+writes = None        # WriteQueue, создаётся в main_window()
+replica = None       # Replica для отчётов, создаётся в main_window()
+history = None       # History (основная БД + архив семестров), если архив есть
 
-# -------------------------
-# DB helper (improved)
-# -------------------------
-def db_query(query, params=(), fetch=True, retries=6, base_delay=0.1):
-    """
-    Выполняет SQL-запрос к SQLite с повторными попытками при 'database is locked'.
-    - query: SQL строка
-    - params: кортеж параметров
-    - fetch: если True — вернуть cur.fetchall(), иначе None
-    - retries: количество попыток (включая первую)
-    - base_delay: базовая задержка (сек) для экспоненциального backoff
-    """
-    last_exc = None
-    for attempt in range(1, retries + 1):
-        conn = None
-        try:
-            # Небольшой таймаут даёт SQLite время снять блокировку
-            conn = sqlite3.connect(DB_PATH, timeout=5)
-            conn.execute("PRAGMA foreign_keys = ON")
-            cur = conn.cursor()
-            cur.execute(query, params)
-            rows = cur.fetchall() if fetch else None
-            conn.commit()
-            return rows
-        except sqlite3.OperationalError as e:
-            last_exc = e
-            # Повторяем только при блокировке базы данных
-            if "locked" in str(e).lower() and attempt < retries:
-                # закрываем соединение и ждём перед следующей попыткой
-                try:
-                    if conn:
-                        conn.close()
-                except Exception:
-                    pass
-                delay = base_delay * (2 ** (attempt - 1))  # экспоненциальный backoff
-                time.sleep(delay)
-                continue
-            else:
-                # нерешаемая ошибка или исчерпаны попытки — пробрасываем
-                raise
-        finally:
-            try:
-                if conn:
-                    conn.close()
-            except Exception:
-                pass
-    # если цикл завершился без return — бросаем последнее исключение
-    if last_exc:
-        raise last_exc
-    return None
+# Отчёты читают копию БД, которая может отставать от отметок на столько секунд.
+# None — отчёты читают основную БД.
+REPORT_MAX_AGE = 30
 
 if not os.path.exists(DB_PATH):
     messagebox.showerror("Ошибка", f"База данных не найдена!\nОжидается файл:\n{DB_PATH}")
     raise SystemExit(1)
 
+# Схема должна быть актуальной: индексы и UNIQUE-ограничения создаются миграциями
+_conn = sqlite3.connect(DB_PATH)
+migrate(_conn, verbose=False)
+_conn.close()
+
+# -------------------------
+# Background loading
+# -------------------------
+def report_query():
+    """query= для тяжёлых отчётов: копия БД, если она включена, иначе db_query."""
+    return replica.query if replica is not None else db_query
+
+def load_tree(tree, sql, params=(), report=False):
+    """
+    Загружает результат запроса в Treeview в фоновом потоке.
+    Повторный вызов для того же дерева отменяет незавершённую загрузку.
+    - report: тяжёлый отчёт — читать копию БД (см. REPORT_MAX_AGE)
+    """
+    if not hasattr(tree, "overlay"):
+        tree.overlay = LoadingOverlay(tree)
+    tree.overlay.show()
+    def done(rows):
+        tree.overlay.hide()
+        tree.delete(*tree.get_children())
+        for r in rows: tree.insert("", "end", values=r)
+    def failed(error):
+        tree.overlay.hide()
+        messagebox.showerror("Ошибка", f"Не удалось загрузить данные:\n{error}", parent=tree)
+    if report:
+        adb.submit(report_query(), sql, params, on_done=done, on_error=failed, owner=tree, key=str(tree))
+    else:
+        adb.query(sql, params, on_done=done, on_error=failed, owner=tree, key=str(tree))
+
 # -------------------------
 # Login window
 # -------------------------
@@ -81,22 +85,32 @@ def login_window(parent, role):
     def confirm():
         username = e_user.get().strip()
         password = e_pass.get().strip()
-        row = db_query("SELECT user_id, username, role FROM USERS WHERE username=? AND password=? AND role=?",
-                       (username, password, role))
-        if not row:
-            messagebox.showerror("Ошибка", "Неверный логин или пароль")
-            return
-        user_id, uname, urole = row[0]
-        global current_user
-        current_user = {"id": user_id, "username": uname, "role": urole}
-        win.destroy()
-        if urole == "admin":
-            open_admin_panel(parent)
-        elif urole == "teacher":
-            open_teacher_panel(parent)
-        elif urole == "student":
-            open_student_panel(parent)
-    tk.Button(win, text="Войти", width=18, command=confirm).pack(pady=14)
+        btn.config(state="disabled")
+
+        def done(user):
+            btn.config(state="normal")
+            if user is None:
+                messagebox.showerror("Ошибка", "Неверный логин или пароль", parent=win)
+                return
+            global current_user
+            current_user = user
+            win.destroy()
+            if user["role"] == "admin":
+                open_admin_panel(parent)
+            elif user["role"] == "teacher":
+                open_teacher_panel(parent)
+            elif user["role"] == "student":
+                open_student_panel(parent)
+
+        def failed(error):
+            btn.config(state="normal")
+            messagebox.showerror("Ошибка", f"Не удалось выполнить вход:\n{error}", parent=win)
+
+        # проверка scrypt-хэша занимает десятки мс — в рабочем потоке, окно не замирает
+        adb.submit(authenticate, username, password, role, rehash=db_rehash,
+                   on_done=done, on_error=failed, owner=win)
+    btn = tk.Button(win, text="Войти", width=18, command=confirm)
+    btn.pack(pady=14)
 
 # -------------------------
 # Admin UI
@@ -115,6 +129,9 @@ def open_admin_panel(root):
     tk.Button(frame, text="Предметы", width=18, command=lambda: admin_manage_subjects(win)).pack(side="left", padx=6)
     tk.Button(frame, text="Расписание", width=18, command=lambda: admin_manage_schedule(win)).pack(side="left", padx=6)
     tk.Button(frame, text="Отчёт — все посещения", width=18, command=lambda: teacher_all_attendance(win)).pack(side="left", padx=6)
+    frame2 = tk.Frame(win); frame2.pack(fill="x", padx=12, pady=6)
+    tk.Button(frame2, text="Статистика", width=18, command=lambda: attendance_stats(win)).pack(side="left", padx=6)
+    tk.Button(frame2, text="Профиль SQL", width=18, command=lambda: sql_profile(win)).pack(side="left", padx=6)
 
 # -- Users management
 def admin_manage_users(parent):
@@ -129,9 +146,7 @@ def admin_manage_users(parent):
     tree.pack(fill="both", expand=True, padx=10, pady=10)
 
     def refresh():
-        for i in tree.get_children(): tree.delete(i)
-        rows = db_query("SELECT user_id, username, role, COALESCE(email,'') FROM USERS ORDER BY user_id")
-        for r in rows: tree.insert("", "end", values=r)
+        load_tree(tree, "SELECT user_id, username, role, COALESCE(email,'') FROM USERS ORDER BY user_id")
     refresh()
 
     def create_user():
@@ -150,7 +165,7 @@ def admin_manage_users(parent):
             if not (u and p and r): messagebox.showerror("Ошибка","Заполните поля"); return
             if r not in ("admin","teacher","student"): messagebox.showerror("Ошибка","Роль должна быть admin/teacher/student"); return
             try:
-                db_query("INSERT INTO USERS (username,password,role,email) VALUES (?,?,?,?)",(u,p,r,em), fetch=False)
+                db_query("INSERT INTO USERS (username,password,role,email) VALUES (?,?,?,?)",(u,hash_password(p),r,em), fetch=False)
                 messagebox.showinfo("OK","Пользователь создан")
                 dlg.destroy(); refresh()
             except sqlite3.IntegrityError:
@@ -172,7 +187,7 @@ def admin_manage_users(parent):
             if new_r not in ("admin","teacher","student"): messagebox.showerror("Ошибка","Роль должна быть admin/teacher/student"); return
             try:
                 if new_p:
-                    db_query("UPDATE USERS SET username=?, password=?, role=?, email=? WHERE user_id=?", (new_u,new_p,new_r,new_em, uid), fetch=False)
+                    db_query("UPDATE USERS SET username=?, password=?, role=?, email=? WHERE user_id=?", (new_u,hash_password(new_p),new_r,new_em, uid), fetch=False)
                 else:
                     db_query("UPDATE USERS SET username=?, role=?, email=? WHERE user_id=?", (new_u,new_r,new_em, uid), fetch=False)
                 messagebox.showinfo("OK","Изменено"); dlg.destroy(); refresh()
@@ -200,9 +215,7 @@ def admin_manage_groups(parent):
     tree.heading("id", text="ID"); tree.heading("name", text="Название"); tree.column("name", width=320)
     tree.pack(fill="both", expand=True, padx=8, pady=8)
     def refresh():
-        for i in tree.get_children(): tree.delete(i)
-        for r in db_query('SELECT group_id, group_name FROM "GROUP" ORDER BY group_id'):
-            tree.insert("", "end", values=r)
+        load_tree(tree, 'SELECT group_id, group_name FROM "GROUP" ORDER BY group_id')
     refresh()
     def create():
         name = simpledialog.askstring("Новая группа","Название группы:", parent=win)
@@ -229,32 +242,30 @@ def admin_manage_group_students(parent):
         tree.heading(c, text=h); tree.column(c, width=w)
     tree.pack(fill="both", expand=True, padx=8, pady=8)
     def refresh():
-        for i in tree.get_children(): tree.delete(i)
-        rows = db_query("""
+        load_tree(tree, """
             SELECT g.group_id, g.group_name, u.user_id, u.username
             FROM GROUP_STUDENTS gs
             JOIN "GROUP" g ON gs.group_id = g.group_id
             JOIN USERS u ON gs.user_id = u.user_id
             ORDER BY g.group_name, u.username
         """)
-        for r in rows: tree.insert("", "end", values=r)
     refresh()
     def add():
         dlg = tk.Toplevel(win); dlg.title("Добавить студента в группу"); dlg.geometry("400x200")
         tk.Label(dlg, text="Группа:").pack(anchor="w", padx=12)
-        groups = [row[1] for row in db_query('SELECT group_id, group_name FROM "GROUP"')]
-        cb_group = ttk.Combobox(dlg, values=groups, width=35); cb_group.pack(padx=12, pady=6)
+        groups = refs.groups()
+        cb_group = ttk.Combobox(dlg, values=groups.names, width=35); cb_group.pack(padx=12, pady=6)
         tk.Label(dlg, text="Студент:").pack(anchor="w", padx=12)
-        students = [row[1] for row in db_query("SELECT user_id, username FROM USERS WHERE role='student'")]
-        cb_student = ttk.Combobox(dlg, values=students, width=35); cb_student.pack(padx=12, pady=6)
+        students = refs.students()
+        cb_student = ttk.Combobox(dlg, values=students.names, width=35); cb_student.pack(padx=12, pady=6)
         def save():
+            gid = groups.id(cb_group.get())
+            sid = students.id(cb_student.get())
+            if gid is None or sid is None:
+                messagebox.showerror("Ошибка","Выберите группу и студента"); return
             try:
-                gid = db_query('SELECT group_id FROM "GROUP" WHERE group_name=?', (cb_group.get(),))[0][0]
-                sid = db_query('SELECT user_id FROM USERS WHERE username=?', (cb_student.get(),))[0][0]
                 db_query("INSERT INTO GROUP_STUDENTS (user_id, group_id) VALUES (?, ?)", (sid, gid), fetch=False)
                 messagebox.showinfo("OK","Студент добавлен в группу"); dlg.destroy(); refresh()
-            except IndexError:
-                messagebox.showerror("Ошибка","Выберите группу и студента")
             except sqlite3.IntegrityError:
                 messagebox.showerror("Ошибка","Студент уже в группе")
         tk.Button(dlg, text="Добавить", command=save).pack(pady=12)
@@ -276,9 +287,7 @@ def admin_manage_subjects(parent):
     tree.heading("id", text="ID"); tree.heading("name", text="Название"); tree.column("name", width=320)
     tree.pack(fill="both", expand=True, padx=8, pady=8)
     def refresh():
-        for i in tree.get_children(): tree.delete(i)
-        for r in db_query('SELECT subject_id, subject_name FROM SUBJECT ORDER BY subject_id'):
-            tree.insert("", "end", values=r)
+        load_tree(tree, 'SELECT subject_id, subject_name FROM SUBJECT ORDER BY subject_id')
     refresh()
     def create():
         name = simpledialog.askstring("Новый предмет","Название предмета:", parent=win)
@@ -308,8 +317,7 @@ def admin_manage_schedule(parent):
     tree.pack(fill="both", expand=True, padx=8, pady=8)
 
     def refresh():
-        for i in tree.get_children(): tree.delete(i)
-        rows = db_query("""
+        load_tree(tree, """
             SELECT s.schedule_id, s.date, s.time, sub.subject_name, u.username, g.group_name, s.room
             FROM SCHEDULE s
             JOIN SUBJECT sub ON s.subject_id = sub.subject_id
@@ -317,35 +325,49 @@ def admin_manage_schedule(parent):
             JOIN "GROUP" g ON s.group_id = g.group_id
             ORDER BY s.date, s.time
         """)
-        for r in rows: tree.insert("", "end", values=r)
     refresh()
 
     def create():
         dlg = tk.Toplevel(win); dlg.title("Добавить занятие"); dlg.geometry("420x420")
         tk.Label(dlg, text="Группа:").pack(anchor="w", padx=12)
-        groups = [row[1] for row in db_query('SELECT group_id, group_name FROM "GROUP"')]
-        cb_group = ttk.Combobox(dlg, values=groups, width=35); cb_group.pack(padx=12, pady=6)
+        groups, teachers, subjects = refs.groups(), refs.teachers(), refs.subjects()
+        cb_group = ttk.Combobox(dlg, values=groups.names, width=35); cb_group.pack(padx=12, pady=6)
         tk.Label(dlg, text="Преподаватель:").pack(anchor="w", padx=12)
-        teachers = [row[1] for row in db_query("SELECT user_id, username FROM USERS WHERE role='teacher'")]
-        cb_teacher = ttk.Combobox(dlg, values=teachers, width=35); cb_teacher.pack(padx=12, pady=6)
+        cb_teacher = ttk.Combobox(dlg, values=teachers.names, width=35); cb_teacher.pack(padx=12, pady=6)
         tk.Label(dlg, text="Предмет:").pack(anchor="w", padx=12)
-        subjects = [row[1] for row in db_query("SELECT subject_id, subject_name FROM SUBJECT")]
-        cb_subject = ttk.Combobox(dlg, values=subjects, width=35); cb_subject.pack(padx=12, pady=6)
+        cb_subject = ttk.Combobox(dlg, values=subjects.names, width=35); cb_subject.pack(padx=12, pady=6)
         tk.Label(dlg, text="Дата (YYYY-MM-DD):").pack(anchor="w", padx=12); e_date = tk.Entry(dlg, width=36); e_date.pack(padx=12, pady=6)
         tk.Label(dlg, text="Время (HH:MM):").pack(anchor="w", padx=12); e_time = tk.Entry(dlg, width=36); e_time.pack(padx=12, pady=6)
         tk.Label(dlg, text="Аудитория:").pack(anchor="w", padx=12); e_room = tk.Entry(dlg, width=36); e_room.pack(padx=12, pady=6)
         def save():
-            try:
-                gid = db_query('SELECT group_id FROM "GROUP" WHERE group_name=?', (cb_group.get(),))[0][0]
-                tid = db_query('SELECT user_id FROM USERS WHERE username=?', (cb_teacher.get(),))[0][0]
-                sid = db_query('SELECT subject_id FROM SUBJECT WHERE subject_name=?', (cb_subject.get(),))[0][0]
-            except Exception:
+            gid = groups.id(cb_group.get())
+            tid = teachers.id(cb_teacher.get())
+            sid = subjects.id(cb_subject.get())
+            if None in (gid, tid, sid):
                 messagebox.showerror("Ошибка","Выберите корректные группу/преподавателя/предмет"); return
-            db_query("""INSERT INTO SCHEDULE (subject_id, teacher_id, group_id, date, time, room)
-                        VALUES (?, ?, ?, ?, ?, ?)""",
-                     (sid, tid, gid, e_date.get().strip(), e_time.get().strip(), e_room.get().strip()), fetch=False)
-            messagebox.showinfo("ОК","Занятие добавлено"); dlg.destroy(); refresh()
-        tk.Button(dlg, text="Сохранить", command=save).pack(pady=12)
+            # одно занятие — правило на один день: те же проверки формата и пересечений
+            day = e_date.get().strip()
+            try:
+                rule = {"group_id": gid, "teacher_id": tid, "subject_id": sid, "weekday": datetime.strptime(day, "%Y-%m-%d").weekday(),
+                        "time": e_time.get().strip(), "room": e_room.get().strip()}
+            except ValueError as e:
+                messagebox.showerror("Ошибка", str(e), parent=dlg); return
+            btn.config(state="disabled"); overlay.show()
+            def done(report):
+                btn.config(state="normal"); overlay.hide()
+                if report["conflicts"]:
+                    messagebox.showerror("Пересечение", describe(report["conflicts"][0], report["sessions"],
+                                                                {"teacher": teachers.name, "group": groups.name}), parent=dlg)
+                    return
+                messagebox.showinfo("ОК","Занятие добавлено"); dlg.destroy(); refresh()
+            def failed(error):
+                btn.config(state="normal"); overlay.hide()
+                messagebox.showerror("Ошибка", str(error), parent=dlg)
+            adb.submit(generate_schedule, [rule], day, day, on_done=done, on_error=failed, owner=dlg, key=str(dlg))
+        btn = tk.Button(dlg, text="Сохранить", command=save); btn.pack(pady=12)
+        overlay = LoadingOverlay(dlg, text="Проверка…")
+    def generate():
+        schedule_generator(win, on_saved=refresh)
     def delete():
         sel = tree.focus()
         if not sel: messagebox.showerror("Ошибка","Выберите занятие"); return
@@ -360,8 +382,102 @@ def admin_manage_schedule(parent):
     tree.bind("<Double-1>", on_double)
     frame = tk.Frame(win); frame.pack(pady=6)
     tk.Button(frame, text="Создать", command=create).pack(side="left", padx=6)
+    tk.Button(frame, text="Сгенерировать…", command=generate).pack(side="left", padx=6)
     tk.Button(frame, text="Удалить", command=delete).pack(side="left", padx=6)
 
+def schedule_generator(parent, on_saved=None):
+    """Диалог генерации расписания на период по недельным правилам (timetable.py)."""
+    dlg = tk.Toplevel(parent); dlg.title("Генерация расписания"); dlg.geometry("900x640")
+    groups, teachers, subjects = refs.groups(), refs.teachers(), refs.subjects()
+    names = {"teacher": teachers.name, "group": groups.name}
+
+    period = tk.Frame(dlg); period.pack(fill="x", padx=10, pady=(10, 4))
+    tk.Label(period, text="С (YYYY-MM-DD):").pack(side="left")
+    e_from = tk.Entry(period, width=12); e_from.pack(side="left", padx=4)
+    tk.Label(period, text="По:").pack(side="left")
+    e_to = tk.Entry(period, width=12); e_to.pack(side="left", padx=4)
+    tk.Label(period, text="Без занятий (через запятую):").pack(side="left")
+    e_skip = tk.Entry(period, width=30); e_skip.pack(side="left", padx=4)
+
+    editor = tk.Frame(dlg); editor.pack(fill="x", padx=10, pady=4)
+    cb_group = ttk.Combobox(editor, values=groups.names, width=14)
+    cb_teacher = ttk.Combobox(editor, values=teachers.names, width=14)
+    cb_subject = ttk.Combobox(editor, values=subjects.names, width=16)
+    cb_day = ttk.Combobox(editor, values=WEEKDAYS, width=4, state="readonly")
+    e_time = tk.Entry(editor, width=6)
+    e_room = tk.Entry(editor, width=10)
+    sp_every = tk.Spinbox(editor, from_=1, to=4, width=3)
+    for label, widget in (("Группа", cb_group), ("Преподаватель", cb_teacher), ("Предмет", cb_subject),
+                          ("День", cb_day), ("Время", e_time), ("Ауд.", e_room), ("Раз в N нед.", sp_every)):
+        tk.Label(editor, text=label + ":").pack(side="left")
+        widget.pack(side="left", padx=(2, 6))
+
+    cols = ("group", "teacher", "subject", "day", "time", "room", "every")
+    rules_tree = ttk.Treeview(dlg, columns=cols, show="headings", height=8)
+    for c, h, w in zip(cols, ["Группа", "Преподаватель", "Предмет", "День", "Время", "Аудитория", "Раз в N нед."],
+                       [140, 160, 180, 60, 70, 110, 90]):
+        rules_tree.heading(c, text=h); rules_tree.column(c, width=w)
+    rules = {}  # iid -> правило с id
+
+    def add_rule():
+        gid, tid, sid = groups.id(cb_group.get()), teachers.id(cb_teacher.get()), subjects.id(cb_subject.get())
+        if None in (gid, tid, sid) or not cb_day.get():
+            messagebox.showerror("Ошибка", "Выберите группу, преподавателя, предмет и день", parent=dlg); return
+        rule = {"group_id": gid, "teacher_id": tid, "subject_id": sid, "weekday": cb_day.get(),
+                "time": e_time.get().strip(), "room": e_room.get().strip(), "every": int(sp_every.get())}
+        try:
+            expand([rule], "2000-01-03", "2000-01-09")  # проверка формата правила
+        except ValueError as e:
+            messagebox.showerror("Ошибка", str(e), parent=dlg); return
+        iid = rules_tree.insert("", "end", values=(cb_group.get(), cb_teacher.get(), cb_subject.get(), cb_day.get(),
+                                                  rule["time"], rule["room"], rule["every"]))
+        rules[iid] = rule
+
+    def remove_rule():
+        for iid in rules_tree.selection():
+            rules_tree.delete(iid)
+            rules.pop(iid, None)
+
+    buttons = tk.Frame(dlg); buttons.pack(fill="x", padx=10)
+    tk.Button(buttons, text="Добавить правило", command=add_rule).pack(side="left", padx=4)
+    tk.Button(buttons, text="Удалить правило", command=remove_rule).pack(side="left", padx=4)
+    rules_tree.pack(fill="x", padx=10, pady=6)
+
+    result = tk.Listbox(dlg, height=12)
+    status = tk.Label(dlg, anchor="w")
+    skip_conflicts = tk.BooleanVar(value=False)
+
+    def run(mode):
+        if not rules:
+            messagebox.showerror("Ошибка", "Добавьте хотя бы одно правило", parent=dlg); return
+        skip = [d.strip() for d in e_skip.get().split(",") if d.strip()]
+        status.config(text="Проверка…")
+
+        def done(report):
+            result.delete(0, "end")
+            for c in report["conflicts"][:500]:
+                result.insert("end", describe(c, report["sessions"], names))
+            text = (f"Занятий: {len(report['sessions'])}, записано: {report['inserted']}, "
+                    f"конфликтов: {len(report['conflicts'])} ({report['seconds']:.2f} с)")
+            if report["invalid"]:
+                text += f"; не проверены (время не HH:MM): {len(report['invalid'])}"
+            status.config(text=text)
+            if report["inserted"] and on_saved is not None:
+                on_saved()
+
+        def failed(error):
+            status.config(text="")
+            messagebox.showerror("Ошибка", str(error), parent=dlg)
+        adb.submit(generate_schedule, list(rules.values()), e_from.get().strip(), e_to.get().strip(), skip, mode,
+                   on_done=done, on_error=failed, owner=dlg, key=str(dlg))
+
+    actions = tk.Frame(dlg); actions.pack(fill="x", padx=10, pady=4)
+    tk.Button(actions, text="Проверить", command=lambda: run("check")).pack(side="left", padx=4)
+    tk.Button(actions, text="Создать", command=lambda: run("skip" if skip_conflicts.get() else "abort")).pack(side="left", padx=4)
+    tk.Checkbutton(actions, text="Пропускать конфликтующие занятия", variable=skip_conflicts).pack(side="left", padx=8)
+    status.pack(fill="x", padx=10)
+    result.pack(fill="both", expand=True, padx=10, pady=(4, 10))
+
 # -------------------------
 # Teacher UI
 # -------------------------
@@ -371,25 +487,52 @@ def open_teacher_panel(root):
     win.geometry("900x600")
     tk.Label(win, text=f"Преподаватель: {current_user['username']}", font=("Segoe UI", 16, "bold")).pack(pady=10)
     frame = tk.Frame(win); frame.pack(pady=6)
+    tk.Button(frame, text="Следующее занятие", width=20, command=lambda: teacher_next_session(win)).pack(side="left", padx=8)
     tk.Button(frame, text="Моё расписание", width=20, command=lambda: teacher_schedule(win)).pack(side="left", padx=8)
     tk.Button(frame, text="Отчёт — все посещения", width=20, command=lambda: teacher_all_attendance(win)).pack(side="left", padx=8)
+    tk.Button(frame, text="Статистика", width=20, command=lambda: attendance_stats(win)).pack(side="left", padx=8)
+
+def teacher_next_session(parent):
+    """Открывает отметку текущего или ближайшего занятия (один поиск по индексу)."""
+    def done(row):
+        if row is None:
+            messagebox.showinfo("Следующее занятие", "Предстоящих занятий нет", parent=parent)
+            return
+        open_attendance_mark_window(parent, row[0])
+    def failed(error):
+        messagebox.showerror("Ошибка", f"Не удалось найти занятие:\n{error}", parent=parent)
+    adb.submit(next_session, current_user["id"], on_done=done, on_error=failed, owner=parent)
+
+# Периоды окна «Моё расписание»: название -> (с, по) в днях от сегодня; None — без границы
+SCHEDULE_PERIODS = {"Сегодня": (0, 0), "Неделя": (0, 6), "Месяц": (0, 30), "Прошедшие": (None, -1), "Всё": (None, None)}
 
 def teacher_schedule(parent):
     win = tk.Toplevel(parent); win.title("Моё расписание"); win.geometry("1000x600")
+    bar = tk.Frame(win); bar.pack(fill="x", padx=8, pady=(8, 0))
+    tk.Label(bar, text="Период:").pack(side="left")
+    cb_period = ttk.Combobox(bar, values=list(SCHEDULE_PERIODS), state="readonly", width=12)
+    cb_period.set("Сегодня"); cb_period.pack(side="left", padx=4)
     cols = ("id","date","time","subject","group","room")
     tree = ttk.Treeview(win, columns=cols, show="headings")
     for c,h,w in zip(cols, ["ID","Дата","Время","Предмет","Группа","Аудитория"], [60,120,120,300,180,120]):
         tree.heading(c, text=h); tree.column(c, width=w)
     tree.pack(fill="both", expand=True, padx=8, pady=8)
-    rows = db_query("""
-        SELECT s.schedule_id, s.date, s.time, sub.subject_name, g.group_name, s.room
-        FROM SCHEDULE s
-        JOIN SUBJECT sub ON s.subject_id = sub.subject_id
-        JOIN "GROUP" g ON s.group_id = g.group_id
-        WHERE s.teacher_id = ?
-        ORDER BY s.date, s.time
-    """, (current_user["id"],))
-    for r in rows: tree.insert("", "end", values=r)
+    tree.overlay = LoadingOverlay(tree)
+    def reload(e=None):
+        today = datetime.now().date()
+        start, end = (None if d is None else today + timedelta(days=d) for d in SCHEDULE_PERIODS[cb_period.get()])
+        tree.overlay.show()
+        def done(rows):
+            tree.overlay.hide()
+            tree.delete(*tree.get_children())
+            for r in rows: tree.insert("", "end", values=r)
+        def failed(error):
+            tree.overlay.hide()
+            messagebox.showerror("Ошибка", f"Не удалось загрузить данные:\n{error}", parent=win)
+        adb.submit(teacher_window, current_user["id"], start, end,
+                   on_done=done, on_error=failed, owner=tree, key=str(tree))
+    cb_period.bind("<<ComboboxSelected>>", reload)
+    reload()
     def on_double(e):
         sel = tree.focus()
         if not sel: return
@@ -399,93 +542,282 @@ def teacher_schedule(parent):
 
 def teacher_all_attendance(parent):
     win = tk.Toplevel(parent); win.title("Все посещения"); win.geometry("1000x600")
-    cols = ("id","student","group","date","time","subject","status")
+
+    # Фильтры выполняются в SQL, таблица подгружает строки страницами при прокрутке
+    groups, subjects = refs.groups(), refs.subjects()
+    bar = tk.Frame(win); bar.pack(fill="x", padx=8, pady=(8, 0))
+    tk.Label(bar, text="Группа:").pack(side="left")
+    cb_group = ttk.Combobox(bar, values=[""] + sorted(groups.names), width=14); cb_group.pack(side="left", padx=4)
+    tk.Label(bar, text="Предмет:").pack(side="left")
+    cb_subject = ttk.Combobox(bar, values=[""] + sorted(subjects.names), width=16); cb_subject.pack(side="left", padx=4)
+    tk.Label(bar, text="С:").pack(side="left")
+    e_from = tk.Entry(bar, width=11); e_from.pack(side="left", padx=4)
+    tk.Label(bar, text="По:").pack(side="left")
+    e_to = tk.Entry(bar, width=11); e_to.pack(side="left", padx=4)
+    tk.Label(bar, text="Статус:").pack(side="left")
+    cb_status = ttk.Combobox(bar, values=[""] + list(STATUSES.values()), width=13); cb_status.pack(side="left", padx=4)
+    with_archive = tk.BooleanVar(value=False)
+    if history is not None:
+        tk.Checkbutton(bar, text="Архив", variable=with_archive, command=lambda: table.reload()).pack(side="left", padx=4)
+
+    filters = {}
+    table = PagedTreeview(win, ("id","student","group","date","time","subject","status"),
+                          ["ID","Студент","Группа","Дата","Время","Предмет","Статус"],
+                          [60,220,160,110,90,220,100],
+                          fetch=lambda direction, key, limit: attendance_page(
+                              filters, direction, key, limit,
+                              query=history.query if with_archive.get() else report_query()),
+                          adb=adb)
+    table.pack(fill="both", expand=True, padx=8, pady=8)
+    if replica is not None:
+        tk.Label(win, text=f"Отчёт строится по копии БД: новые отметки появляются с задержкой до {REPORT_MAX_AGE} с",
+                 fg="gray").pack(anchor="w", padx=8, pady=(0, 6))
+
+    def apply():
+        filters.clear()
+        filters.update(group_id=groups.id(cb_group.get()), subject_id=subjects.id(cb_subject.get()),
+                       date_from=e_from.get().strip(), date_to=e_to.get().strip(), status=cb_status.get())
+        table.reload()
+    tk.Button(bar, text="Применить", command=apply).pack(side="left", padx=6)
+    table.reload()
+
+def attendance_stats(parent):
+    win = tk.Toplevel(parent); win.title("Статистика посещаемости"); win.geometry("700x500")
+    dims = {"Группы": "group", "Предметы": "subject", "Преподаватели": "teacher", "Недели": "week", "Студенты": "student"}
+    bar = tk.Frame(win); bar.pack(fill="x", padx=8, pady=(8, 0))
+    tk.Label(bar, text="Разрез:").pack(side="left")
+    cb_dim = ttk.Combobox(bar, values=list(dims), state="readonly", width=18); cb_dim.current(0); cb_dim.pack(side="left", padx=4)
+    cols = ("name","attended","total","rate")
     tree = ttk.Treeview(win, columns=cols, show="headings")
-    headers = ["ID","Студент","Группа","Дата","Время","Предмет","Статус"]
-    widths = [60,220,160,110,90,220,100]
-    for c,h,w in zip(cols, headers, widths):
+    for c,h,w in zip(cols, ["Название","Посещено","Всего занятий","Посещаемость"], [280,120,120,120]):
+        tree.heading(c, text=h); tree.column(c, width=w)
+    tree.pack(fill="both", expand=True, padx=8, pady=8)
+    tree.overlay = LoadingOverlay(tree)
+
+    # Данные берутся из сводной таблицы ATTENDANCE_STATS — объём не зависит от истории отметок
+    def refresh(e=None):
+        tree.overlay.show()
+        def done(items):
+            tree.overlay.hide()
+            tree.delete(*tree.get_children())
+            for it in items:
+                rate = f"{it['rate'] * 100:.1f}%" if it["rate"] is not None else "-"
+                tree.insert("", "end", values=(it["name"], it["attended"], it["total"], rate))
+        adb.submit(attendance_rates, dims[cb_dim.get()], on_done=done, owner=tree, key=str(tree))
+    cb_dim.bind("<<ComboboxSelected>>", refresh)
+    refresh()
+
+def sql_profile(parent):
+    win = tk.Toplevel(parent); win.title("Профиль SQL"); win.geometry("1100x650")
+    bar = tk.Frame(win); bar.pack(fill="x", padx=8, pady=(8, 0))
+    tk.Label(bar, text="Медленные от, мс:").pack(side="left")
+    e_slow = tk.Entry(bar, width=8); e_slow.insert(0, str(profiler.slow_ms or "")); e_slow.pack(side="left", padx=4)
+    v_explain = tk.BooleanVar(value=profiler.explain)
+    tk.Checkbutton(bar, text="EXPLAIN для медленных", variable=v_explain).pack(side="left", padx=8)
+
+    cols = ("sql","calls","total","avg","p95","max","rows","retries")
+    tree = ttk.Treeview(win, columns=cols, show="headings", height=14)
+    for c,h,w in zip(cols, ["SQL","Вызовов","Всего, мс","Среднее","p95","Макс","Строк","Повторов"], [520,70,90,80,70,80,80,70]):
         tree.heading(c, text=h); tree.column(c, width=w)
     tree.pack(fill="both", expand=True, padx=8, pady=8)
-    rows = db_query("""
-        SELECT a.attendance_id, u.username, g.group_name, s.date, s.time, sub.subject_name, a.status
-        FROM ATTENDANCE a
-        JOIN USERS u ON a.user_id = u.user_id
-        JOIN SCHEDULE s ON a.schedule_id = s.schedule_id
-        JOIN SUBJECT sub ON s.subject_id = sub.subject_id
-        JOIN "GROUP" g ON s.group_id = g.group_id
-        ORDER BY s.date DESC
-    """)
-    for r in rows: tree.insert("", "end", values=r)
+    tk.Label(win, text="Медленные запросы:").pack(anchor="w", padx=8)
+    slow_cols = ("at","ms","sql","plan")
+    slow_tree = ttk.Treeview(win, columns=slow_cols, show="headings", height=8)
+    for c,h,w in zip(slow_cols, ["Время","мс","SQL","План"], [140,80,480,360]):
+        slow_tree.heading(c, text=h); slow_tree.column(c, width=w)
+    slow_tree.pack(fill="both", expand=True, padx=8, pady=(0, 8))
+
+    # статистика собирается в памяти этого процесса: db_query -> profiler
+    def refresh():
+        report = profiler.report()
+        tree.delete(*tree.get_children())
+        for q in report["queries"]:
+            tree.insert("", "end", values=(q["sql"], q["calls"], f"{q['total_ms']:.1f}", f"{q['avg_ms']:.3f}",
+                                           q["p95_ms"], f"{q['max_ms']:.3f}", q["rows"], q["retries"]))
+        slow_tree.delete(*slow_tree.get_children())
+        for s in reversed(report["slow"]):
+            slow_tree.insert("", "end", values=(s["at"], s["ms"], s["sql"], " | ".join(s["plan"] or [])))
+
+    def apply():
+        try:
+            slow_ms = float(e_slow.get()) if e_slow.get().strip() else None
+        except ValueError:
+            messagebox.showerror("Ошибка", "Порог — число миллисекунд", parent=win); return
+        profiler.configure(slow_ms=slow_ms, explain=v_explain.get())
+        refresh()
+
+    def reset():
+        profiler.reset(); refresh()
+
+    def save():
+        path = filedialog.asksaveasfilename(parent=win, defaultextension=".json", initialfile="sql_profile.json",
+                                            filetypes=[("JSON", "*.json")])
+        if path:
+            profiler.dump(path)
+
+    tk.Button(bar, text="Применить", command=apply).pack(side="left", padx=4)
+    tk.Button(bar, text="Обновить", command=refresh).pack(side="left", padx=4)
+    tk.Button(bar, text="Сбросить", command=reset).pack(side="left", padx=4)
+    tk.Button(bar, text="Сохранить JSON", command=save).pack(side="left", padx=4)
+    refresh()
 
 # -------------------------
 # Attendance marking (teacher/admin)
 # -------------------------
+# Отметки, сделанные за это время, уходят в очередь записи одной пачкой
+FLUSH_DELAY_MS = 300
+# Быстрая отметка выделенных строк: 1, 2, 3 — статусы по порядку кодов
+STATUS_KEYS = {str(i): code for i, code in enumerate(STATUSES, 1)}
+
 def open_attendance_mark_window(parent, schedule_id):
+    """
+    Окно отметки: один Treeview на всю группу (строки рисуются лениво, поэтому
+    поток из сотен студентов открывается сразу). Статус меняется клавишами 1-3
+    или пробелом/двойным щелчком по кругу, для одной строки или выделения.
+    Изменения копятся FLUSH_DELAY_MS и отправляются одной пачкой.
+    """
     win = tk.Toplevel(parent)
     win.title(f"Отметка посещаемости — занятие #{schedule_id}")
     win.geometry("800x600")
     tk.Label(win, text=f"Занятие #{schedule_id}", font=("Segoe UI", 14, "bold")).pack(pady=10)
-
-    # Canvas for scrolling if many students
-    canvas = tk.Canvas(win)
-    scrollbar = ttk.Scrollbar(win, orient="vertical", command=canvas.yview)
-    scrollable_frame = ttk.Frame(canvas)
-
-    scrollable_frame.bind(
-        "<Configure>",
-        lambda e: canvas.configure(
-            scrollregion=canvas.bbox("all")
-        )
-    )
-
-    canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
-    canvas.configure(yscrollcommand=scrollbar.set)
-
-    canvas.pack(side="left", fill="both", expand=True)
+    keys = ", ".join(f"{key} — {STATUSES[code]}" for key, code in STATUS_KEYS.items())
+    tk.Label(win, text=f"{keys}; пробел или двойной щелчок — следующий статус; Ctrl+A — выделить всех",
+             fg="gray").pack()
+
+    bar = tk.Frame(win); bar.pack(fill="x", padx=10, pady=6)
+    frame = tk.Frame(win); frame.pack(fill="both", expand=True, padx=10, pady=(0, 10))
+    tree = ttk.Treeview(frame, columns=("student", "status"), show="headings", selectmode="extended")
+    tree.heading("student", text="Студент"); tree.column("student", width=460)
+    tree.heading("status", text="Статус"); tree.column("status", width=220)
+    scrollbar = ttk.Scrollbar(frame, orient="vertical", command=tree.yview)
+    tree.configure(yscrollcommand=scrollbar.set)
+    tree.pack(side="left", fill="both", expand=True)
     scrollbar.pack(side="right", fill="y")
+    tree.tag_configure("unmarked", foreground="gray")
+    tree.tag_configure("pending", foreground="blue")
+    tree.tag_configure("failed", foreground="red")
+    tree.overlay = LoadingOverlay(tree)
+    tree.overlay.show()
+
+    statuses = {}  # user_id -> код статуса (None — не отмечен)
+    pending = {}   # user_id -> код, ещё не отправленный в очередь
+    flush_job = None
+    counter = tk.Label(bar, fg="gray")
+
+    def update_counter():
+        marked = sum(1 for code in statuses.values() if code is not None)
+        counter.config(text=f"Отмечено {marked} из {len(statuses)}")
+
+    def flush():
+        # одна пачка на все изменения за FLUSH_DELAY_MS; очередь ещё и объединяет пачки разных окон
+        nonlocal flush_job
+        flush_job = None
+        if not pending:
+            return
+        marks = dict(pending)
+        pending.clear()
+
+        def saved(_):
+            for user_id, code in marks.items():
+                if statuses.get(user_id) == code and user_id not in pending:
+                    tree.item(str(user_id), tags=())
+
+        def failed(error):
+            for user_id in marks:
+                tree.item(str(user_id), tags=("failed",))
+            messagebox.showerror("Ошибка", f"Не удалось сохранить отметки:\n{error}", parent=win)
+        adb.watch(queue_marks(writes, schedule_id, marks), on_done=saved, on_error=failed, owner=win)
+
+    def set_marks(user_ids, code):
+        nonlocal flush_job
+        for user_id in user_ids:
+            statuses[user_id] = code
+            pending[user_id] = code
+            tree.set(str(user_id), "status", STATUSES[code])
+            tree.item(str(user_id), tags=("pending",))
+        update_counter()
+        if pending and flush_job is None:
+            flush_job = win.after(FLUSH_DELAY_MS, flush)
+
+    def selected():
+        return [int(iid) for iid in tree.selection()]
+
+    def advance():
+        # после отметки одной строки с клавиатуры — к следующему студенту
+        sel = tree.selection()
+        if len(sel) == 1 and tree.next(sel[0]):
+            tree.selection_set(tree.next(sel[0]))
+            tree.focus(tree.next(sel[0]))
+            tree.see(tree.next(sel[0]))
+
+    def cycle(user_ids):
+        # все выделенные получают статус, следующий за статусом первого из них
+        codes = list(STATUSES)
+        current = statuses.get(user_ids[0])
+        set_marks(user_ids, codes[(codes.index(current) + 1) % len(codes)] if current in codes else codes[0])
+
+    def on_key(code):
+        if selected():
+            set_marks(selected(), code)
+            advance()
+        return "break"
+
+    def on_space(e):
+        if selected():
+            cycle(selected())
+        return "break"
 
-    # Fetch students and their current status
-    rows = db_query("""
-        SELECT u.user_id, u.username, a.status
+    def on_double(e):
+        row = tree.identify_row(e.y)
+        if row:
+            cycle([int(row)])
+
+    for key, code in STATUS_KEYS.items():
+        tree.bind(key, lambda e, code=code: on_key(code))
+    tree.bind("<space>", on_space)
+    tree.bind("<Double-1>", on_double)
+    tree.bind("<Control-a>", lambda e: (tree.selection_set(tree.get_children()), "break")[1])
+    def on_destroy(e):
+        # закрытие окна (или родителя) не должно терять накопленные отметки
+        if e.widget is win:
+            if flush_job is not None:
+                win.after_cancel(flush_job)
+            flush()
+    win.bind("<Destroy>", on_destroy)
+
+    for code, name in STATUSES.items():
+        tk.Button(bar, text=name, width=12, command=lambda code=code: set_marks(selected(), code)).pack(side="left", padx=4)
+    tk.Button(bar, text="Все присутствуют",
+              command=lambda: set_marks(list(statuses), PRESENT)).pack(side="left", padx=12)
+    counter.pack(side="right")
+
+    def fill(rows):
+        tree.overlay.hide()
+        for user_id, username, code, name in rows:
+            statuses[user_id] = code
+            tree.insert("", "end", iid=str(user_id), values=(username, name or "Не отмечен"),
+                        tags=() if code is not None else ("unmarked",))
+        update_counter()
+        children = tree.get_children()
+        if children:
+            tree.focus_set()
+            tree.selection_set(children[0])
+            tree.focus(children[0])
+
+    def failed(error):
+        tree.overlay.hide()
+        messagebox.showerror("Ошибка", f"Не удалось загрузить студентов:\n{error}", parent=win)
+
+    adb.submit(lambda: db_query("""
+        SELECT u.user_id, u.username, a.status_id, st.name
         FROM GROUP_STUDENTS gs
         JOIN USERS u ON gs.user_id = u.user_id
         JOIN SCHEDULE s ON s.group_id = gs.group_id
         LEFT JOIN ATTENDANCE a ON a.schedule_id = s.schedule_id AND a.user_id = u.user_id
+        LEFT JOIN STATUS st ON st.status_id = a.status_id
         WHERE s.schedule_id = ?
         ORDER BY u.username
-    """, (schedule_id,))
-
-    status_labels = {}  # To update status display
-
-    for student_id, username, current_status in rows:
-        student_frame = ttk.Frame(scrollable_frame, relief="ridge", borderwidth=1)
-        student_frame.pack(fill="x", padx=10, pady=5)
-
-        name_label = tk.Label(student_frame, text=username, font=("Segoe UI", 12), width=30, anchor="w")
-        name_label.pack(side="left", padx=10)
-
-        status_label = tk.Label(student_frame, text=current_status or "Не отмечен", font=("Segoe UI", 12, "italic"), fg="gray")
-        status_label.pack(side="left", padx=10)
-        status_labels[student_id] = status_label
-
-        def create_button(text, status, student_id=student_id):
-            def on_click():
-                upsert_attendance(schedule_id, student_id, status)
-                status_labels[student_id].config(text=text, fg="black")
-
-            btn = tk.Button(student_frame, text=text, fg="black", width=12, command=on_click)
-            btn.pack(side="left", padx=5)
-
-        create_button("Присутствует", "Присутствует")
-        create_button("Опоздал", "Опоздал")
-        create_button("Отсутствует", "Отсутствует")
-
-def upsert_attendance(schedule_id, user_id, status):
-    exists = db_query("SELECT 1 FROM ATTENDANCE WHERE schedule_id=? AND user_id=?", (schedule_id, user_id))
-    if exists:
-        db_query("UPDATE ATTENDANCE SET status=? WHERE schedule_id=? AND user_id=?", (status, schedule_id, user_id), fetch=False)
-    else:
-        db_query("INSERT INTO ATTENDANCE (schedule_id, user_id, status) VALUES (?, ?, ?)", (schedule_id, user_id, status), fetch=False)
+    """, (schedule_id,)), on_done=fill, on_error=failed, owner=win)
 
 # -------------------------
 # Student UI
@@ -499,57 +831,64 @@ def open_student_panel(root):
     tk.Button(frame, text="Моё расписание", width=18, command=lambda: student_schedule(win)).pack(side="left", padx=6)
     tk.Button(frame, text="Моя посещаемость", width=18, command=lambda: student_attendance(win)).pack(side="left", padx=6)
 
+def show_dashboard(win, tree, fill):
+    """Загружает кабинет студента (dashboard.py) в фоне и передаёт его в fill(dashboard)."""
+    tree.overlay = LoadingOverlay(tree)
+    tree.overlay.show()
+    def done(dashboard):
+        tree.overlay.hide()
+        fill(dashboard)
+    def failed(error):
+        tree.overlay.hide()
+        messagebox.showerror("Ошибка", f"Не удалось загрузить данные:\n{error}", parent=win)
+    adb.submit(student_dashboard, current_user["id"], on_done=done, on_error=failed, owner=win)
+
 def student_schedule(parent):
-    # find group
-    row = db_query("""
-        SELECT g.group_id, g.group_name
-        FROM GROUP_STUDENTS gs
-        JOIN "GROUP" g ON gs.group_id=g.group_id
-        WHERE gs.user_id=?
-    """, (current_user["id"],))
-    if not row:
-        messagebox.showerror("Ошибка","Вы не прикреплены к группе")
-        return
-    gid, gname = row[0]
     win = tk.Toplevel(parent); win.title("Моё расписание"); win.geometry("900x500")
-    tk.Label(win, text=f"Группа: {gname}", font=("Segoe UI", 14, "bold")).pack(pady=6)
+    lbl = tk.Label(win, text="Группа: …", font=("Segoe UI", 14, "bold")); lbl.pack(pady=6)
     cols = ("date","time","subject","teacher","room")
     tree = ttk.Treeview(win, columns=cols, show="headings")
     for c,h,w in zip(cols, ["Дата","Время","Предмет","Преподаватель","Аудитория"], [130,110,260,220,120]):
         tree.heading(c, text=h); tree.column(c, width=w)
     tree.pack(fill="both", expand=True, padx=8, pady=8)
-    rows = db_query("""
-        SELECT s.date, s.time, sub.subject_name, u.username, s.room
-        FROM SCHEDULE s
-        JOIN SUBJECT sub ON s.subject_id=sub.subject_id
-        JOIN USERS u ON s.teacher_id=u.user_id
-        WHERE s.group_id=?
-        ORDER BY s.date, s.time
-    """, (gid,))
-    for r in rows: tree.insert("", "end", values=r)
+    def fill(dashboard):
+        if not dashboard["groups"]:
+            win.destroy()
+            messagebox.showerror("Ошибка","Вы не прикреплены к группе", parent=parent)
+            return
+        lbl.config(text=f"Группа: {', '.join(dashboard['groups'])}")
+        for s in dashboard["schedule"]:
+            tree.insert("", "end", values=(s["date"], s["time"], s["subject"], s["teacher"], s["room"] or ""))
+    show_dashboard(win, tree, fill)
 
 def student_attendance(parent):
     win = tk.Toplevel(parent); win.title("Моя посещаемость"); win.geometry("900x500")
+    lbl = tk.Label(win, text="", font=("Segoe UI", 12)); lbl.pack(pady=6)
     cols = ("date","time","subject","status")
     tree = ttk.Treeview(win, columns=cols, show="headings")
     for c,h,w in zip(cols, ["Дата","Время","Предмет","Статус"], [150,110,380,120]):
         tree.heading(c, text=h); tree.column(c, width=w)
     tree.pack(fill="both", expand=True, padx=8, pady=8)
-    rows = db_query("""
-        SELECT s.date, s.time, sub.subject_name, a.status
-        FROM ATTENDANCE a
-        JOIN SCHEDULE s ON a.schedule_id=s.schedule_id
-        JOIN SUBJECT sub ON s.subject_id=sub.subject_id
-        WHERE a.user_id=?
-        ORDER BY s.date
-    """, (current_user["id"],))
-    for r in rows: tree.insert("", "end", values=r)
+    def fill(dashboard):
+        rate = dashboard["rate"]
+        if rate["marked"]:
+            lbl.config(text=f"Посещено {rate['attended']} из {rate['marked']} ({rate['rate']:.0%})")
+        for s in dashboard["attendance"]:
+            tree.insert("", "end", values=(s["date"], s["time"], s["subject"], s["status"]))
+    show_dashboard(win, tree, fill)
 
 # -------------------------
 # Main window
 # -------------------------
 def main_window():
+    global adb, writes, replica, history
     root = tk.Tk()
+    adb = AsyncDB(root)
+    writes = WriteQueue()
+    if REPORT_MAX_AGE is not None:
+        replica = Replica(max_age=REPORT_MAX_AGE)
+    if archive_files():
+        history = History()
     root.title("Система учёта посещаемости")
     root.geometry("520x420")
     tk.Label(root, text="СИСТЕМА УЧЁТА ПОСЕЩАЕМОСТИ", font=("Segoe UI", 18, "bold")).pack(pady=24)
@@ -557,6 +896,13 @@ def main_window():
     tk.Button(root, text="ПРЕПОДАВАТЕЛЬ", width=30, height=2, command=lambda: login_window(root,"teacher")).pack(pady=8)
     tk.Button(root, text="АДМИНИСТРАТОР", width=30, height=2, command=lambda: login_window(root,"admin")).pack(pady=8)
     root.mainloop()
+    writes.close()  # дописывает отметки, которые ещё в очереди
+    adb.shutdown()
+    if replica is not None:
+        replica.close()
+    if history is not None:
+        history.close()
+    close_pools()
 
 if __name__ == "__main__":
     main_window()
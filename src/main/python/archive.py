@@ -0,0 +1,319 @@
+import os
+import re
+import glob
+import time
+import sqlite3
+import argparse
+import threading
+from datetime import date, datetime
+
+from db import DB_PATH, PRAGMAS, running_on
+
+# Файлы архива лежат рядом с основной БД: <каталог БД>/archive/attendance-<семестр>.db
+ARCHIVE_SUBDIR = "archive"
+ARCHIVE_PREFIX = "attendance-"
+# Семестры по умолчанию: «<год>-autumn» — сентябрь..январь, «<год>-spring» — февраль..август
+TERMS = {"autumn": ("09-01", "01-31"), "spring": ("02-01", "08-31")}
+# Сколько раз повторить перенос, если отметки архивного семестра менялись во время переноса
+MOVE_ATTEMPTS = 3
+_NAME = re.compile(r"^[\w-]+$")
+
+# В архиве те же таблицы и столбцы, что в основной БД; справочники (USERS, "GROUP",
+# SUBJECT, STATUS) остаются в основной БД — архивные строки ссылаются на них по id.
+ARCHIVE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS TERM (
+        name        TEXT PRIMARY KEY,
+        date_from   TEXT NOT NULL,
+        date_to     TEXT NOT NULL,
+        archived_at TEXT NOT NULL,
+        sessions    INTEGER NOT NULL,
+        marks       INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS SCHEDULE (
+        schedule_id INTEGER PRIMARY KEY,
+        subject_id  INTEGER NOT NULL,
+        teacher_id  INTEGER NOT NULL,
+        group_id    INTEGER NOT NULL,
+        date        TEXT NOT NULL,
+        time        TEXT NOT NULL,
+        room        TEXT,
+        starts_at   TEXT GENERATED ALWAYS AS (date || ' ' || time) VIRTUAL
+    );
+    CREATE TABLE IF NOT EXISTS ATTENDANCE (
+        attendance_id INTEGER PRIMARY KEY,
+        schedule_id   INTEGER NOT NULL,
+        user_id       INTEGER NOT NULL,
+        status_id     INTEGER NOT NULL
+    );
+    CREATE UNIQUE INDEX IF NOT EXISTS ux_attendance_schedule_user ON ATTENDANCE(schedule_id, user_id);
+    CREATE INDEX IF NOT EXISTS ix_attendance_user ON ATTENDANCE(user_id, schedule_id, status_id);
+    CREATE INDEX IF NOT EXISTS ix_schedule_group ON SCHEDULE(group_id, date, time);
+    CREATE INDEX IF NOT EXISTS ix_schedule_teacher_starts ON SCHEDULE(teacher_id, starts_at);
+    CREATE INDEX IF NOT EXISTS ix_schedule_date ON SCHEDULE(date, time);
+"""
+SCHEDULE_COLUMNS = "schedule_id, subject_id, teacher_id, group_id, date, time, room"
+ATTENDANCE_COLUMNS = "attendance_id, schedule_id, user_id, status_id"
+
+def term_bounds(name):
+    """Даты семестра по имени '<год>-autumn' / '<год>-spring' (включительно)."""
+    year, _, season = name.partition("-")
+    if not year.isdigit() or season not in TERMS:
+        raise ValueError(f"Семестр задаётся как <год>-{'|'.join(TERMS)}: {name!r}")
+    start, end = TERMS[season]
+    end_year = int(year) + 1 if end < start else int(year)
+    return f"{year}-{start}", f"{end_year}-{end}"
+
+def archive_dir(path=None):
+    return os.path.join(os.path.dirname(os.path.abspath(path or DB_PATH)), ARCHIVE_SUBDIR)
+
+def archive_files(path=None, directory=None):
+    """Файлы архива по порядку семестров: список (имя семестра, путь)."""
+    pattern = os.path.join(directory or archive_dir(path), f"{ARCHIVE_PREFIX}*.db")
+    return [(os.path.basename(f)[len(ARCHIVE_PREFIX):-3], f) for f in sorted(glob.glob(pattern))]
+
+def _connect(path):
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    for name, value in PRAGMAS:
+        conn.execute(f"PRAGMA {name} = {value}")
+    return conn
+
+# -------------------------
+# Archive a term
+# -------------------------
+# Занятия семестра и отметки по ним (ix_schedule_date)
+TERM_SESSIONS = "SELECT schedule_id FROM main.SCHEDULE WHERE date BETWEEN :date_from AND :date_to"
+COPY_SCHEDULE = f"""
+    INSERT OR REPLACE INTO arch.SCHEDULE ({SCHEDULE_COLUMNS})
+    SELECT {SCHEDULE_COLUMNS} FROM main.SCHEDULE WHERE date BETWEEN :date_from AND :date_to
+"""
+COPY_ATTENDANCE = f"""
+    INSERT OR REPLACE INTO arch.ATTENDANCE ({ATTENDANCE_COLUMNS})
+    SELECT {ATTENDANCE_COLUMNS} FROM main.ATTENDANCE WHERE schedule_id IN ({TERM_SESSIONS})
+"""
+# удаляются только строки, совпадающие с уже записанными в архив
+DELETE_ATTENDANCE = f"""
+    DELETE FROM main.ATTENDANCE
+    WHERE schedule_id IN ({TERM_SESSIONS})
+      AND EXISTS (SELECT 1 FROM arch.ATTENDANCE x
+                  WHERE x.attendance_id = ATTENDANCE.attendance_id AND x.schedule_id = ATTENDANCE.schedule_id
+                    AND x.user_id = ATTENDANCE.user_id AND x.status_id = ATTENDANCE.status_id)
+"""
+DELETE_SCHEDULE = f"""
+    DELETE FROM main.SCHEDULE
+    WHERE schedule_id IN ({TERM_SESSIONS})
+      AND NOT EXISTS (SELECT 1 FROM main.ATTENDANCE a WHERE a.schedule_id = SCHEDULE.schedule_id)
+      AND EXISTS (SELECT 1 FROM arch.SCHEDULE x
+                  WHERE x.schedule_id = SCHEDULE.schedule_id AND x.subject_id = SCHEDULE.subject_id
+                    AND x.teacher_id = SCHEDULE.teacher_id AND x.group_id = SCHEDULE.group_id
+                    AND x.date = SCHEDULE.date AND x.time = SCHEDULE.time AND x.room IS SCHEDULE.room)
+"""
+
+def archive_term(name, date_from=None, date_to=None, path=None, directory=None, today=None):
+    """
+    Переносит занятия семестра и отметки по ним из основной БД в отдельный файл
+    <каталог архива>/attendance-<name>.db.
+    - date_from / date_to: границы семестра (по умолчанию — term_bounds(name))
+    - today: для проверки, что семестр закончился (по умолчанию — сегодня)
+    - возвращает dict {term, file, sessions, marks, attempts, seconds}
+
+    Транзакция, пишущая в две БД сразу, в режиме WAL не атомарна, поэтому каждый шаг
+    пишет только в одну: сначала копия в архив (INSERT OR REPLACE), затем удаление из
+    основной БД строк, которые совпадают с архивными. Отметка, изменённая между шагами,
+    остаётся в основной БД и переносится следующим проходом. Прерванный перенос
+    безопасно запустить ещё раз.
+    Удаления проходят через триггеры: ATTENDANCE_STATS и DATA_VERSION описывают только
+    основную БД, инкрементальный экспорт после переноса пересобирается целиком.
+    """
+    if not _NAME.match(name):
+        raise ValueError(f"Имя семестра: буквы, цифры, '_' и '-': {name!r}")
+    if date_from is None or date_to is None:
+        default_from, default_to = term_bounds(name)
+        date_from, date_to = date_from or default_from, date_to or default_to
+    date_from, date_to = date.fromisoformat(str(date_from)), date.fromisoformat(str(date_to))
+    if date_to < date_from:
+        raise ValueError("Конец семестра раньше начала")
+    if date_to >= (today or date.today()):
+        raise ValueError(f"Семестр {name} ещё не закончился ({date_to})")
+
+    started = time.perf_counter()
+    directory = directory or archive_dir(path)
+    os.makedirs(directory, exist_ok=True)
+    file = os.path.join(directory, f"{ARCHIVE_PREFIX}{name}.db")
+    params = {"date_from": date_from.isoformat(), "date_to": date_to.isoformat()}
+
+    arch = sqlite3.connect(file)
+    try:
+        arch.executescript(ARCHIVE_SCHEMA)
+    finally:
+        arch.close()
+
+    conn = _connect(path or DB_PATH)
+    try:
+        conn.execute("ATTACH DATABASE ? AS arch", (file,))
+        # архив — один самодостаточный файл, без -wal
+        conn.execute("PRAGMA arch.journal_mode = DELETE")
+        attempts = 0
+        while True:
+            attempts += 1
+            # 1. копия: пишет только arch; IMMEDIATE задерживает отметки на время копирования
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(COPY_SCHEDULE, params)
+                conn.execute(COPY_ATTENDANCE, params)
+                conn.execute("""
+                    INSERT OR REPLACE INTO arch.TERM (name, date_from, date_to, archived_at, sessions, marks)
+                    VALUES (:name, :date_from, :date_to, :now,
+                            (SELECT COUNT(*) FROM arch.SCHEDULE), (SELECT COUNT(*) FROM arch.ATTENDANCE))
+                """, dict(params, name=name, now=datetime.now().isoformat(timespec="seconds")))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            # 2. удаление: пишет только main
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(DELETE_ATTENDANCE, params)
+                conn.execute(DELETE_SCHEDULE, params)
+                left = conn.execute(f"SELECT COUNT(*) FROM ({TERM_SESSIONS})", params).fetchone()[0]
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            if not left or attempts >= MOVE_ATTEMPTS:
+                break
+        sessions, marks = conn.execute("SELECT sessions, marks FROM arch.TERM WHERE name = ?", (name,)).fetchone()
+        conn.execute("DETACH DATABASE arch")
+    finally:
+        conn.close()
+    if left:
+        raise sqlite3.OperationalError(f"Семестр {name}: {left} занятий изменились во время переноса, "
+                                       f"запустите перенос ещё раз")
+    return {"term": name, "file": file, "sessions": sessions, "marks": marks,
+            "attempts": attempts, "seconds": round(time.perf_counter() - started, 3)}
+
+# -------------------------
+# History: основная БД + архив
+# -------------------------
+class History:
+    """
+    Чтение всей истории: основная БД с подключёнными (ATTACH) файлами архива.
+    Временные представления SCHEDULE и ATTENDANCE (UNION ALL основной таблицы и архивных)
+    перекрывают одноимённые таблицы main, поэтому готовые запросы отчётов
+    (reports.py, export.py) работают без изменений — query подходит как query=.
+    Соединение только читает. SQLite подключает не больше 10 БД (SQLITE_MAX_ATTACHED);
+    для более длинной истории старые семестры стоит объединять в один файл.
+    """
+
+    def __init__(self, path=None, directory=None):
+        self.path = path or DB_PATH
+        self.directory = directory or archive_dir(self.path)
+        self.lock = threading.Lock()
+        self.conn = None
+        self.terms = []
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+        for name, value in PRAGMAS:
+            conn.execute(f"PRAGMA {name} = {value}")
+        schedule, attendance = [f"SELECT {SCHEDULE_COLUMNS}, starts_at FROM main.SCHEDULE"], \
+                               [f"SELECT {ATTENDANCE_COLUMNS} FROM main.ATTENDANCE"]
+        terms = []
+        for i, (term, file) in enumerate(archive_files(directory=self.directory)):
+            alias = f"term_{i}"
+            conn.execute("ATTACH DATABASE ? AS " + alias, (file,))
+            schedule.append(f"SELECT {SCHEDULE_COLUMNS}, starts_at FROM {alias}.SCHEDULE")
+            attendance.append(f"SELECT {ATTENDANCE_COLUMNS} FROM {alias}.ATTENDANCE")
+            terms.append(term)
+        conn.execute("CREATE TEMP VIEW SCHEDULE AS " + " UNION ALL ".join(schedule))
+        conn.execute("CREATE TEMP VIEW ATTENDANCE AS " + " UNION ALL ".join(attendance))
+        conn.execute("PRAGMA query_only = ON")
+        self.conn, self.terms = conn, terms
+        return conn
+
+    def query(self, sql, params=()):
+        with self.lock:
+            conn = self.conn or self._open()
+            with running_on(conn):
+                return conn.execute(sql, params).fetchall()
+
+    def reload(self):
+        """Переподключает архив (после переноса нового семестра)."""
+        self.close()
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+# -------------------------
+# Compaction
+# -------------------------
+def compact(path=None, keep=True):
+    """
+    Сжимает основную БД после переноса: VACUUM INTO пишет плотную копию без свободных
+    страниц, копия проверяется integrity_check и заменяет файл БД.
+    Только при остановленных приложении и сервере: открытые соединения продолжили бы
+    писать в старый файл.
+    - keep: сохранить прежний файл как <БД>.bak
+    - возвращает dict {before, after, seconds} (размеры в байтах)
+    """
+    path = path or DB_PATH
+    started = time.perf_counter()
+    target = path + ".compact"
+    if os.path.exists(target):
+        os.remove(target)
+    conn = _connect(path)
+    try:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        before = os.path.getsize(path)
+        conn.execute("VACUUM INTO ?", (target,))
+    finally:
+        conn.close()
+    check = sqlite3.connect(target)
+    try:
+        result = check.execute("PRAGMA integrity_check").fetchone()[0]
+        check.execute("PRAGMA journal_mode = WAL")  # VACUUM INTO пишет файл в режиме DELETE
+    finally:
+        check.close()
+    if result != "ok":
+        os.remove(target)
+        raise sqlite3.DatabaseError(f"Копия после VACUUM INTO повреждена: {result}")
+    if keep:
+        os.replace(path, path + ".bak")
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    os.replace(target, path)
+    return {"before": before, "after": os.path.getsize(path), "seconds": round(time.perf_counter() - started, 3)}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Перенос закрытых семестров в архив и сжатие основной БД")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--dir", help="каталог архива (по умолчанию — archive/ рядом с БД)")
+    parser.add_argument("--term", help="семестр: <год>-autumn | <год>-spring или своё имя с --from/--to")
+    parser.add_argument("--from", dest="date_from")
+    parser.add_argument("--to", dest="date_to")
+    parser.add_argument("--compact", action="store_true",
+                        help="после переноса сжать основную БД (VACUUM INTO); приложение должно быть остановлено")
+    parser.add_argument("--list", action="store_true", help="показать семестры в архиве")
+    args = parser.parse_args()
+
+    if args.term:
+        try:
+            report = archive_term(args.term, args.date_from, args.date_to, args.db, args.dir)
+        except ValueError as e:
+            raise SystemExit(str(e))
+        print(f"{report['term']}: занятий {report['sessions']}, отметок {report['marks']} -> {report['file']} "
+              f"({report['seconds']:.3f} s)")
+    if args.compact:
+        report = compact(args.db)
+        print(f"сжатие: {report['before'] / 1e6:.1f} MB -> {report['after'] / 1e6:.1f} MB ({report['seconds']:.3f} s)")
+    if args.list:
+        for term, file in archive_files(args.db, args.dir):
+            conn = sqlite3.connect(f"file:{os.path.abspath(file)}?mode=ro", uri=True)
+            try:
+                row = conn.execute("SELECT date_from, date_to, sessions, marks, archived_at FROM TERM").fetchone()
+            finally:
+                conn.close()
+            print(f"{term}: {row[0]} .. {row[1]}, занятий {row[2]}, отметок {row[3]}, перенесён {row[4]}")
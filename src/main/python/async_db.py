@@ -0,0 +1,127 @@
+import queue
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from db import db_query, interrupt_scope
+
+# -------------------------
+# Background queries for Tk
+# -------------------------
+class Task:
+    """Запрос, отправленный в фоновый поток. cancel() — результат будет проигнорирован."""
+
+    def __init__(self, fn, args, kwargs, on_done, on_error, owner, key):
+        self.fn, self.args, self.kwargs = fn, args, kwargs
+        self.on_done, self.on_error = on_done, on_error
+        self.owner, self.key = owner, key
+        self.cancelled = False
+        self.future = None
+        self._conn = None  # соединение, на котором задача сейчас выполняет запрос (db.running_on)
+        self._lock = threading.Lock()
+
+    def cancel(self):
+        self.cancelled = True
+        if self.future is not None:
+            self.future.cancel()
+        with self._lock:
+            if self._conn is not None:
+                # прерывает выполняющийся SQL-запрос (sqlite3.OperationalError: interrupted)
+                self._conn.interrupt()
+
+    def _running_on(self, conn):
+        with self._lock:
+            previous, self._conn = self._conn, conn
+        if conn is not None and self.cancelled:
+            # interrupt() не действует на запросы, начатые после него
+            raise sqlite3.OperationalError("interrupted")
+        return previous
+
+
+class AsyncDB:
+    """
+    Выполняет запросы на пуле рабочих потоков, а колбэки вызывает в потоке Tk
+    (результаты передаются через очередь, которую опрашивает root.after()).
+    - key: новый запрос с тем же key отменяет предыдущий (например, повторный refresh())
+    - owner: виджет; если он уже уничтожен, колбэк не вызывается
+    """
+
+    def __init__(self, root, workers=2, poll_ms=15):
+        self.root = root
+        self.poll_ms = poll_ms
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="db-worker")
+        self.results = queue.Queue()
+        self.latest = {}  # key -> Task
+        self.completed = 0
+        self.cancelled = 0
+        self.root.after(self.poll_ms, self._poll)
+
+    def submit(self, fn, *args, on_done=None, on_error=None, owner=None, key=None, **kwargs):
+        task = Task(fn, args, kwargs, on_done, on_error, owner, key)
+        if key is not None:
+            previous = self.latest.get(key)
+            if previous is not None:
+                previous.cancel()
+            self.latest[key] = task
+        task.future = self.executor.submit(self._run, task)
+        return task
+
+    def query(self, sql, params=(), on_done=None, on_error=None, owner=None, key=None, fetch=True):
+        return self.submit(db_query, sql, params, fetch=fetch,
+                           on_done=on_done, on_error=on_error, owner=owner, key=key)
+
+    def watch(self, future, on_done=None, on_error=None, owner=None):
+        """
+        Передаёт результат уже запущенного concurrent.futures.Future (например,
+        из WriteQueue) в колбэки потока Tk — так же, как результат submit().
+        """
+        task = Task(None, (), {}, on_done, on_error, owner, None)
+        task.future = future
+
+        def finished(f):
+            if f.cancelled():
+                return
+            error = f.exception()
+            self.results.put((task, None if error else f.result(), error))
+
+        future.add_done_callback(finished)
+        return task
+
+    def _run(self, task):
+        if task.cancelled:
+            return
+        try:
+            with interrupt_scope(task._running_on):
+                result, error = task.fn(*task.args, **task.kwargs), None
+        except Exception as e:
+            result, error = None, e
+        self.results.put((task, result, error))
+
+    def _poll(self):
+        try:
+            while True:
+                task, result, error = self.results.get_nowait()
+                if task.key is not None and self.latest.get(task.key) is task:
+                    del self.latest[task.key]
+                if task.cancelled or (task.owner is not None and not task.owner.winfo_exists()):
+                    self.cancelled += 1
+                    continue
+                self.completed += 1
+                try:
+                    if error is not None:
+                        if task.on_error is None:
+                            raise error
+                        task.on_error(error)
+                    elif task.on_done:
+                        task.on_done(result)
+                except Exception as e:
+                    # ошибка в колбэке не должна останавливать опрос очереди
+                    self.root.report_callback_exception(type(e), e, e.__traceback__)
+        except queue.Empty:
+            pass
+        self.root.after(self.poll_ms, self._poll)
+
+    def shutdown(self):
+        for task in list(self.latest.values()):
+            task.cancel()
+        self.executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,66 @@
+from db import db_query, db_transaction
+
+# Коды статусов отметки — строки справочника STATUS (миграция 7).
+# В ATTENDANCE хранится только код; название берётся JOIN STATUS.
+PRESENT, LATE, ABSENT = 1, 2, 3
+STATUSES = {PRESENT: "Присутствует", LATE: "Опоздал", ABSENT: "Отсутствует"}
+ATTENDED = {PRESENT, LATE}
+STATUS_IDS = {name.lower(): code for code, name in STATUSES.items()}
+
+def status_id(status):
+    """
+    Код статуса по коду или названию (без учёта регистра и пробелов по краям).
+    - ValueError, если такого статуса нет
+    """
+    if isinstance(status, int) and not isinstance(status, bool):
+        if status in STATUSES:
+            return status
+    elif isinstance(status, str):
+        code = STATUS_IDS.get(status.strip().lower())
+        if code is not None:
+            return code
+    raise ValueError(f"Неизвестный статус: {status!r}")
+
+# Одна команда вместо SELECT + UPDATE/INSERT.
+# Цель ON CONFLICT — уникальный индекс ux_attendance_schedule_user (миграция 1).
+# WHERE отсекает запись, если статус не изменился.
+UPSERT_ATTENDANCE = """
+    INSERT INTO ATTENDANCE (schedule_id, user_id, status_id) VALUES (?, ?, ?)
+    ON CONFLICT(schedule_id, user_id) DO UPDATE SET status_id = excluded.status_id
+    WHERE ATTENDANCE.status_id IS NOT excluded.status_id
+"""
+
+def upsert_attendance(schedule_id, user_id, status):
+    """Ставит или меняет отметку одного студента (status — код или название)."""
+    db_query(UPSERT_ATTENDANCE, (schedule_id, user_id, status_id(status)), fetch=False)
+
+def mark_attendance_batch(schedule_id, marks):
+    """
+    Записывает пачку отметок для одного занятия одной транзакцией.
+    - schedule_id: занятие
+    - marks: список пар (user_id, status) или dict {user_id: status}; status — код или название
+    - возвращает количество переданных отметок
+    """
+    if isinstance(marks, dict):
+        marks = marks.items()
+    rows = [(schedule_id, user_id, status_id(status)) for user_id, status in marks]
+    if not rows:
+        return 0
+    db_transaction(lambda conn: conn.executemany(UPSERT_ATTENDANCE, rows))
+    return len(rows)
+
+def queue_marks(writes, schedule_id, marks):
+    """
+    Ставит пачку отметок в очередь записи (writequeue.WriteQueue) и сразу возвращается.
+    Отметки из разных окон, пришедшие за несколько миллисекунд, коммитятся одной транзакцией.
+    - возвращает concurrent.futures.Future с количеством отметок; завершается после COMMIT
+    """
+    if isinstance(marks, dict):
+        marks = marks.items()
+    rows = [(schedule_id, user_id, status_id(status)) for user_id, status in marks]
+
+    def work(conn):
+        conn.executemany(UPSERT_ATTENDANCE, rows)
+        return len(rows)
+
+    return writes.submit(work)
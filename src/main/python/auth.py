@@ -0,0 +1,227 @@
+import os
+import hmac
+import time
+import base64
+import hashlib
+import sqlite3
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from db import db_query
+
+# -------------------------
+# Password hashing (scrypt)
+# -------------------------
+# Формат хранения: scrypt$<cost>$<r>$<p>$<salt>$<hash>, salt и hash — base64.
+# cost — log2(N): каждая единица удваивает время и память. Параметры пишутся в саму
+# строку, поэтому смена COST не ломает старые хэши — они пересчитываются при входе.
+COST = 14
+BLOCK_SIZE = 8
+PARALLELISM = 1
+SALT_BYTES = 16
+KEY_BYTES = 32
+PREFIX = "scrypt$"
+
+# Сколько живёт запись кэша проверенных входов (сек)
+SESSION_TTL = 300
+SESSION_MAX = 10000
+
+AUTH_QUERY = "SELECT user_id, username, role, password FROM USERS WHERE username=? AND role=?"
+REHASH_QUERY = "UPDATE USERS SET password=? WHERE user_id=? AND password=?"
+
+def _b64(data):
+    return base64.b64encode(data).decode("ascii")
+
+def _scrypt(password, salt, cost, r, p):
+    n = 1 << cost
+    # hashlib.scrypt отпускает GIL — проверки в разных потоках идут параллельно
+    return hashlib.scrypt(password.encode("utf-8"), salt=salt, n=n, r=r, p=p,
+                          maxmem=2 * 128 * n * r * p + 1024 * 1024, dklen=KEY_BYTES)
+
+def hash_password(password, cost=None):
+    """Возвращает строку для USERS.password с новой случайной солью."""
+    cost = COST if cost is None else cost
+    salt = os.urandom(SALT_BYTES)
+    key = _scrypt(password, salt, cost, BLOCK_SIZE, PARALLELISM)
+    return f"{PREFIX}{cost}${BLOCK_SIZE}${PARALLELISM}${_b64(salt)}${_b64(key)}"
+
+def is_hashed(stored):
+    return isinstance(stored, str) and stored.startswith(PREFIX)
+
+def verify_password(password, stored):
+    """Проверяет пароль по сохранённому хэшу. Открытый текст в stored не принимается."""
+    if not is_hashed(stored):
+        return False
+    try:
+        _, cost, r, p, salt, key = stored.split("$")
+        expected = base64.b64decode(key)
+        actual = _scrypt(password, base64.b64decode(salt), int(cost), int(r), int(p))
+    except (ValueError, TypeError):
+        return False
+    return hmac.compare_digest(actual, expected)
+
+def needs_rehash(stored, cost=None):
+    """True, если хэш посчитан с другими параметрами (например, после увеличения COST)."""
+    cost = COST if cost is None else cost
+    if not is_hashed(stored):
+        return True
+    parts = stored.split("$")
+    return parts[1:4] != [str(cost), str(BLOCK_SIZE), str(PARALLELISM)]
+
+def hash_many(passwords, cost=None, workers=None):
+    """Хэширует список паролей на пуле потоков (для миграции и импорта)."""
+    passwords = list(passwords)
+    if len(passwords) < 2:
+        return [hash_password(p, cost) for p in passwords]
+    with ThreadPoolExecutor(max_workers=workers or min(8, os.cpu_count() or 1)) as pool:
+        return list(pool.map(lambda p: hash_password(p, cost), passwords))
+
+# -------------------------
+# Verified-login cache
+# -------------------------
+class SessionCache:
+    """
+    Короткоживущий кэш успешных входов: повторный вход с тем же паролем в течение
+    ttl секунд не пересчитывает scrypt. Пароль в кэше не хранится — ключ строится
+    через HMAC с секретом процесса. Запись действительна, только пока хэш в USERS
+    не изменился (смена пароля сразу инвалидирует кэш).
+    """
+
+    def __init__(self, ttl=SESSION_TTL, max_size=SESSION_MAX):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.secret = os.urandom(32)
+        self.entries = {}  # key -> (expires, stored_hash, user)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, username, role, password):
+        msg = "\0".join((username, role, password)).encode("utf-8")
+        return hmac.new(self.secret, msg, hashlib.sha256).digest()
+
+    def get(self, username, role, password, stored):
+        key = self._key(username, role, password)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > time.monotonic() and entry[1] == stored:
+                self.hits += 1
+                return entry[2]
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, username, role, password, stored, user):
+        key = self._key(username, role, password)
+        now = time.monotonic()
+        with self.lock:
+            if len(self.entries) >= self.max_size:
+                self.entries = {k: e for k, e in self.entries.items() if e[0] > now}
+                if len(self.entries) >= self.max_size:
+                    self.entries.pop(next(iter(self.entries)))
+            self.entries[key] = (now + self.ttl, stored, user)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses,
+                    "hit_rate": self.hits / total if total else 0.0}
+
+
+sessions = SessionCache()
+
+def authenticate(username, password, role, query=db_query, rehash=None, cache=sessions):
+    """
+    Проверяет логин и пароль. Выполняется в рабочем потоке (scrypt занимает десятки мс).
+    - query: функция чтения (по умолчанию db_query)
+    - rehash(user_id, new_hash, old_hash): запись пересчитанного хэша, если параметры
+      устарели; None — не пересчитывать
+    - возвращает dict {id, username, role} или None
+    """
+    rows = query(AUTH_QUERY, (username, role))
+    if not rows:
+        # время ответа не должно выдавать, существует ли пользователь
+        verify_password(password, _dummy_hash())
+        return None
+    user_id, uname, urole, stored = rows[0]
+    user = cache.get(username, role, password, stored) if cache is not None else None
+    if user is not None:
+        return user
+    if not verify_password(password, stored):
+        return None
+    user = {"id": user_id, "username": uname, "role": urole}
+    if rehash is not None and needs_rehash(stored):
+        new = hash_password(password)
+        rehash(user_id, new, stored)
+        stored = new
+    if cache is not None:
+        cache.put(username, role, password, stored, user)
+    return user
+
+def db_rehash(user_id, new_hash, old_hash):
+    """rehash для authenticate(): обновляет хэш, если его не изменили параллельно."""
+    db_query(REHASH_QUERY, (new_hash, user_id, old_hash), fetch=False)
+
+_dummy = {}
+
+def _dummy_hash():
+    if COST not in _dummy:
+        _dummy[COST] = hash_password("", COST)
+    return _dummy[COST]
+
+# -------------------------
+# CLI: входов в секунду при разной стоимости
+# -------------------------
+def _bench(costs, logins, threads, users):
+    from migrations import BASE_SCHEMA
+
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    try:
+        for cost in costs:
+            conn = sqlite3.connect(path, check_same_thread=False)
+            conn.executescript(BASE_SCHEMA)
+            started = time.perf_counter()
+            hashes = hash_many([f"pass{i}" for i in range(users)], cost, threads)
+            hash_time = time.perf_counter() - started
+            conn.executemany("INSERT INTO USERS (username, password, role) VALUES (?, ?, 'student')",
+                             ((f"student{i}", h) for i, h in enumerate(hashes)))
+            conn.commit()
+            lock = threading.Lock()
+
+            def query(sql, params=()):
+                with lock:
+                    return conn.execute(sql, params).fetchall()
+
+            def login(i, cache):
+                assert authenticate(f"student{i % users}", f"pass{i % users}", "student", query=query, cache=cache)
+
+            line = f"cost {cost:>2} (N=2^{cost}): hash {hash_time * 1000 / users:7.1f} ms/user"
+            for label, cache in (("cold", None), ("cached", SessionCache())):
+                if cache is not None:  # прогрев: у каждого пользователя уже был вход
+                    for i in range(users):
+                        login(i, cache)
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=threads) as pool:
+                    list(pool.map(lambda i: login(i, cache), range(logins)))
+                line += f"  {label}: {logins / (time.perf_counter() - started):9.1f} logins/s"
+            print(line)
+            conn.close()
+    finally:
+        os.remove(path)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Хэширование паролей: замер входов в секунду")
+    parser.add_argument("--costs", default="10,12,14,15", help="log2(N) для scrypt, через запятую")
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--users", type=int, default=50)
+    args = parser.parse_args()
+    _bench([int(c) for c in args.costs.split(",")], args.logins, args.threads, args.users)
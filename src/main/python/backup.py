@@ -0,0 +1,348 @@
+import os
+import json
+import time
+import shutil
+import struct
+import sqlite3
+import hashlib
+import argparse
+import tempfile
+import threading
+from datetime import datetime
+
+from db import DB_PATH, db_query
+
+# Каталог резервных копий рядом с основной БД
+BACKUP_SUBDIR = "backups"
+MANIFEST = "manifest.json"
+# Копирование идёт шагами по PAGES_PER_STEP страниц с паузой STEP_PAUSE между шагами
+PAGES_PER_STEP = 256
+STEP_PAUSE = 0.005
+# Новая полная копия после стольких инкрементальных; хранится KEEP_CHAINS последних цепочек
+FULL_EVERY = 24
+KEEP_CHAINS = 3
+
+# Файл изменённых страниц: заголовок (размер страницы, число страниц), затем записи (номер, страница)
+_DELTA_HEADER = struct.Struct("<II")
+_DELTA_PAGE = struct.Struct("<I")
+_DIGEST_SIZE = 16
+
+def backup_dir(path=None):
+    return os.path.join(os.path.dirname(os.path.abspath(path or DB_PATH)), BACKUP_SUBDIR)
+
+# -------------------------
+# Consistent paged copy
+# -------------------------
+def snapshot(path, target, pages=PAGES_PER_STEP, pause=STEP_PAUSE, progress=None):
+    """
+    Копия БД через sqlite3 backup() по pages страниц за шаг с паузой pause между шагами.
+    Пока идёт копирование, исходное соединение держит открытую читающую транзакцию:
+    в режиме WAL это один снимок, писатели её не ждут, а backup() не начинает
+    копирование заново после каждой чужой записи (без снимка под нагрузкой отметок
+    пошаговая копия может не закончиться). Цена — WAL не сбрасывается в файл БД,
+    пока идёт копия.
+    - progress(copied, total): вызывается после каждого шага
+    - возвращает dict {pages, page_size, steps, seconds}
+    """
+    started = time.perf_counter()
+    source = sqlite3.connect(f"file:{os.path.abspath(path)}?mode=ro", uri=True, timeout=5, isolation_level=None)
+    try:
+        source.execute("BEGIN")
+        source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()  # фиксирует снимок
+        page_size = source.execute("PRAGMA page_size").fetchone()[0]
+        steps = {"n": 0, "total": 0}
+
+        def step(status, remaining, total):
+            steps["n"] += 1
+            steps["total"] = total
+            if progress is not None:
+                progress(total - remaining, total)
+            if remaining and pause:
+                time.sleep(pause)
+
+        dest = sqlite3.connect(target)
+        try:
+            source.backup(dest, pages=pages, progress=step)
+            dest.execute("PRAGMA journal_mode = DELETE")  # копия — один файл, без -wal
+        finally:
+            dest.close()
+        source.execute("COMMIT")
+    finally:
+        source.close()
+    return {"pages": steps["total"], "page_size": page_size, "steps": steps["n"],
+            "seconds": round(time.perf_counter() - started, 3)}
+
+def verify(path):
+    """PRAGMA integrity_check копии; возвращает 'ok' или первое сообщение об ошибке."""
+    conn = sqlite3.connect(f"file:{os.path.abspath(path)}?mode=ro", uri=True)
+    try:
+        return conn.execute("PRAGMA integrity_check").fetchone()[0]
+    finally:
+        conn.close()
+
+def _pages(path, page_size):
+    with open(path, "rb") as f:
+        while True:
+            page = f.read(page_size)
+            if not page:
+                return
+            yield page
+
+def _digest(page):
+    return hashlib.blake2b(page, digest_size=_DIGEST_SIZE).digest()
+
+def _sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+# -------------------------
+# Backup chains: полная копия + изменённые страницы
+# -------------------------
+class BackupSet:
+    """
+    Каталог резервных копий. Цепочка — полная копия (<id>.full.db) и за ней
+    инкрементальные (<id>.delta): только страницы, отличающиеся от предыдущего
+    состояния цепочки. Для сравнения хранятся хэши страниц последнего состояния
+    (<chain>.hashes). Каждое состояние проверяется integrity_check до записи,
+    его sha256 сохраняется в манифесте и сверяется при восстановлении.
+    """
+
+    def __init__(self, directory=None, path=None):
+        self.path = path or DB_PATH
+        self.directory = directory or backup_dir(self.path)
+        self.manifest_path = os.path.join(self.directory, MANIFEST)
+
+    def load(self):
+        try:
+            with open(self.manifest_path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"chains": []}
+
+    def _save(self, manifest):
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.manifest_path)
+
+    def _file(self, name):
+        return os.path.join(self.directory, name)
+
+    def backup(self, full=False, pages=PAGES_PER_STEP, pause=STEP_PAUSE, full_every=FULL_EVERY,
+               keep=KEEP_CHAINS, progress=None):
+        """
+        Делает резервную копию: полную, если full=True, цепочки ещё нет, в цепочке уже
+        full_every инкрементальных или изменился размер страницы; иначе — инкрементальную.
+        После записи удаляет цепочки старше keep последних.
+        - возвращает запись манифеста {file, kind, created, pages, changed, bytes, sha256, copy, seconds}
+        """
+        started = time.perf_counter()
+        os.makedirs(self.directory, exist_ok=True)
+        manifest = self.load()
+        chain = manifest["chains"][-1] if manifest["chains"] else None
+        fd, tmp = tempfile.mkstemp(prefix="snapshot-", suffix=".db", dir=self.directory)
+        os.close(fd)
+        pending = [tmp]  # недописанные файлы, удаляются при ошибке
+        try:
+            copy = snapshot(self.path, tmp, pages, pause, progress)
+            result = verify(tmp)
+            if result != "ok":
+                raise sqlite3.DatabaseError(f"Копия не прошла integrity_check: {result}")
+            page_size = copy["page_size"]
+            if (full or chain is None or chain["page_size"] != page_size
+                    or len(chain["entries"]) > full_every
+                    or not os.path.exists(self._file(f"{chain['id']}.hashes"))):
+                chain = {"id": datetime.now().strftime("%Y%m%d-%H%M%S-%f"), "page_size": page_size, "entries": []}
+                manifest["chains"].append(chain)
+            name = f"{chain['id']}.{len(chain['entries']):03d}"
+            hashes_path = self._file(f"{chain['id']}.hashes")
+            new_hashes = bytearray()
+
+            if not chain["entries"]:
+                name += ".full.db"
+                for page in _pages(tmp, page_size):
+                    new_hashes += _digest(page)
+                changed = len(new_hashes) // _DIGEST_SIZE
+                sha = _sha256(tmp)
+                os.replace(tmp, self._file(name))
+                kind = "full"
+            else:
+                name += ".delta"
+                with open(hashes_path, "rb") as f:
+                    old_hashes = f.read()
+                changed = 0
+                h = hashlib.sha256()
+                pending.append(self._file(name) + ".tmp")
+                with open(pending[-1], "wb") as out:
+                    out.write(_DELTA_HEADER.pack(page_size, os.path.getsize(tmp) // page_size))
+                    for pgno, page in enumerate(_pages(tmp, page_size)):
+                        h.update(page)
+                        digest = _digest(page)
+                        new_hashes += digest
+                        if old_hashes[pgno * _DIGEST_SIZE:(pgno + 1) * _DIGEST_SIZE] != digest:
+                            out.write(_DELTA_PAGE.pack(pgno))
+                            out.write(page)
+                            changed += 1
+                os.replace(pending[-1], self._file(name))
+                sha = h.hexdigest()
+                os.remove(tmp)
+                kind = "delta"
+            with open(hashes_path + ".tmp", "wb") as f:
+                f.write(new_hashes)
+            os.replace(hashes_path + ".tmp", hashes_path)
+        except BaseException:
+            for leftover in pending:
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+            raise
+
+        entry = {"file": name, "kind": kind, "created": datetime.now().isoformat(timespec="seconds"),
+                 "pages": len(new_hashes) // _DIGEST_SIZE, "changed": changed,
+                 "bytes": os.path.getsize(self._file(name)), "sha256": sha,
+                 "copy": copy, "seconds": round(time.perf_counter() - started, 3)}
+        chain["entries"].append(entry)
+        self._save(manifest)
+        self.rotate(keep, manifest)
+        return entry
+
+    def rotate(self, keep=KEEP_CHAINS, manifest=None):
+        """Удаляет все цепочки, кроме keep последних. Возвращает число удалённых файлов."""
+        manifest = manifest or self.load()
+        keep = max(keep, 1)
+        if len(manifest["chains"]) <= keep:
+            return 0
+        old, manifest["chains"] = manifest["chains"][:-keep], manifest["chains"][-keep:]
+        self._save(manifest)
+        removed = 0
+        for chain in old:
+            for name in [e["file"] for e in chain["entries"]] + [f"{chain['id']}.hashes"]:
+                if os.path.exists(self._file(name)):
+                    os.remove(self._file(name))
+                    removed += 1
+        return removed
+
+    def restore(self, target, file=None):
+        """
+        Собирает БД на момент копии file (по умолчанию — последней): полная копия цепочки
+        и по порядку её инкрементальные. Сверяет sha256 и integrity_check результата.
+        - target: путь нового файла (существующий файл перезаписывается)
+        - возвращает запись манифеста восстановленной копии
+        """
+        manifest = self.load()
+        for chain in reversed(manifest["chains"]):
+            names = [e["file"] for e in chain["entries"]]
+            if (file is None and names) or file in names:
+                upto = names.index(file) if file else len(names) - 1
+                break
+        else:
+            raise FileNotFoundError(f"Нет резервной копии {file or ''}".strip())
+        entries = chain["entries"][:upto + 1]
+        tmp = target + ".restore"
+        shutil.copyfile(self._file(entries[0]["file"]), tmp)
+        with open(tmp, "r+b") as out:
+            for entry in entries[1:]:
+                with open(self._file(entry["file"]), "rb") as delta:
+                    page_size, page_count = _DELTA_HEADER.unpack(delta.read(_DELTA_HEADER.size))
+                    while True:
+                        head = delta.read(_DELTA_PAGE.size)
+                        if not head:
+                            break
+                        (pgno,) = _DELTA_PAGE.unpack(head)
+                        out.seek(pgno * page_size)
+                        out.write(delta.read(page_size))
+                out.truncate(page_count * page_size)
+        entry = entries[-1]
+        if _sha256(tmp) != entry["sha256"]:
+            os.remove(tmp)
+            raise sqlite3.DatabaseError(f"{entry['file']}: контрольная сумма не совпадает")
+        result = verify(tmp)
+        if result != "ok":
+            os.remove(tmp)
+            raise sqlite3.DatabaseError(f"{entry['file']}: {result}")
+        os.replace(tmp, target)
+        return entry
+
+# -------------------------
+# CLI: задержка отметок во время копии
+# -------------------------
+def _bench(path, seconds, pages, pause):
+    from attendance import UPSERT_ATTENDANCE, STATUSES
+
+    marks = db_query("SELECT schedule_id, user_id FROM ATTENDANCE ORDER BY attendance_id DESC LIMIT 2000", path=path)
+    codes = list(STATUSES)
+    size = os.path.getsize(path)
+    directory = tempfile.mkdtemp(prefix="attendance-backup-bench-")
+    backups = BackupSet(directory, path)
+    modes = [("no backup", None), ("one step", (-1, 0)), (f"{pages} pages/step", (pages, pause))]
+    try:
+        for label, step in modes:
+            stop = threading.Event()
+            latencies = []
+
+            def marker():
+                i = 0
+                while not stop.is_set():
+                    s, u = marks[i % len(marks)]
+                    started = time.perf_counter()
+                    db_query(UPSERT_ATTENDANCE, (s, u, codes[i % len(codes)]), fetch=False, path=path)
+                    latencies.append((time.perf_counter() - started) * 1000)
+                    i += 1
+
+            thread = threading.Thread(target=marker)
+            thread.start()
+            copies, copy_seconds, started = [], 0.0, time.perf_counter()
+            while time.perf_counter() - started < seconds:
+                if step is None:
+                    time.sleep(0.05)
+                    continue
+                entry = backups.backup(pages=step[0], pause=step[1])
+                copies.append(entry)
+                copy_seconds += entry["copy"]["seconds"]
+            stop.set()
+            thread.join()
+            latencies.sort()
+            line = (f"{label:<16}: {len(latencies) / (time.perf_counter() - started):7.0f} marks/s, "
+                    f"p50 {latencies[len(latencies) // 2]:.2f} ms, p99 {latencies[int(len(latencies) * 0.99)]:.2f} ms, "
+                    f"max {latencies[-1]:.1f} ms")
+            if copies:
+                deltas = [c for c in copies if c["kind"] == "delta"]
+                line += (f"; {len(copies)} copies, {size * len(copies) / copy_seconds / 1e6:.1f} MB/s"
+                         + (f", delta {sum(c['bytes'] for c in deltas) / len(deltas) / 1e3:.0f} KB" if deltas else ""))
+            print(line)
+        restored = os.path.join(directory, "restored.db")
+        entry = backups.restore(restored)
+        print(f"restore {entry['file']}: {verify(restored)}")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Резервные копии БД: полные и по изменённым страницам")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--dir", help="каталог копий (по умолчанию — backups/ рядом с БД)")
+    parser.add_argument("--full", action="store_true", help="начать новую цепочку с полной копии")
+    parser.add_argument("--pages", type=int, default=PAGES_PER_STEP, help="страниц за шаг (-1 — всё за один шаг)")
+    parser.add_argument("--pause", type=float, default=STEP_PAUSE, help="пауза между шагами, сек")
+    parser.add_argument("--keep", type=int, default=KEEP_CHAINS, help="сколько цепочек хранить")
+    parser.add_argument("--restore", metavar="FILE", help="восстановить последнюю копию в FILE")
+    parser.add_argument("--list", action="store_true")
+    parser.add_argument("--bench", type=float, metavar="SECONDS", help="замер задержки отметок во время копий")
+    args = parser.parse_args()
+
+    backups = BackupSet(args.dir, args.db)
+    if args.bench:
+        _bench(args.db, args.bench, args.pages, args.pause)
+    elif args.restore:
+        entry = backups.restore(args.restore)
+        print(f"восстановлено {entry['file']} ({entry['created']}) -> {args.restore}")
+    elif args.list:
+        for chain in backups.load()["chains"]:
+            for e in chain["entries"]:
+                print(f"{e['file']:<36} {e['kind']:<5} {e['created']}  {e['changed']}/{e['pages']} стр., "
+                      f"{e['bytes'] / 1e6:.2f} MB")
+    else:
+        entry = backups.backup(args.full, args.pages, args.pause, keep=args.keep)
+        print(f"{entry['file']}: {entry['kind']}, изменено {entry['changed']} из {entry['pages']} страниц, "
+              f"{entry['bytes'] / 1e6:.2f} MB, копия {entry['copy']['seconds']:.3f} s, всего {entry['seconds']:.3f} s")
@@ -0,0 +1,296 @@
+import os
+import re
+import json
+import time
+import random
+import shutil
+import sqlite3
+import argparse
+import platform
+import tempfile
+from datetime import datetime
+
+import datagen
+from db import PRAGMAS
+from migrations import app_queries, schema_version
+from export import DEFAULT_FORMATS, export, export_incremental, export_parallel
+from reports import attendance_page
+from analytics import attendance_rates
+from attendance import UPSERT_ATTENDANCE, ABSENT
+
+DATA_DIR = "bench_data"
+RESULTS = "bench_results.json"
+# замедление медианы больше чем на 20% считается регрессией
+THRESHOLD = 0.2
+
+# Контекст для подстановки параметров: одна случайная существующая отметка
+# со всем, что к ней относится (студент, занятие, группа, предмет, преподаватель)
+CONTEXT_QUERY = """
+    SELECT a.attendance_id, a.status_id, a.user_id, u.username, u.password, u.role, u.email,
+           s.schedule_id, s.group_id, g.group_name, s.subject_id, sub.subject_name,
+           s.teacher_id, s.date, s.time, s.room, s.starts_at
+    FROM ATTENDANCE a
+    JOIN USERS u ON a.user_id = u.user_id
+    JOIN SCHEDULE s ON a.schedule_id = s.schedule_id
+    JOIN SUBJECT sub ON s.subject_id = sub.subject_id
+    JOIN "GROUP" g ON s.group_id = g.group_id
+    WHERE a.attendance_id = ?
+"""
+CONTEXT_FIELDS = ["attendance_id", "status_id", "user_id", "username", "password", "role", "email",
+                  "schedule_id", "group_id", "group_name", "subject_id", "subject_name",
+                  "teacher_id", "date", "time", "room", "starts_at"]
+# именованные параметры (:uid) -> поле контекста; LIMIT ? -> столбец "limit"
+NAMED_PARAMS = {"uid": "user_id"}
+LIMIT = 100
+_PARAM = re.compile(r"([\w.]+)\s*(?:=|<>|!=|<=|>=|<|>)\s*\?|([\w.]+)\s+BETWEEN\s+\?\s+AND\s+\?|\b(LIMIT)\s+\?",
+                    re.I)
+
+def open_db(path):
+    conn = sqlite3.connect(path, isolation_level=None)  # транзакции — явно
+    for name, value in PRAGMAS:
+        conn.execute(f"PRAGMA {name} = {value}")
+    return conn
+
+def sample_context(conn, rng, max_id):
+    while True:
+        row = conn.execute(CONTEXT_QUERY, (rng.randint(1, max_id),)).fetchone()
+        if row:
+            return dict(zip(CONTEXT_FIELDS, row))
+
+def param_names(sql):
+    """
+    Имена столбцов для каждого «?» в запросе: список столбцов у INSERT,
+    «столбец = ?» (и <, >=, ...), «столбец BETWEEN ? AND ?» и LIMIT ? у остальных.
+    """
+    m = re.match(r'INSERT INTO\s+\S+\s*\(([^)]*)\)', sql, re.I)
+    if m:
+        names = [c.strip() for c in m.group(1).split(",")]
+    else:
+        names = []
+        for column, between, limit in _PARAM.findall(sql):
+            if limit:
+                names.append("limit")
+            else:
+                names.extend([(column or between).split(".")[-1]] * (1 if column else 2))
+    if len(names) != sql.count("?"):
+        raise ValueError(f"Не удалось сопоставить параметры: {sql}")
+    return names
+
+def bind(sql, ctx, n):
+    """Параметры для запуска n: значения из контекста; вставкам — уникальные имена."""
+    values = dict(ctx)
+    if sql.lstrip().upper().startswith("INSERT"):
+        values.update(username=f"bench_user_{n}", group_name=f"bench_group_{n}",
+                      subject_name=f"bench_subject_{n}",
+                      # преподаватель не состоит в группах — пара (user_id, group_id) новая
+                      user_id=ctx["teacher_id"])
+    named = re.findall(r"(?<![\w:]):([A-Za-z_]\w*)", sql)
+    if named:
+        return {name: values[NAMED_PARAMS[name]] for name in named}
+    values["limit"] = LIMIT
+    return tuple(values[name] for name in param_names(sql))
+
+def summarize(samples):
+    ordered = sorted(samples)
+    return {"runs": len(ordered),
+            "median_ms": round(ordered[len(ordered) // 2] * 1000, 3),
+            "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+            "min_ms": round(ordered[0] * 1000, 3)}
+
+def time_statement(conn, sql, contexts):
+    """
+    Выполняет запрос с параметрами каждого контекста. Изменяющие запросы идут
+    в транзакции, которая откатывается, — база после прогона не меняется.
+    Нарушение ограничения (например, FOREIGN KEY при удалении) считается обычным
+    результатом: проверки входят в стоимость запроса.
+    """
+    write = not sql.lstrip().upper().startswith(("SELECT", "WITH"))
+    samples, rows, errors = [], 0, 0
+    for n, ctx in enumerate(contexts):
+        params = bind(sql, ctx, n)
+        if write:
+            conn.execute("BEGIN")
+        try:
+            started = time.perf_counter()
+            try:
+                cur = conn.execute(sql, params)
+                rows = len(cur.fetchall()) if not write else cur.rowcount
+            except sqlite3.IntegrityError:
+                errors += 1
+            samples.append(time.perf_counter() - started)
+        finally:
+            if write:
+                conn.execute("ROLLBACK")
+    result = summarize(samples)
+    result.update(rows=rows, constraint_errors=errors)
+    return result
+
+def time_call(fn, repeat):
+    samples, rows = [], 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = len(fn())
+        samples.append(time.perf_counter() - started)
+    result = summarize(samples)
+    result["rows"] = rows
+    return result
+
+def bench_queries(conn, rng, repeat):
+    max_id = conn.execute("SELECT MAX(attendance_id) FROM ATTENDANCE").fetchone()[0]
+    contexts = [sample_context(conn, rng, max_id) for _ in range(repeat)]
+    results = []
+    for loc, sql in app_queries():
+        item = {"loc": loc, "sql": sql}
+        item.update(time_statement(conn, sql, contexts))
+        results.append(item)
+        print(f"  {loc:<18} {item['median_ms']:>10.3f} ms  p95 {item['p95_ms']:>10.3f} ms  rows {item['rows']}")
+    return results, contexts
+
+def bench_api(conn, contexts, repeat):
+    """Запросы, которые app.py строит не литералом: отчёт, статистика, пакетная отметка."""
+    query = lambda sql, params=(): conn.execute(sql, params).fetchall()
+    ctx = contexts[0]
+
+    def upsert():
+        rows = [(ctx["schedule_id"], uid, ABSENT) for (uid,) in conn.execute(
+            "SELECT user_id FROM GROUP_STUDENTS WHERE group_id = ?", (ctx["group_id"],))]
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(UPSERT_ATTENDANCE, rows)
+        finally:
+            conn.execute("ROLLBACK")
+        return rows
+
+    calls = {
+        "attendance_page": lambda: attendance_page({}, query=query),
+        "attendance_page:group": lambda: attendance_page({"group_id": ctx["group_id"]}, query=query),
+        "attendance_page:deep": lambda: attendance_page(
+            {}, key=(ctx["date"], ctx["attendance_id"]), query=query),
+        "attendance_rates:group": lambda: attendance_rates("group", query=query),
+        "attendance_rates:student": lambda: attendance_rates("student", query=query),
+        "mark_attendance_batch": upsert,
+    }
+    results = {}
+    for name, fn in calls.items():
+        results[name] = time_call(fn, repeat)
+        print(f"  {name:<26} {results[name]['median_ms']:>10.3f} ms  rows {results[name]['rows']}")
+    return results
+
+def bench_exports(conn, db_path, repeat):
+    """Пути экспорта из main.py и export.py; файлы пишутся во временный каталог."""
+    out = tempfile.mkdtemp(prefix="bench_export_")
+    results = {}
+
+    def run(name, fn):
+        samples, report = [], None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            report = fn()
+            samples.append(time.perf_counter() - started)
+        results[name] = summarize(samples)
+        results[name]["report"] = report
+        print(f"  {name:<26} {results[name]['median_ms'] / 1000:>10.3f} s")
+
+    try:
+        for fmt in DEFAULT_FORMATS:
+            run(f"export:{fmt}", lambda: export(conn, out, [fmt]))
+        run("export:all", lambda: export(conn, out))
+        run("export_incremental:full", lambda: export_incremental(conn, out, full=True)[1])
+        run("export_incremental:noop", lambda: export_incremental(conn, out)[1])
+        run("export_parallel", lambda: export_parallel(db_path, out))
+    finally:
+        shutil.rmtree(out, ignore_errors=True)
+    return results
+
+def dataset(scale, seed, data_dir, regenerate=False):
+    """Путь к базе для точки масштаба; генерируется, если её ещё нет."""
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f"{scale}-seed{seed}.db")
+    meta_path = path + ".json"
+    if regenerate or not (os.path.exists(path) and os.path.exists(meta_path)):
+        print(f"generating {scale} -> {path}")
+        sizes = datagen.generate(path, seed=seed, **datagen.SCALES[scale])
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(sizes, f)
+    with open(meta_path, encoding="utf-8") as f:
+        return path, json.load(f)
+
+def run(scales, seed=1, repeat=5, export_repeat=1, data_dir=DATA_DIR, exports=True, regenerate=False):
+    """Прогон по точкам масштаба. Возвращает dict, пригодный для json.dump и compare()."""
+    result = {
+        "meta": {"started": datetime.now().isoformat(timespec="seconds"), "seed": seed, "repeat": repeat,
+                 "python": platform.python_version(), "sqlite": sqlite3.sqlite_version,
+                 "platform": platform.platform()},
+        "scales": {},
+    }
+    for scale in scales:
+        path, sizes = dataset(scale, seed, data_dir, regenerate)
+        rng = random.Random(seed)
+        conn = open_db(path)
+        try:
+            print(f"== {scale}: {sizes['attendance']} attendance rows")
+            point = {"dataset": sizes, "schema_version": schema_version(conn)}
+            point["queries"], contexts = bench_queries(conn, rng, repeat)
+            point["api"] = bench_api(conn, contexts, repeat)
+            if exports:
+                point["exports"] = bench_exports(conn, path, export_repeat)
+        finally:
+            conn.close()
+        result["scales"][scale] = point
+    return result
+
+def _medians(point):
+    # запросы сравниваются по тексту SQL: номера строк в исходниках меняются при правках
+    found = {f"sql:{q['sql']}": q["median_ms"] for q in point.get("queries", [])}
+    for section in ("api", "exports"):
+        found.update({f"{section}:{k}": v["median_ms"] for k, v in point.get(section, {}).items()})
+    return found
+
+def compare(old, new, threshold=THRESHOLD):
+    """
+    Сравнивает медианы двух прогонов по общим точкам масштаба.
+    Возвращает список (scale, name, old_ms, new_ms, ratio) для замедлений больше threshold.
+    """
+    regressions = []
+    for scale, point in new["scales"].items():
+        if scale not in old.get("scales", {}):
+            continue
+        before, after = _medians(old["scales"][scale]), _medians(point)
+        for name in sorted(before.keys() & after.keys()):
+            if before[name] > 0 and after[name] > before[name] * (1 + threshold):
+                regressions.append((scale, name, before[name], after[name], after[name] / before[name]))
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк запросов приложения и экспорта на синтетических данных")
+    parser.add_argument("--scales", default="tiny,small", help="через запятую: " + ",".join(datagen.SCALES))
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=5, help="запусков каждого запроса")
+    parser.add_argument("--export-repeat", type=int, default=1)
+    parser.add_argument("--data-dir", default=DATA_DIR, help="где хранить сгенерированные базы")
+    parser.add_argument("--regenerate", action="store_true", help="пересоздать базы")
+    parser.add_argument("--no-exports", action="store_true", help="не замерять экспорт")
+    parser.add_argument("--out", default=RESULTS, help="JSON-файл с результатами")
+    parser.add_argument("--compare", help="JSON предыдущего прогона для поиска регрессий")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    args = parser.parse_args()
+
+    scales = [s.strip() for s in args.scales.split(",") if s.strip()]
+    unknown = [s for s in scales if s not in datagen.SCALES]
+    if unknown:
+        raise SystemExit(f"Неизвестные точки масштаба: {', '.join(unknown)}")
+
+    result = run(scales, args.seed, args.repeat, args.export_repeat, args.data_dir,
+                 not args.no_exports, args.regenerate)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"results: {args.out}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(json.load(f), result, args.threshold)
+        for scale, name, before, after, ratio in regressions:
+            print(f"REGRESSION [{scale}] {name[:90]}: {before:.3f} -> {after:.3f} ms (x{ratio:.2f})")
+        if regressions:
+            raise SystemExit(1)
+        print("no regressions")
@@ -0,0 +1,179 @@
+import sys
+import json
+import time
+import argparse
+from datetime import datetime
+
+from db import DB_PATH, db_query, db_transaction
+from migrations import CDC_TABLES
+
+BATCH_SIZE = 1000
+POLL_SECONDS = 1.0
+
+# Поля строки по имени таблицы в журнале (tbl — имя таблицы в нижнем регистре)
+COLUMNS = {table.lower(): columns for table, columns in CDC_TABLES.items()}
+
+CHANGES_QUERY = """
+    SELECT change_id, tbl, op, row_key, data
+    FROM CHANGE_LOG
+    WHERE change_id > ?
+    ORDER BY change_id
+    LIMIT ?
+"""
+CONSUMER_QUERY = "SELECT position FROM CDC_CONSUMERS WHERE name = ?"
+# позиция последнего номера, выданного AUTOINCREMENT (журнал может быть пуст после очистки)
+SEQUENCE_QUERY = "SELECT COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'CHANGE_LOG'), 0)"
+
+# -------------------------
+# Reading the log
+# -------------------------
+def changes(after=0, limit=BATCH_SIZE, query=db_query):
+    """
+    Изменения с номером больше after, по порядку.
+    - возвращает список dict {id, table, op, key, row}; row — значения строки после
+      изменения (для op = 'D' — None)
+    """
+    result = []
+    for change_id, tbl, op, key, data in query(CHANGES_QUERY, (after, limit)):
+        row = dict(zip(COLUMNS[tbl], json.loads(data))) if data is not None else None
+        result.append({"id": change_id, "table": tbl, "op": op, "key": key, "row": row})
+    return result
+
+def to_ndjson(records):
+    return "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records)
+
+def position(consumer, query=db_query):
+    """Подтверждённая позиция потребителя; KeyError, если он не зарегистрирован."""
+    rows = query(CONSUMER_QUERY, (consumer,))
+    if not rows:
+        raise KeyError(f"Потребитель {consumer!r} не зарегистрирован")
+    return rows[0][0]
+
+# -------------------------
+# Consumers
+# -------------------------
+# Каждый потребитель хранит позицию — номер последнего обработанного изменения.
+# Журнал хранит только то, что ещё не подтвердили все потребители. Пока потребителей
+# нет, триггеры в журнал не пишут, а удаление последнего потребителя
+# очищает журнал целиком — без читателей он не растёт.
+
+def register(consumer, from_start=False, path=None):
+    """
+    Регистрирует потребителя. Новый потребитель начинает с текущего конца журнала
+    (сначала полный экспорт, затем изменения), from_start=True — с самого старого
+    изменения, которое ещё хранится (изменения, сделанные, пока потребителей не было,
+    не записываются). Повторная регистрация позицию не меняет.
+    - возвращает позицию потребителя
+    """
+    def work(conn):
+        start = 0 if from_start else conn.execute(SEQUENCE_QUERY).fetchone()[0]
+        conn.execute("INSERT OR IGNORE INTO CDC_CONSUMERS (name, position, acked_at) VALUES (?, ?, ?)",
+                     (consumer, start, datetime.now().isoformat(timespec="seconds")))
+        return conn.execute(CONSUMER_QUERY, (consumer,)).fetchone()[0]
+    return db_transaction(work, path=path, label="TRANSACTION cdc.register")
+
+def unregister(consumer, path=None):
+    """Удаляет потребителя; его неподтверждённые изменения больше не держат журнал."""
+    def work(conn):
+        found = conn.execute("DELETE FROM CDC_CONSUMERS WHERE name = ?", (consumer,)).rowcount
+        return found, truncate(conn)
+    return db_transaction(work, path=path, label="TRANSACTION cdc.unregister")
+
+def ack(conn, consumer, upto):
+    """
+    Подтверждает обработку изменений до upto включительно и удаляет из журнала всё,
+    что подтвердили все потребители. Выполняется внутри транзакции записи
+    (db_transaction или WriteQueue.submit).
+    - возвращает (новая позиция, удалено строк журнала)
+    """
+    last = conn.execute(SEQUENCE_QUERY).fetchone()[0]
+    if upto > last:
+        raise ValueError(f"Позиция {upto} больше последнего изменения {last}")
+    found = conn.execute("""
+        UPDATE CDC_CONSUMERS SET position = MAX(position, ?), acked_at = ? WHERE name = ?
+    """, (upto, datetime.now().isoformat(timespec="seconds"), consumer)).rowcount
+    if not found:
+        raise KeyError(f"Потребитель {consumer!r} не зарегистрирован")
+    return conn.execute(CONSUMER_QUERY, (consumer,)).fetchone()[0], truncate(conn)
+
+def truncate(conn):
+    """
+    Удаляет изменения, подтверждённые всеми потребителями. Без потребителей журнал
+    очищается целиком: новый потребитель всё равно начинает с текущего конца, а
+    новые изменения до его регистрации не пишутся.
+    """
+    return conn.execute("""
+        DELETE FROM CHANGE_LOG
+        WHERE change_id <= COALESCE((SELECT MIN(position) FROM CDC_CONSUMERS), (SELECT MAX(change_id) FROM CHANGE_LOG))
+    """).rowcount
+
+def consumers(query=db_query):
+    """Список (name, position, acked_at, отставание в изменениях)."""
+    return query("""
+        SELECT c.name, c.position, c.acked_at,
+               (SELECT COUNT(*) FROM CHANGE_LOG WHERE change_id > c.position)
+        FROM CDC_CONSUMERS c
+        ORDER BY c.name
+    """)
+
+# -------------------------
+# CLI: поток NDJSON в stdout
+# -------------------------
+def follow(consumer, out, path=None, batch_size=BATCH_SIZE, poll=POLL_SECONDS, once=False):
+    """
+    Пишет изменения после позиции потребителя в out как NDJSON и подтверждает каждую
+    пачку после того, как она записана. Если потребитель упадёт между записью и
+    подтверждением, пачка придёт ещё раз — получатель должен уметь пропускать
+    уже виденные id.
+    - once: выйти, когда журнал прочитан до конца
+    """
+    query = lambda sql, params=(): db_query(sql, params, path=path)
+    after = position(consumer, query)
+    while True:
+        batch = changes(after, batch_size, query)
+        if batch:
+            out.write(to_ndjson(batch))
+            out.flush()
+            after = batch[-1]["id"]
+            db_transaction(lambda conn: ack(conn, consumer, after), path=path, label="TRANSACTION cdc.ack")
+        if len(batch) < batch_size:
+            if once:
+                return after
+            time.sleep(poll)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Журнал изменений ATTENDANCE / SCHEDULE / GROUP_STUDENTS в NDJSON")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--register", metavar="NAME", help="зарегистрировать потребителя")
+    parser.add_argument("--from-start", action="store_true", help="с --register: начать с самого старого изменения")
+    parser.add_argument("--unregister", metavar="NAME")
+    parser.add_argument("--consumer", metavar="NAME", help="выдать изменения потребителя и подтвердить их")
+    parser.add_argument("--follow", action="store_true", help="с --consumer: ждать новых изменений")
+    parser.add_argument("--after", type=int, help="выдать изменения после номера (без подтверждения)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--list", action="store_true", help="потребители и их отставание")
+    args = parser.parse_args()
+
+    if args.register:
+        print(f"{args.register}: позиция {register(args.register, args.from_start, args.db)}", file=sys.stderr)
+    if args.unregister:
+        found, removed = unregister(args.unregister, args.db)
+        print(f"{args.unregister}: {'удалён' if found else 'не найден'}, очищено изменений {removed}", file=sys.stderr)
+    if args.list:
+        for name, pos, acked_at, lag in consumers(lambda sql, params=(): db_query(sql, params, path=args.db)):
+            print(f"{name}: позиция {pos}, подтверждено {acked_at}, отстаёт на {lag}", file=sys.stderr)
+    if args.consumer:
+        try:
+            follow(args.consumer, sys.stdout, args.db, args.batch_size, once=not args.follow)
+        except KeyError as e:
+            raise SystemExit(e.args[0])
+        except KeyboardInterrupt:
+            pass
+    elif args.after is not None:
+        after = args.after
+        while True:
+            batch = changes(after, args.batch_size, lambda sql, params=(): db_query(sql, params, path=args.db))
+            sys.stdout.write(to_ndjson(batch))
+            if len(batch) < args.batch_size:
+                break
+            after = batch[-1]["id"]
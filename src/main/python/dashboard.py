@@ -0,0 +1,214 @@
+import time
+import random
+import argparse
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from db import DB_PATH, db_query
+
+# Сколько студентов и строк занятий держит кэш
+DASHBOARD_MAX_ENTRIES = 2000
+DASHBOARD_MAX_ROWS = 200_000
+
+# Версия данных студента: его счётчик, сумма счётчиков его групп (миграция 8) и версия
+# справочников (имена предметов, преподавателей, групп). Счётчики только растут, так что
+# любая запись, влияющая на кабинет студента, меняет кортеж.
+VERSION_QUERY = """
+    SELECT (SELECT version FROM DATA_VERSION WHERE scope = 'student' AND key = :uid),
+           (SELECT TOTAL(v.version)
+            FROM GROUP_STUDENTS gs
+            JOIN DATA_VERSION v ON v.scope = 'group' AND v.key = gs.group_id
+            WHERE gs.user_id = :uid),
+           (SELECT version FROM REF_VERSION WHERE id = 1)
+"""
+
+# Расписание групп студента и все занятия, где у него есть отметка, одним запросом;
+# посещаемость в целом и по предметам считают оконные функции.
+DASHBOARD_QUERY = """
+    WITH my_groups AS (
+        SELECT group_id FROM GROUP_STUDENTS WHERE user_id = :uid
+    ), sessions AS (
+        SELECT s.schedule_id FROM my_groups mg JOIN SCHEDULE s ON s.group_id = mg.group_id
+        UNION
+        SELECT schedule_id FROM ATTENDANCE WHERE user_id = :uid
+    )
+    SELECT s.schedule_id, s.date, s.time, sub.subject_name, u.username, g.group_name, s.room,
+           s.group_id IN (SELECT group_id FROM my_groups) AS in_group,
+           st.name,
+           COUNT(a.status_id) OVER subject_rows, TOTAL(st.attended) OVER subject_rows,
+           COUNT(a.status_id) OVER (), TOTAL(st.attended) OVER ()
+    FROM sessions x
+    JOIN SCHEDULE s ON s.schedule_id = x.schedule_id
+    JOIN SUBJECT sub ON sub.subject_id = s.subject_id
+    JOIN USERS u ON u.user_id = s.teacher_id
+    JOIN "GROUP" g ON g.group_id = s.group_id
+    LEFT JOIN ATTENDANCE a ON a.schedule_id = s.schedule_id AND a.user_id = :uid
+    LEFT JOIN STATUS st ON st.status_id = a.status_id
+    WINDOW subject_rows AS (PARTITION BY s.subject_id)
+    ORDER BY s.date, s.time, s.schedule_id
+"""
+
+SESSION_FIELDS = ("schedule_id", "date", "time", "subject", "teacher", "group", "room")
+
+def _rate(marked, attended):
+    return {"marked": marked, "attended": int(attended),
+            "rate": round(attended / marked, 4) if marked else None}
+
+# -------------------------
+# Cache
+# -------------------------
+class DashboardCache:
+    """
+    LRU-кэш кабинетов студентов: user_id -> (версия данных, кабинет).
+    Запись действительна, пока VERSION_QUERY возвращает ту же версию, поэтому
+    отметка или перенос занятия сразу видны, а повторные открытия кабинета стоят
+    одного короткого запроса по первичным ключам.
+    Память ограничена и числом студентов (max_entries), и суммарным числом строк
+    занятий (max_rows): вытесняются давно не открывавшиеся кабинеты.
+    """
+
+    def __init__(self, max_entries=DASHBOARD_MAX_ENTRIES, max_rows=DASHBOARD_MAX_ROWS):
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.entries = OrderedDict()  # user_id -> (version, dashboard, rows)
+        self.rows = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+
+    def get(self, user_id, version):
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is not None and entry[0] == version:
+                self.entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                self._drop(user_id)
+                self.stale += 1
+            self.misses += 1
+            return None
+
+    def put(self, user_id, version, dashboard, rows):
+        with self.lock:
+            if user_id in self.entries:
+                self._drop(user_id)
+            if rows > self.max_rows:
+                return
+            self.entries[user_id] = (version, dashboard, rows)
+            self.rows += rows
+            while len(self.entries) > self.max_entries or self.rows > self.max_rows:
+                self._drop(next(iter(self.entries)))
+                self.evictions += 1
+
+    def _drop(self, user_id):
+        self.rows -= self.entries.pop(user_id)[2]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.rows = 0
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {"entries": len(self.entries), "rows": self.rows,
+                    "max_entries": self.max_entries, "max_rows": self.max_rows,
+                    "hits": self.hits, "misses": self.misses, "stale": self.stale,
+                    "evictions": self.evictions, "hit_rate": self.hits / total if total else 0.0}
+
+
+dashboards = DashboardCache()
+
+# -------------------------
+# Dashboard
+# -------------------------
+def student_dashboard(user_id, query=db_query, cache=dashboards):
+    """
+    Кабинет студента: расписание, история посещений и процент посещаемости.
+    - query: функция чтения (db_query или ReadPool.query сервера)
+    - cache: DashboardCache или None; результат из кэша общий — не изменять
+    - возвращает dict {user_id, version, groups, schedule, attendance, rate, by_subject}:
+      schedule — занятия групп студента, attendance — занятия с его отметками,
+      rate и by_subject — {marked, attended, rate}
+    Версия читается до кабинета: если отметка придёт между запросами, в кэше окажутся
+    более свежие данные со старой версией, и следующий вызов просто перечитает их.
+    """
+    params = {"uid": user_id}
+    version = tuple(query(VERSION_QUERY, params)[0])
+    if cache is not None:
+        dashboard = cache.get(user_id, version)
+        if dashboard is not None:
+            return dashboard
+
+    schedule, attendance, by_subject, groups = [], [], {}, []
+    rate = _rate(0, 0)
+    rows = query(DASHBOARD_QUERY, params)
+    for row in rows:
+        session = dict(zip(SESSION_FIELDS, row[:7]))
+        session["status"] = row[8]
+        if row[7]:
+            schedule.append(session)
+            if session["group"] not in groups:
+                groups.append(session["group"])
+        if session["status"] is not None:
+            attendance.append(session)
+        by_subject.setdefault(session["subject"], _rate(row[9], row[10]))
+        rate = _rate(row[11], row[12])
+
+    dashboard = {"user_id": user_id, "version": list(version), "groups": groups,
+                 "schedule": schedule, "attendance": attendance, "rate": rate,
+                 "by_subject": [dict(subject=name, **r) for name, r in sorted(by_subject.items()) if r["marked"]]}
+    if cache is not None:
+        cache.put(user_id, version, dashboard, len(rows))
+    return dashboard
+
+# -------------------------
+# CLI: утренняя волна открытий кабинета
+# -------------------------
+def _bench(path, requests, threads, students, marks_every):
+    from attendance import UPSERT_ATTENDANCE, STATUSES
+
+    ids = [uid for uid, in db_query("SELECT user_id FROM USERS WHERE role = 'student' ORDER BY user_id LIMIT ?",
+                                    (students,), path=path)]
+    if not ids:
+        raise SystemExit("В базе нет студентов")
+    marks = db_query("SELECT schedule_id, user_id FROM ATTENDANCE WHERE user_id IN (%s) LIMIT 1000"
+                     % ",".join("?" * len(ids)), ids, path=path)
+    codes = list(STATUSES)
+
+    def query(sql, params=()):
+        return db_query(sql, params, path=path)
+
+    for label, cache in (("no cache", None), ("cached", DashboardCache())):
+        rnd = random.Random(1)
+        picks = [rnd.choice(ids) for _ in range(requests)]
+
+        def open_dashboard(i):
+            if marks_every and marks and i % marks_every == 0:
+                s, u = marks[i % len(marks)]
+                db_query(UPSERT_ATTENDANCE, (s, u, codes[i % len(codes)]), fetch=False, path=path)
+            return len(student_dashboard(picks[i], query=query, cache=cache)["schedule"])
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(open_dashboard, range(requests)))
+        elapsed = time.perf_counter() - started
+        line = f"{label:<8}: {requests / elapsed:8.1f} dashboards/s"
+        if cache is not None:
+            s = cache.stats()
+            line += f", hit rate {s['hit_rate']:.1%}, stale {s['stale']}, {s['entries']} entries / {s['rows']} rows"
+        print(line)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Кабинет студента: замер с кэшем и без")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--students", type=int, default=200, help="сколько разных студентов открывают кабинет")
+    parser.add_argument("--marks-every", type=int, default=20, help="отметка после каждых N открытий (0 — без записи)")
+    args = parser.parse_args()
+    _bench(args.db, args.requests, args.threads, args.students, args.marks_every)
@@ -0,0 +1,122 @@
+import os
+import time
+import random
+import sqlite3
+import argparse
+from datetime import date, timedelta
+
+from migrations import BASE_SCHEMA, migrate
+from auth import hash_password
+
+# Точки масштаба: студенты, группы, преподаватели, предметы, недели, пар в неделю у группы
+SCALES = {
+    "tiny":   dict(students=500,    groups=20,   teachers=15,   subjects=10, weeks=4,  lessons=10),
+    "small":  dict(students=5000,   groups=200,  teachers=120,  subjects=40, weeks=18, lessons=12),
+    "medium": dict(students=20000,  groups=800,  teachers=400,  subjects=80, weeks=36, lessons=12),
+    "large":  dict(students=50000,  groups=2000, teachers=1000, subjects=150, weeks=36, lessons=14),
+}
+
+STATUSES = [("Присутствует", 0.85), ("Опоздал", 0.07), ("Отсутствует", 0.08)]
+TIMES = ["08:30", "10:15", "12:00", "13:45", "15:30", "17:15"]
+ROOMS = [f"Ауд. {n}" for n in range(100, 500, 7)]
+START = date(2025, 9, 1)  # понедельник
+BATCH = 50000
+
+def generate(path, students, groups, teachers, subjects, weeks, lessons, seed=1, start=START, verbose=True):
+    """
+    Создаёт БД с той же схемой, что и main.py, детерминированно по seed.
+    Данные заливаются без индексов и триггеров, затем применяются миграции
+    (индексы, сводки) — так быстрее, чем поддерживать их построчно.
+    Возвращает dict с размерами таблиц и временем генерации.
+    """
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA cache_size = -200000")
+    conn.executescript(BASE_SCHEMA)
+
+    def log(msg):
+        if verbose:
+            print(f"[{time.perf_counter() - started:7.1f}s] {msg}")
+
+    # пользователи: admin, преподаватели, студенты; user_id идут подряд с 1.
+    # Пароли те же, что в main.py; хэш считается один раз на роль (соль общая —
+    # допустимо только для синтетических данных, зато генерация не тратит минуты на scrypt)
+    admin_pw, teacher_pw, student_pw = (hash_password(p) for p in ("admin123", "teachpass", "studpass"))
+    users = [("admin", admin_pw, "admin", "admin@mail.com")]
+    users += [(f"teacher{i}", teacher_pw, "teacher", f"teach{i}@mail.com") for i in range(1, teachers + 1)]
+    users += [(f"student{i}", student_pw, "student", f"stud{i}@mail.com") for i in range(1, students + 1)]
+    conn.executemany("INSERT INTO USERS (username, password, role, email) VALUES (?, ?, ?, ?)", users)
+    teacher_ids = list(range(2, teachers + 2))
+    first_student = teachers + 2
+
+    conn.executemany('INSERT INTO "GROUP" (group_name) VALUES (?)',
+                     ((f"{25 - i // 400}-ГР-{i % 400 + 1}",) for i in range(groups)))
+    conn.executemany("INSERT INTO SUBJECT (subject_name) VALUES (?)",
+                     ((f"Предмет {i}",) for i in range(1, subjects + 1)))
+
+    # студенты равномерно по группам
+    members = {g: [] for g in range(1, groups + 1)}
+    for i in range(students):
+        members[i % groups + 1].append(first_student + i)
+    conn.executemany("INSERT INTO GROUP_STUDENTS (user_id, group_id) VALUES (?, ?)",
+                     ((uid, g) for g, uids in members.items() for uid in uids))
+    conn.commit()
+    log(f"users {len(users)}, groups {groups}, subjects {subjects}")
+
+    # у каждой группы фиксированная недельная сетка пар (предмет, преподаватель, день, время, аудитория)
+    grid = {}
+    for g in range(1, groups + 1):
+        slots = rng.sample([(d, t) for d in range(6) for t in range(len(TIMES))], lessons)
+        grid[g] = [(rng.randint(1, subjects), rng.choice(teacher_ids), d, TIMES[t], rng.choice(ROOMS))
+                   for d, t in sorted(slots)]
+
+    schedule_id = 0
+    attendance = 0
+    weights = [w for _, w in STATUSES]
+    names = [s for s, _ in STATUSES]
+    sched_rows, att_rows = [], []
+    for week in range(weeks):
+        monday = start + timedelta(weeks=week)
+        for g in range(1, groups + 1):
+            for subj, teacher, day, tm, room in grid[g]:
+                schedule_id += 1
+                sched_rows.append((schedule_id, subj, teacher, g, (monday + timedelta(days=day)).isoformat(), tm, room))
+                statuses = rng.choices(names, weights, k=len(members[g]))
+                att_rows.extend(zip([schedule_id] * len(statuses), members[g], statuses))
+        if len(att_rows) >= BATCH or week == weeks - 1:
+            conn.executemany("""INSERT INTO SCHEDULE (schedule_id, subject_id, teacher_id, group_id, date, time, room)
+                                VALUES (?, ?, ?, ?, ?, ?, ?)""", sched_rows)
+            conn.executemany("INSERT INTO ATTENDANCE (schedule_id, user_id, status) VALUES (?, ?, ?)", att_rows)
+            conn.commit()
+            attendance += len(att_rows)
+            sched_rows, att_rows = [], []
+            log(f"week {week + 1}/{weeks}: schedule {schedule_id}, attendance {attendance}")
+
+    log("migrations (indexes, summaries)")
+    migrate(conn, verbose=verbose)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.close()
+    sizes = {"users": len(users), "groups": groups, "subjects": subjects,
+             "schedule": schedule_id, "attendance": attendance,
+             "bytes": os.path.getsize(path),
+             "generate_seconds": round(time.perf_counter() - started, 2)}
+    log(f"done: {sizes}")
+    return sizes
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Генератор синтетической БД посещаемости")
+    parser.add_argument("path", help="куда записать .db")
+    parser.add_argument("--scale", choices=list(SCALES), default="small")
+    parser.add_argument("--seed", type=int, default=1)
+    for name in SCALES["small"]:
+        parser.add_argument(f"--{name}", type=int, help="переопределить параметр масштаба")
+    args = parser.parse_args()
+
+    params = dict(SCALES[args.scale])
+    params.update({k: getattr(args, k) for k in params if getattr(args, k) is not None})
+    generate(args.path, seed=args.seed, **params)
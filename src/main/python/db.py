@@ -0,0 +1,387 @@
+import sqlite3
+import threading
+import time
+import argparse
+from contextlib import contextmanager
+
+from profiler import profiler
+
+DB_PATH = "src/attendance.db"
+
+# PRAGMA, которые применяются один раз при открытии соединения
+PRAGMAS = [
+    ("journal_mode", "WAL"),           # читатели не блокируют писателя
+    ("synchronous", "NORMAL"),         # в режиме WAL безопасно и заметно быстрее FULL
+    ("cache_size", -16000),            # ~16 МБ страничного кэша на соединение
+    ("mmap_size", 64 * 1024 * 1024),   # чтение через mmap вместо read()
+    ("foreign_keys", "ON"),
+]
+
+# -------------------------
+# Connection pool
+# -------------------------
+class ConnectionPool:
+    """
+    Небольшой пул долгоживущих соединений SQLite.
+    - acquire() выдаёт соединение на время одного вызова db_query / db_transaction,
+      release() возвращает его в пул; вложенный acquire того же потока получает то же
+      соединение (reuse, в hit rate не входит) и возвращает его с внешним release();
+    - свободное соединение из пула — hit, новое — miss;
+    - если открыто max_size соединений и свободных нет — поток ждёт (учитывается wait time)
+      не дольше timeout секунд, затем sqlite3.OperationalError;
+    - соединения потоков, которые завершились, не вызвав release(), возвращаются в пул.
+    """
+
+    def __init__(self, path, max_size=4, timeout=5, pragmas=None):
+        self.path = path
+        self.max_size = max_size
+        self.timeout = timeout
+        self.pragmas = PRAGMAS if pragmas is None else pragmas
+        self._cond = threading.Condition()
+        self._idle = []
+        self._owners = {}  # thread -> [connection, глубина вложенных acquire]
+        self._opened = 0
+        self._closed = False
+        self.reuses = 0  # вложенный acquire потока, у которого уже есть соединение
+        self.hits = 0    # соединение взято из свободных
+        self.misses = 0  # открыто новое соединение
+        self.waits = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+        for name, value in self.pragmas:
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def _reclaim_dead(self):
+        for thread in [t for t in self._owners if not t.is_alive()]:
+            self._idle.append(self._owners.pop(thread)[0])
+
+    def acquire(self):
+        """Соединение для текущего потока до парного release()."""
+        thread = threading.current_thread()
+        with self._cond:
+            if self._closed:
+                raise sqlite3.ProgrammingError("Connection pool is closed")
+            owned = self._owners.get(thread)
+            if owned is not None:
+                owned[1] += 1
+                self.reuses += 1
+                return owned[0]
+            self._reclaim_dead()
+            started = None
+            while not self._idle and self._opened >= self.max_size:
+                if started is None:
+                    started = time.perf_counter()
+                    self.waits += 1
+                elif time.perf_counter() - started >= self.timeout:
+                    waited = time.perf_counter() - started
+                    self.wait_time += waited
+                    self.max_wait = max(self.max_wait, waited)
+                    raise sqlite3.OperationalError(
+                        f"no free connection to {self.path} after {self.timeout} s (max_size={self.max_size})")
+                self._cond.wait(0.05)
+                self._reclaim_dead()
+            if started is not None:
+                waited = time.perf_counter() - started
+                self.wait_time += waited
+                self.max_wait = max(self.max_wait, waited)
+            if self._idle:
+                conn = self._idle.pop()
+                self.hits += 1
+            else:
+                self._opened += 1
+                self.misses += 1
+                conn = None
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._opened -= 1
+                    self._cond.notify()
+                raise
+        with self._cond:
+            self._owners[thread] = [conn, 1]
+        return conn
+
+    def release(self):
+        """Возвращает соединение текущего потока в пул (после внешнего из вложенных acquire)."""
+        thread = threading.current_thread()
+        with self._cond:
+            owned = self._owners.get(thread)
+            if owned is None:
+                return
+            owned[1] -= 1
+            if owned[1] == 0:
+                del self._owners[thread]
+                self._idle.append(owned[0])
+                self._cond.notify()
+
+    def discard(self):
+        """Закрывает соединение текущего потока (например, после сбоя)."""
+        thread = threading.current_thread()
+        with self._cond:
+            owned = self._owners.pop(thread, None)
+            conn = owned[0] if owned is not None else None
+            if conn is not None:
+                self._opened -= 1
+                self._cond.notify()
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def close_all(self):
+        with self._cond:
+            conns = self._idle + [owned[0] for owned in self._owners.values()]
+            self._idle = []
+            self._owners = {}
+            self._opened = 0
+            self._closed = True
+            self._cond.notify_all()
+        for conn in conns:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def stats(self):
+        with self._cond:
+            total = self.hits + self.misses
+            return {
+                "path": self.path,
+                "opened": self._opened,
+                "idle": len(self._idle),
+                "in_use": len(self._owners),
+                "reuses": self.reuses,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "waits": self.waits,
+                "wait_time_ms": self.wait_time * 1000,
+                "max_wait_ms": self.max_wait * 1000,
+            }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(path=None, pragmas=None):
+    """
+    Пул соединений для файла БД (по умолчанию — DB_PATH).
+    - pragmas: PRAGMA для соединений, если пул создаётся этим вызовом (по умолчанию PRAGMAS)
+    """
+    path = path or DB_PATH
+    with _pools_lock:
+        pool = _pools.get(path)
+        if pool is None or pool._closed:
+            pool = _pools[path] = ConnectionPool(path, pragmas=pragmas)
+        return pool
+
+def close_pool(path):
+    """Закрывает пул одного файла (например, удаляемой копии БД)."""
+    with _pools_lock:
+        pool = _pools.pop(path, None)
+    if pool is not None:
+        pool.close_all()
+
+def close_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close_all()
+
+def pool_stats():
+    with _pools_lock:
+        return [pool.stats() for pool in _pools.values()]
+
+# -------------------------
+# Interrupting running queries
+# -------------------------
+# Фоновая задача (async_db.Task) отменяется через conn.interrupt() того соединения,
+# на котором она сейчас выполняет запрос: пул любого файла БД или соединение, которое
+# код открыл сам. Поток задачи задаёт register(conn), а код, выполняющий запросы,
+# сообщает о соединении через running_on().
+_interrupt = threading.local()
+
+@contextmanager
+def interrupt_scope(register):
+    """
+    На время блока запросы текущего потока сообщают о своём соединении в register:
+    register(conn) перед запросом, register(прежнее) после; возвращает прежнее соединение.
+    """
+    previous = getattr(_interrupt, "register", None)
+    _interrupt.register = register
+    try:
+        yield
+    finally:
+        _interrupt.register = previous
+
+@contextmanager
+def running_on(conn):
+    """Запрос выполняется на conn — его можно прервать из interrupt_scope текущего потока."""
+    register = getattr(_interrupt, "register", None)
+    if register is None:
+        yield conn
+        return
+    previous = register(conn)
+    try:
+        yield conn
+    finally:
+        register(previous)
+
+# -------------------------
+# DB helper
+# -------------------------
+def db_query(query, params=(), fetch=True, retries=6, base_delay=0.1, path=None):
+    """
+    Выполняет SQL-запрос к SQLite с повторными попытками при 'database is locked'.
+    Соединение берётся из пула и не закрывается после запроса.
+    Время, число строк и повторы попадают в profiler (см. profiler.py).
+    - query: SQL строка
+    - params: кортеж параметров
+    - fetch: если True — вернуть cur.fetchall(), иначе None
+    - retries: количество попыток (включая первую)
+    - base_delay: базовая задержка (сек) для экспоненциального backoff
+    - path: файл БД (по умолчанию DB_PATH)
+    """
+    pool = get_pool(path)
+    last_exc = None
+    started = time.perf_counter()
+    retried, backoff = 0, 0.0
+    for attempt in range(1, retries + 1):
+        conn = pool.acquire()
+        try:
+            with running_on(conn):
+                cur = conn.execute(query, params)
+                rows = cur.fetchall() if fetch else None
+                conn.commit()
+            _record(conn, query, params, started, len(rows) if fetch else max(cur.rowcount, 0), retried, backoff)
+            return rows
+        except sqlite3.OperationalError as e:
+            last_exc = e
+            _rollback(conn)
+            # Повторяем только при блокировке базы данных
+            if not ("locked" in str(e).lower() and attempt < retries):
+                _record(conn, query, params, started, 0, retried, backoff, e)
+                raise
+            delay = base_delay * (2 ** (attempt - 1))  # экспоненциальный backoff
+            retried += 1
+            backoff += delay
+        except sqlite3.DatabaseError as e:
+            _rollback(conn)
+            _record(conn, query, params, started, 0, retried, backoff, e)
+            raise
+        finally:
+            pool.release()
+        time.sleep(delay)  # соединение уже в пуле — ожидание не занимает его
+    # если цикл завершился без return — бросаем последнее исключение
+    if last_exc:
+        raise last_exc
+    return None
+
+def db_transaction(work, retries=6, base_delay=0.1, path=None, label=None):
+    """
+    Выполняет work(conn) в одной транзакции (BEGIN IMMEDIATE ... COMMIT).
+    При 'database is locked' транзакция откатывается и повторяется целиком,
+    с тем же экспоненциальным backoff, что и db_query.
+    - work: функция, получающая соединение; её результат возвращается
+    - label: имя транзакции в profiler (по умолчанию — имя функции work)
+    """
+    pool = get_pool(path)
+    label = label or f"TRANSACTION {getattr(work, '__qualname__', repr(work))}"
+    last_exc = None
+    started = time.perf_counter()
+    retried, backoff = 0, 0.0
+    for attempt in range(1, retries + 1):
+        conn = pool.acquire()
+        try:
+            with running_on(conn):
+                if conn.in_transaction:
+                    conn.commit()
+                conn.execute("BEGIN IMMEDIATE")
+                changes = conn.total_changes
+                result = work(conn)
+                conn.commit()
+            _record(conn, label, None, started, conn.total_changes - changes, retried, backoff, explain=False)
+            return result
+        except sqlite3.OperationalError as e:
+            last_exc = e
+            _rollback(conn)
+            if not ("locked" in str(e).lower() and attempt < retries):
+                _record(conn, label, None, started, 0, retried, backoff, e, explain=False)
+                raise
+            delay = base_delay * (2 ** (attempt - 1))
+            retried += 1
+            backoff += delay
+        except Exception as e:
+            _rollback(conn)
+            _record(conn, label, None, started, 0, retried, backoff, e, explain=False)
+            raise
+        finally:
+            pool.release()
+        time.sleep(delay)
+    if last_exc:
+        raise last_exc
+    return None
+
+def db_executemany(query, seq, retries=6, base_delay=0.1, path=None):
+    """Выполняет query для каждого набора параметров из seq в одной транзакции."""
+    seq = list(seq)
+    return db_transaction(lambda conn: conn.executemany(query, seq).rowcount,
+                          retries=retries, base_delay=base_delay, path=path, label=query)
+
+def _record(conn, query, params, started, rows, retries, backoff, error=None, explain=True):
+    if not profiler.enabled:
+        return
+    seconds = time.perf_counter() - started
+    plan = None
+    if explain and profiler.explain and error is None and profiler.is_slow(seconds):
+        try:
+            plan = [row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + query, params)]
+        except sqlite3.Error:
+            pass
+    profiler.record(query, seconds, rows, retries, backoff, error, params, plan)
+
+def _rollback(conn):
+    try:
+        conn.rollback()
+    except Exception:
+        pass
+
+# -------------------------
+# CLI: сравнение с открытием соединения на каждый запрос
+# -------------------------
+def _bench(path, n):
+    query = "SELECT user_id, username, role FROM USERS WHERE user_id=?"
+
+    started = time.perf_counter()
+    for i in range(n):
+        conn = sqlite3.connect(path, timeout=5)
+        conn.execute("PRAGMA foreign_keys = ON")
+        conn.execute(query, (i % 4 + 1,)).fetchall()
+        conn.commit()
+        conn.close()
+    per_call = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for i in range(n):
+        db_query(query, (i % 4 + 1,), path=path)
+    pooled = time.perf_counter() - started
+
+    print(f"connect per call: {per_call * 1e6 / n:.1f} us/query")
+    print(f"pooled:           {pooled * 1e6 / n:.1f} us/query")
+    for s in pool_stats():
+        print(s)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Пул соединений SQLite")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("-n", type=int, default=2000, help="количество запросов")
+    args = parser.parse_args()
+    _bench(args.db, args.n)
@@ -0,0 +1,466 @@
+import os
+import csv
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import yaml
+
+from db import DB_PATH
+from migrations import migrate
+
+OUT_DIR = "out"
+BATCH_SIZE = 2000
+
+FIELDS = ["attendance_id", "student", "group", "date", "time", "subject", "status"]
+
+EXPORT_SELECT = """
+    SELECT
+        a.attendance_id,
+        u.username,
+        g.group_name,
+        s.date,
+        s.time,
+        sub.subject_name,
+        st.name
+    FROM ATTENDANCE a
+    JOIN STATUS st ON st.status_id = a.status_id
+    JOIN USERS u ON a.user_id = u.user_id
+    JOIN SCHEDULE s ON a.schedule_id = s.schedule_id
+    JOIN SUBJECT sub ON s.subject_id = sub.subject_id
+    JOIN "GROUP" g ON s.group_id = g.group_id
+"""
+EXPORT_QUERY = EXPORT_SELECT + "ORDER BY a.attendance_id"
+
+# Инкрементальный экспорт: новые строки — выше водяного знака по attendance_id,
+# изменённые — по журналу ATTENDANCE_CHANGES (миграция 2)
+NEW_ROWS_QUERY = EXPORT_SELECT + """
+    WHERE a.attendance_id > ?
+    ORDER BY a.attendance_id
+"""
+CHANGED_ROWS_QUERY = EXPORT_SELECT + """
+    WHERE a.attendance_id IN (
+        SELECT attendance_id FROM ATTENDANCE_CHANGES WHERE change_id > ? AND op = 'U'
+    ) AND a.attendance_id <= ?
+    ORDER BY a.attendance_id
+"""
+
+MANIFEST = "manifest.json"
+# доля устаревших версий строк, после которой файлы пересобираются целиком
+COMPACT_RATIO = 0.25
+
+# C-реализация libyaml в разы быстрее чистого Python, если установлена
+YamlDumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+# ============================
+# WRITERS
+# ============================
+# Каждый writer пишет файл по частям: begin() -> write(records)* -> end().
+# records — список dict в порядке FIELDS.
+
+class JsonWriter:
+    ext = "json"
+
+    def begin(self, f):
+        self.f = f
+        self.first = True
+        f.write("[")
+
+    def write(self, records):
+        parts = []
+        for rec in records:
+            body = json.dumps(rec, ensure_ascii=False, indent=2).replace("\n", "\n  ")
+            parts.append(("\n  " if self.first else ",\n  ") + body)
+            self.first = False
+        self.f.write("".join(parts))
+
+    def end(self):
+        self.f.write("]" if self.first else "\n]")
+
+    def resume(self, path):
+        with open(path, "rb+") as fb:
+            if _cut_tail(fb, b"\n]"):
+                self.first = False
+            elif _cut_tail(fb, b"]"):
+                self.first = True
+            else:
+                raise ValueError(f"{path}: не похоже на JSON-массив")
+        self.f = open(path, "a", encoding="utf-8", newline="")
+        return self.f
+
+
+class NdjsonWriter:
+    ext = "ndjson"
+
+    def begin(self, f):
+        self.f = f
+
+    def write(self, records):
+        self.f.write("".join(json.dumps(rec, ensure_ascii=False) + "\n" for rec in records))
+
+    def end(self):
+        pass
+
+    def resume(self, path):
+        self.f = open(path, "a", encoding="utf-8", newline="")
+        return self.f
+
+
+class CsvWriter:
+    ext = "csv"
+
+    def begin(self, f):
+        self.writer = csv.writer(f)
+        self.writer.writerow(FIELDS)
+
+    def write(self, records):
+        self.writer.writerows(rec.values() for rec in records)
+
+    def end(self):
+        pass
+
+    def resume(self, path):
+        f = open(path, "a", encoding="utf-8", newline="")
+        self.writer = csv.writer(f)
+        return f
+
+
+class XmlWriter:
+    ext = "xml"
+
+    def begin(self, f):
+        self.f = f
+        f.write("<?xml version='1.0' encoding='utf-8'?>\n<attendance_records>")
+
+    def write(self, records):
+        parts = []
+        for rec in records:
+            r = ET.Element("record")
+            for k, v in rec.items():
+                ET.SubElement(r, k).text = str(v)
+            parts.append(ET.tostring(r, encoding="unicode"))
+        self.f.write("".join(parts))
+
+    def end(self):
+        self.f.write("</attendance_records>")
+
+    def resume(self, path):
+        with open(path, "rb+") as fb:
+            if not _cut_tail(fb, b"</attendance_records>"):
+                raise ValueError(f"{path}: нет закрывающего </attendance_records>")
+        self.f = open(path, "a", encoding="utf-8", newline="")
+        return self.f
+
+
+class YamlWriter:
+    ext = "yaml"
+
+    def begin(self, f):
+        self.f = f
+        self.empty = True
+
+    def write(self, records):
+        # элементы списка верхнего уровня, склеенные подряд, дают тот же документ,
+        # что и yaml.dump(всего списка)
+        if records:
+            self.empty = False
+            yaml.dump(records, self.f, Dumper=YamlDumper, allow_unicode=True, sort_keys=False)
+
+    def end(self):
+        if self.empty:
+            self.f.write("[]\n")
+
+    def resume(self, path):
+        with open(path, "rb+") as fb:
+            self.empty = _cut_tail(fb, b"[]\n") and fb.tell() == 0
+        self.f = open(path, "a", encoding="utf-8", newline="")
+        return self.f
+
+
+def _cut_tail(fb, tail):
+    """Если файл заканчивается на tail — обрезает его, позиция остаётся в конце."""
+    fb.seek(0, os.SEEK_END)
+    size = fb.tell()
+    if size < len(tail):
+        return False
+    fb.seek(size - len(tail))
+    if fb.read(len(tail)) != tail:
+        return False
+    fb.seek(size - len(tail))
+    fb.truncate()
+    return True
+
+
+WRITERS = {w.ext: w for w in (JsonWriter, NdjsonWriter, CsvWriter, XmlWriter, YamlWriter)}
+DEFAULT_FORMATS = ["json", "yaml", "csv", "xml"]
+
+# ============================
+# EXPORT
+# ============================
+def iter_batches(conn, batch_size=BATCH_SIZE, query=EXPORT_QUERY, params=()):
+    """Читает результат запроса порциями fetchmany() и отдаёт списки dict."""
+    cur = conn.execute(query, params)
+    while True:
+        rows = cur.fetchmany(batch_size)
+        if not rows:
+            break
+        yield [dict(zip(FIELDS, row)) for row in rows]
+
+def _write_batches(batches, writers, timings):
+    """Прогоняет порции записей через все writers; возвращает (строк, время чтения)."""
+    rows = 0
+    read_time = 0.0
+    started = time.perf_counter()
+    for records in batches:
+        read_time += time.perf_counter() - started
+        rows += len(records)
+        for fmt, writer in writers.items():
+            t = time.perf_counter()
+            writer.write(records)
+            timings[fmt] += time.perf_counter() - t
+        started = time.perf_counter()
+    read_time += time.perf_counter() - started
+    return rows, read_time
+
+def export(conn, out_dir=OUT_DIR, formats=None, batch_size=BATCH_SIZE):
+    """
+    Экспорт всех форматов за один проход по курсору.
+    - formats: список расширений из WRITERS (по умолчанию json, yaml, csv, xml)
+    - возвращает dict {format: {"rows", "seconds", "rows_per_sec"}}; время чтения — под ключом "read"
+    """
+    formats = formats or DEFAULT_FORMATS
+    os.makedirs(out_dir, exist_ok=True)
+    # файлы перезаписываются целиком — старый водяной знак больше не действителен
+    _remove(os.path.join(out_dir, MANIFEST))
+    writers, files = {}, {}
+    timings = {fmt: 0.0 for fmt in formats}
+    try:
+        for fmt in formats:
+            path = os.path.join(out_dir, f"attendance.{fmt}")
+            files[fmt] = open(path + ".tmp", "w", encoding="utf-8", newline="")
+            writers[fmt] = WRITERS[fmt]()
+            writers[fmt].begin(files[fmt])
+
+        rows, read_time = _write_batches(iter_batches(conn, batch_size), writers, timings)
+
+        for fmt in formats:
+            t = time.perf_counter()
+            writers[fmt].end()
+            files[fmt].close()
+            os.replace(files[fmt].name, files[fmt].name[:-len(".tmp")])
+            timings[fmt] += time.perf_counter() - t
+    finally:
+        for f in files.values():
+            if not f.closed:
+                f.close()
+                os.remove(f.name)
+
+    report = {fmt: _rate(rows, seconds) for fmt, seconds in timings.items()}
+    report["read"] = _rate(rows, read_time)
+    return report
+
+# ============================
+# INCREMENTAL EXPORT
+# ============================
+# Новые и изменённые строки дописываются в конец файлов (у JSON/XML/YAML
+# предварительно срезается закрывающая часть). Изменённая строка попадает в файл
+# повторно, так что после инкрементального запуска attendance_id в файле уже не
+# уникален: читатель должен брать последнюю запись с тем же attendance_id.
+# Одна запись на attendance_id — только после полного экспорта (export(), full=True).
+# manifest.json хранит водяной знак, число записей и контрольные суммы.
+# Журнал ATTENDANCE_CHANGES до водяного знака после записи манифеста удаляется —
+# он рассчитан на один каталог экспорта.
+
+# последний выданный change_id: в отличие от MAX(change_id), не уменьшается при очистке журнала
+CHANGE_SEQUENCE_QUERY = \
+    "SELECT COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'ATTENDANCE_CHANGES'), 0)"
+
+def load_manifest(out_dir=OUT_DIR):
+    try:
+        with open(os.path.join(out_dir, MANIFEST), encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def _full_export_reason(conn, manifest, out_dir, formats):
+    """Причина, по которой нельзя дописать файлы, или None."""
+    if manifest is None:
+        return "no manifest"
+    if sorted(manifest["formats"]) != sorted(formats):
+        return "formats changed"
+    for fmt, info in manifest["formats"].items():
+        path = os.path.join(out_dir, info["file"])
+        if not os.path.exists(path) or os.path.getsize(path) != info["bytes"]:
+            return f"{info['file']} changed outside of export"
+    mark = manifest["watermark"]
+    last_change = conn.execute(CHANGE_SEQUENCE_QUERY).fetchone()[0]
+    if last_change < mark["change_id"]:
+        return "change log was reset"
+    deleted = conn.execute("SELECT 1 FROM ATTENDANCE_CHANGES WHERE change_id > ? AND op = 'D' LIMIT 1",
+                           (mark["change_id"],)).fetchone()
+    if deleted:
+        return "rows were deleted"
+    if manifest["rows"] and manifest["superseded"] / manifest["rows"] > COMPACT_RATIO:
+        return "compaction"
+    return None
+
+def export_incremental(conn, out_dir=OUT_DIR, formats=None, batch_size=BATCH_SIZE, full=False):
+    """
+    Дописывает в файлы экспорта только строки, появившиеся или изменённые после прошлого запуска.
+    Если дописать нельзя (нет манифеста, файлы изменены, были удаления, много устаревших версий)
+    или full=True — делает полный экспорт. После дописывания изменённые строки встречаются
+    в файлах несколько раз, актуальна последняя запись; после полного — по одной.
+    Обработанная часть журнала ATTENDANCE_CHANGES удаляется.
+    - возвращает (manifest, report), report — как у export()
+    """
+    formats = formats or DEFAULT_FORMATS
+    os.makedirs(out_dir, exist_ok=True)
+    if conn.in_transaction:
+        conn.commit()
+    # весь экспорт читает один снимок БД
+    conn.execute("BEGIN")
+    try:
+        last_id = conn.execute("SELECT COALESCE(MAX(attendance_id), 0) FROM ATTENDANCE").fetchone()[0]
+        last_change = conn.execute(CHANGE_SEQUENCE_QUERY).fetchone()[0]
+        manifest = load_manifest(out_dir)
+        reason = "requested" if full else _full_export_reason(conn, manifest, out_dir, formats)
+
+        if reason:
+            report = export(conn, out_dir, formats, batch_size)
+            rows, superseded = report["read"]["rows"], 0
+        else:
+            report, new_rows, changed = _append(conn, manifest, out_dir, formats, batch_size)
+            rows = manifest["rows"] + new_rows + changed
+            superseded = manifest["superseded"] + changed
+    finally:
+        conn.rollback()
+
+    manifest = {
+        "mode": "full" if reason else "incremental",
+        "reason": reason,
+        "updated_at": datetime.now().isoformat(timespec="seconds"),
+        "watermark": {"attendance_id": last_id, "change_id": last_change},
+        "rows": rows,
+        "superseded": superseded,
+        "formats": {},
+    }
+    for fmt in formats:
+        name = f"attendance.{fmt}"
+        path = os.path.join(out_dir, name)
+        manifest["formats"][fmt] = {"file": name, "bytes": os.path.getsize(path), "sha256": _sha256(path)}
+    tmp = os.path.join(out_dir, MANIFEST + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, os.path.join(out_dir, MANIFEST))
+    # изменения до водяного знака уже в файлах; сам счётчик остаётся в sqlite_sequence
+    conn.execute("DELETE FROM ATTENDANCE_CHANGES WHERE change_id <= ?", (last_change,))
+    conn.commit()
+    return manifest, report
+
+def _append(conn, manifest, out_dir, formats, batch_size):
+    mark = manifest["watermark"]
+    writers, files = {}, {}
+    timings = {fmt: 0.0 for fmt in formats}
+    try:
+        for fmt in formats:
+            writers[fmt] = WRITERS[fmt]()
+            files[fmt] = writers[fmt].resume(os.path.join(out_dir, f"attendance.{fmt}"))
+
+        new_rows, read_new = _write_batches(
+            iter_batches(conn, batch_size, NEW_ROWS_QUERY, (mark["attendance_id"],)), writers, timings)
+        changed, read_changed = _write_batches(
+            iter_batches(conn, batch_size, CHANGED_ROWS_QUERY, (mark["change_id"], mark["attendance_id"])),
+            writers, timings)
+
+        for fmt in formats:
+            t = time.perf_counter()
+            writers[fmt].end()
+            timings[fmt] += time.perf_counter() - t
+    finally:
+        for f in files.values():
+            f.close()
+
+    report = {fmt: _rate(new_rows + changed, seconds) for fmt, seconds in timings.items()}
+    report["read"] = _rate(new_rows + changed, read_new + read_changed)
+    return report, new_rows, changed
+
+def _sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def _export_one(db_path, out_dir, fmt, batch_size):
+    conn = sqlite3.connect(db_path)
+    try:
+        started = time.perf_counter()
+        report = export(conn, out_dir, [fmt], batch_size)
+        report[fmt] = _rate(report[fmt]["rows"], time.perf_counter() - started)
+        return fmt, report[fmt]
+    finally:
+        conn.close()
+
+def export_parallel(db_path=DB_PATH, out_dir=OUT_DIR, formats=None, batch_size=BATCH_SIZE, workers=None):
+    """
+    Экспорт каждого формата в отдельном процессе (каждый читает БД сам).
+    Время в отчёте — полное время процесса, включая чтение.
+    """
+    formats = formats or DEFAULT_FORMATS
+    with ProcessPoolExecutor(max_workers=workers or len(formats)) as pool:
+        jobs = [pool.submit(_export_one, db_path, out_dir, fmt, batch_size) for fmt in formats]
+        return dict(job.result() for job in jobs)
+
+def _rate(rows, seconds):
+    return {"rows": rows, "seconds": round(seconds, 4),
+            "rows_per_sec": round(rows / seconds) if seconds > 0 else None}
+
+def print_report(report):
+    for fmt, r in report.items():
+        print(f"{fmt:>8}: {r['rows']} rows, {r['seconds']:.3f} s, {r['rows_per_sec']} rows/s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Потоковый экспорт посещаемости")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--out", default=OUT_DIR)
+    parser.add_argument("--formats", default=",".join(DEFAULT_FORMATS),
+                        help="через запятую: " + ",".join(WRITERS))
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--parallel", action="store_true", help="каждый формат в своём процессе")
+    parser.add_argument("--incremental", action="store_true",
+                        help="дописать только новые и изменённые строки (см. manifest.json); "
+                             "изменённые строки повторяются, актуальна последняя")
+    parser.add_argument("--full", action="store_true", help="с --incremental: пересобрать файлы целиком")
+    args = parser.parse_args()
+
+    formats = [f.strip() for f in args.formats.split(",") if f.strip()]
+    unknown = [f for f in formats if f not in WRITERS]
+    if unknown:
+        raise SystemExit(f"Неизвестные форматы: {', '.join(unknown)}")
+    if not os.path.exists(args.db):
+        raise SystemExit(f"База данных не найдена: {args.db}")
+
+    if args.incremental:
+        conn = sqlite3.connect(args.db)
+        migrate(conn, verbose=False)
+        manifest, report = export_incremental(conn, args.out, formats, args.batch_size, args.full)
+        conn.close()
+        print(f"mode: {manifest['mode']}" + (f" ({manifest['reason']})" if manifest["reason"] else ""))
+        print_report(report)
+    elif args.parallel:
+        print_report(export_parallel(args.db, args.out, formats, args.batch_size))
+    else:
+        conn = sqlite3.connect(args.db)
+        print_report(export(conn, args.out, formats, args.batch_size))
+        conn.close()
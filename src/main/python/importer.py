@@ -0,0 +1,290 @@
+import os
+import csv
+import json
+import time
+import sqlite3
+import argparse
+from datetime import datetime
+
+from db import DB_PATH, PRAGMAS
+from migrations import migrate
+from attendance import UPSERT_ATTENDANCE, status_id
+from auth import hash_many, is_hashed
+
+CHUNK_SIZE = 5000
+ROLES = ("admin", "teacher", "student")
+
+# Порядок важен: группы и предметы нужны расписанию, расписание — посещаемости
+ENTITIES = ["users", "groups", "subjects", "group_students", "schedule", "attendance"]
+
+# ============================
+# READERS
+# ============================
+def read_records(path, fmt=None):
+    """
+    Читает записи из CSV (с заголовком), JSON (массив объектов) или NDJSON.
+    Формат определяется по расширению, если не указан.
+    Возвращает генератор dict.
+    """
+    fmt = fmt or os.path.splitext(path)[1].lstrip(".").lower()
+    if fmt == "csv":
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            yield from csv.DictReader(f)
+    elif fmt == "json":
+        with open(path, encoding="utf-8") as f:
+            yield from json.load(f)
+    elif fmt in ("ndjson", "jsonl"):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        raise ValueError(f"Неизвестный формат файла: {path}")
+
+def _when(date, time_, strict=True):
+    """
+    Дата и время занятия в каноническом виде YYYY-MM-DD / HH:MM ("9:00" -> "09:00"),
+    чтобы сравнение строк и SCHEDULE.starts_at шли в хронологическом порядке.
+    - strict: ValueError, если не разбираются; иначе значения возвращаются как есть
+    """
+    try:
+        return (datetime.strptime(str(date).strip(), "%Y-%m-%d").strftime("%Y-%m-%d"),
+                datetime.strptime(str(time_).strip(), "%H:%M").strftime("%H:%M"))
+    except ValueError:
+        if strict:
+            raise
+        return date, time_
+
+# ============================
+# LOOKUP MAPS
+# ============================
+class Lookups:
+    """Имена -> id, загруженные одним запросом на таблицу вместо SELECT на каждую строку."""
+
+    def __init__(self, conn):
+        self.users = {name: (uid, role) for uid, name, role in
+                      conn.execute("SELECT user_id, username, role FROM USERS")}
+        self.groups = {name: gid for gid, name in
+                       conn.execute('SELECT group_id, group_name FROM "GROUP" ORDER BY group_id DESC')}
+        self.subjects = {name: sid for sid, name in
+                         conn.execute("SELECT subject_id, subject_name FROM SUBJECT ORDER BY subject_id DESC")}
+        self.memberships = set(conn.execute("SELECT user_id, group_id FROM GROUP_STUDENTS"))
+        self.schedule = {(gid, sid, *_when(date, tm, strict=False)): schedule_id for schedule_id, gid, sid, date, tm in
+                         conn.execute("SELECT schedule_id, group_id, subject_id, date, time FROM SCHEDULE")}
+        self.schedule_ids = set(self.schedule.values())
+
+    def user_id(self, username, role=None):
+        uid, urole = self.users.get(username, (None, None))
+        if uid is None:
+            raise ValueError(f"неизвестный пользователь '{username}'")
+        if role and urole != role:
+            raise ValueError(f"пользователь '{username}' не {role}")
+        return uid
+
+    def group_id(self, name):
+        if name not in self.groups:
+            raise ValueError(f"неизвестная группа '{name}'")
+        return self.groups[name]
+
+    def subject_id(self, name):
+        if name not in self.subjects:
+            raise ValueError(f"неизвестный предмет '{name}'")
+        return self.subjects[name]
+
+# ============================
+# ROW CONVERTERS
+# ============================
+# Каждый конвертер превращает запись в кортеж параметров для INSERT
+# или бросает ValueError с причиной отказа. Успешные ключи сразу
+# добавляются в lookups, чтобы ловить дубликаты внутри файла.
+
+def _field(rec, name, required=True):
+    value = rec.get(name)
+    value = "" if value is None else str(value).strip()
+    if required and not value:
+        raise ValueError(f"пустое поле '{name}'")
+    return value
+
+def _user(rec, lk):
+    username = _field(rec, "username")
+    role = _field(rec, "role")
+    if role not in ROLES:
+        raise ValueError(f"роль должна быть {'/'.join(ROLES)}")
+    if username in lk.users:
+        raise ValueError(f"пользователь '{username}' уже существует")
+    lk.users[username] = (None, role)
+    return (username, _field(rec, "password"), role, _field(rec, "email", required=False))
+
+def _group(rec, lk):
+    name = _field(rec, "group_name")
+    if name in lk.groups:
+        raise ValueError(f"группа '{name}' уже существует")
+    lk.groups[name] = None
+    return (name,)
+
+def _subject(rec, lk):
+    name = _field(rec, "subject_name")
+    if name in lk.subjects:
+        raise ValueError(f"предмет '{name}' уже существует")
+    lk.subjects[name] = None
+    return (name,)
+
+def _group_student(rec, lk):
+    key = (lk.user_id(_field(rec, "username"), "student"), lk.group_id(_field(rec, "group_name")))
+    if key in lk.memberships:
+        raise ValueError("студент уже в группе")
+    lk.memberships.add(key)
+    return key
+
+def _schedule(rec, lk):
+    gid = lk.group_id(_field(rec, "group_name"))
+    sid = lk.subject_id(_field(rec, "subject_name"))
+    tid = lk.user_id(_field(rec, "teacher"), "teacher")
+    date, time_ = _when(_field(rec, "date"), _field(rec, "time"))
+    key = (gid, sid, date, time_)
+    if key in lk.schedule:
+        raise ValueError("такое занятие уже есть")
+    lk.schedule[key] = None
+    return (sid, tid, gid, date, time_, _field(rec, "room", required=False))
+
+def _attendance(rec, lk):
+    if _field(rec, "schedule_id", required=False):
+        schedule_id = int(_field(rec, "schedule_id"))
+        if schedule_id not in lk.schedule_ids:
+            raise ValueError(f"нет занятия #{schedule_id}")
+    else:
+        key = (lk.group_id(_field(rec, "group_name")), lk.subject_id(_field(rec, "subject_name")),
+               *_when(_field(rec, "date"), _field(rec, "time")))
+        schedule_id = lk.schedule.get(key)
+        if schedule_id is None:
+            raise ValueError("занятие не найдено")
+    # статус — название (регистр не важен) или код из справочника STATUS
+    status = _field(rec, "status")
+    return (schedule_id, lk.user_id(_field(rec, "username"), "student"),
+            status_id(int(status) if status.isdigit() else status))
+
+def _hash_passwords(chunk):
+    # scrypt — самая дорогая часть импорта пользователей; хэшируем пачку параллельно.
+    # Уже захэшированные пароли (выгрузка из другой базы) переносятся как есть.
+    plain = [i for i, (_, params) in enumerate(chunk) if not is_hashed(params[1])]
+    hashes = hash_many([chunk[i][1][1] for i in plain])
+    chunk = list(chunk)
+    for i, h in zip(plain, hashes):
+        n, params = chunk[i]
+        chunk[i] = (n, (params[0], h) + params[2:])
+    return chunk
+
+# подготовка пачки перед записью (после проверки всех записей пачки)
+PREPARE = {"users": _hash_passwords}
+
+IMPORTERS = {
+    "users": (_user, "INSERT INTO USERS (username, password, role, email) VALUES (?, ?, ?, ?)"),
+    "groups": (_group, 'INSERT INTO "GROUP" (group_name) VALUES (?)'),
+    "subjects": (_subject, "INSERT INTO SUBJECT (subject_name) VALUES (?)"),
+    "group_students": (_group_student, "INSERT INTO GROUP_STUDENTS (user_id, group_id) VALUES (?, ?)"),
+    "schedule": (_schedule, """INSERT INTO SCHEDULE (subject_id, teacher_id, group_id, date, time, room)
+                               VALUES (?, ?, ?, ?, ?, ?)"""),
+    "attendance": (_attendance, UPSERT_ATTENDANCE),
+}
+
+# ============================
+# IMPORT
+# ============================
+def import_records(conn, entity, records, chunk_size=CHUNK_SIZE):
+    """
+    Загружает записи одной сущности крупными транзакциями через executemany.
+    - entity: одна из ENTITIES
+    - records: итерируемое dict (см. read_records)
+    - возвращает отчёт {"entity", "read", "inserted", "rejected", "seconds", "rows_per_sec", "rejects"},
+      rejects — список (номер записи, причина)
+    """
+    convert, sql = IMPORTERS[entity]
+    prepare = PREPARE.get(entity, lambda chunk: chunk)
+    started = time.perf_counter()
+    lookups = Lookups(conn)
+    report = {"entity": entity, "read": 0, "inserted": 0, "rejected": 0, "rejects": []}
+
+    chunk = []
+    for n, rec in enumerate(records, start=1):
+        report["read"] += 1
+        try:
+            chunk.append((n, convert(rec, lookups)))
+        except (ValueError, TypeError, AttributeError) as e:
+            report["rejects"].append((n, str(e)))
+        if len(chunk) >= chunk_size:
+            _flush(conn, sql, prepare(chunk), report)
+            chunk = []
+    if chunk:
+        _flush(conn, sql, prepare(chunk), report)
+
+    report["rejected"] = len(report["rejects"])
+    seconds = time.perf_counter() - started
+    report["seconds"] = round(seconds, 4)
+    report["rows_per_sec"] = round(report["read"] / seconds) if seconds > 0 else None
+    return report
+
+def _flush(conn, sql, chunk, report):
+    try:
+        with conn:
+            conn.executemany(sql, [params for _, params in chunk])
+        report["inserted"] += len(chunk)
+        return
+    except sqlite3.IntegrityError:
+        pass
+    # в пачке есть строка, нарушающая ограничения БД — повторяем построчно, чтобы найти её
+    with conn:
+        for n, params in chunk:
+            try:
+                conn.execute(sql, params)
+                report["inserted"] += 1
+            except sqlite3.IntegrityError as e:
+                report["rejects"].append((n, str(e)))
+
+def open_db(path=DB_PATH):
+    conn = sqlite3.connect(path, timeout=5)
+    for name, value in PRAGMAS:
+        conn.execute(f"PRAGMA {name} = {value}")
+    migrate(conn, verbose=False)
+    return conn
+
+def print_report(report):
+    print(f"{report['entity']:>15}: read {report['read']}, inserted {report['inserted']}, "
+          f"rejected {report['rejected']}, {report['seconds']:.3f} s, {report['rows_per_sec']} rows/s")
+    for n, reason in report["rejects"][:20]:
+        print(f"{'':>17}#{n}: {reason}")
+    if report["rejected"] > 20:
+        print(f"{'':>17}... ещё {report['rejected'] - 20}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Массовый импорт из CSV / JSON / NDJSON",
+        epilog="Поля: users(username,password,role,email) groups(group_name) subjects(subject_name) "
+               "group_students(username,group_name) schedule(group_name,subject_name,teacher,date,time,room) "
+               "attendance(schedule_id | group_name,subject_name,date,time; username,status)")
+    parser.add_argument("--db", default=DB_PATH)
+    for entity in ENTITIES:
+        parser.add_argument(f"--{entity.replace('_', '-')}", metavar="FILE", help=f"файл с {entity}")
+    parser.add_argument("--format", choices=["csv", "json", "ndjson"], help="формат (по умолчанию — по расширению)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--rejects", metavar="FILE", help="записать отклонённые строки в NDJSON")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        raise SystemExit(f"База данных не найдена: {args.db}")
+    conn = open_db(args.db)
+    rejects_out = open(args.rejects, "w", encoding="utf-8") if args.rejects else None
+    try:
+        for entity in ENTITIES:
+            path = getattr(args, entity)
+            if not path:
+                continue
+            report = import_records(conn, entity, read_records(path, args.format), args.chunk_size)
+            print_report(report)
+            if rejects_out:
+                for n, reason in report["rejects"]:
+                    rejects_out.write(json.dumps({"entity": entity, "file": path, "record": n, "reason": reason},
+                                                 ensure_ascii=False) + "\n")
+    finally:
+        conn.close()
+        if rejects_out:
+            rejects_out.close()
@@ -0,0 +1,141 @@
+import json
+import time
+import random
+import asyncio
+import argparse
+
+from server import HOST, PORT
+from attendance import STATUSES
+
+# -------------------------
+# HTTP client (keep-alive)
+# -------------------------
+class Client:
+    """Одно keep-alive соединение с сервером API."""
+
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.reader = self.writer = None
+        self.token = None
+
+    async def request(self, method, path, payload=None):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        head = f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Length: {len(body)}\r\n"
+        if self.token:
+            head += f"Authorization: Bearer {self.token}\r\n"
+        self.writer.write(head.encode("latin-1") + b"\r\n" + body)
+        await self.writer.drain()
+
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            if name.lower() == "content-length":
+                length = int(value)
+        data = json.loads(await self.reader.readexactly(length)) if length else None
+        return status, data
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            await self.writer.wait_closed()
+
+# -------------------------
+# Load generator
+# -------------------------
+class Stats:
+    def __init__(self):
+        self.latency = {}  # операция -> список секунд
+        self.errors = {}
+
+    def add(self, op, seconds, ok):
+        self.latency.setdefault(op, []).append(seconds)
+        if not ok:
+            self.errors[op] = self.errors.get(op, 0) + 1
+
+    def report(self, elapsed):
+        result = {}
+        for op, samples in sorted(self.latency.items()):
+            ordered = sorted(samples)
+            pick = lambda q: round(ordered[min(len(ordered) - 1, int(len(ordered) * q))] * 1000, 2)
+            result[op] = {"count": len(ordered), "errors": self.errors.get(op, 0),
+                          "per_sec": round(len(ordered) / elapsed, 1),
+                          "p50_ms": pick(0.5), "p95_ms": pick(0.95), "p99_ms": pick(0.99)}
+        return result
+
+async def timed(stats, op, coro):
+    started = time.perf_counter()
+    status, data = await coro
+    stats.add(op, time.perf_counter() - started, status == 200)
+    return status, data
+
+async def teacher_session(host, port, username, password, deadline, write_ratio, stats, rng):
+    """
+    Один «преподаватель»: вход, своё расписание, затем до deadline —
+    отметки по случайным занятиям (доля write_ratio) или чтение отчётов.
+    """
+    client = Client(host, port)
+    try:
+        status, data = await timed(stats, "login", client.request(
+            "POST", "/login", {"username": username, "password": password, "role": "teacher"}))
+        if status != 200:
+            raise SystemExit(f"Не удалось войти как {username}: {data}")
+        client.token = data["token"]
+        teacher_id = data["user"]["id"]
+        _, schedule = await timed(stats, "schedule", client.request("GET", f"/teachers/{teacher_id}/schedule"))
+        if not schedule:
+            return
+        students = {}
+        while time.perf_counter() < deadline:
+            lesson = rng.choice(schedule)
+            if rng.random() < write_ratio:
+                sid = lesson["schedule_id"]
+                if sid not in students:
+                    _, rows = await timed(stats, "students", client.request("GET", f"/schedule/{sid}/students"))
+                    students[sid] = [r["user_id"] for r in rows]
+                if not students[sid]:
+                    continue
+                marks = {uid: rng.choice(list(STATUSES)) for uid in rng.sample(students[sid], min(3, len(students[sid])))}
+                await timed(stats, "mark", client.request("POST", f"/schedule/{sid}/attendance", {"marks": marks}))
+            elif rng.random() < 0.5:
+                await timed(stats, "report", client.request("GET", "/reports/attendance?limit=50"))
+            else:
+                await timed(stats, "stats", client.request("GET", "/reports/stats?by=group"))
+    finally:
+        await client.close()
+
+async def run(host, port, clients, teachers, password, seconds, write_ratio, seed=1):
+    stats = Stats()
+    deadline = time.perf_counter() + seconds
+    started = time.perf_counter()
+    await asyncio.gather(*(teacher_session(host, port, f"teacher{i % teachers + 1}", password, deadline,
+                                           write_ratio, stats, random.Random(seed + i))
+                           for i in range(clients)))
+    elapsed = time.perf_counter() - started
+    health = Client(host, port)
+    try:
+        _, server = await health.request("GET", "/health")
+    finally:
+        await health.close()
+    return {"clients": clients, "seconds": round(elapsed, 2), "write_ratio": write_ratio,
+            "ops": stats.report(elapsed), "server": server}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Нагрузочный тест HTTP API посещаемости")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--clients", type=int, default=20, help="одновременных соединений")
+    parser.add_argument("--teachers", type=int, default=1, help="логины teacher1..teacherN")
+    parser.add_argument("--password", default="teachpass")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--write-ratio", type=float, default=0.5, help="доля запросов-отметок")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    result = asyncio.run(run(args.host, args.port, args.clients, args.teachers, args.password,
+                             args.seconds, args.write_ratio, args.seed))
+    print(json.dumps(result, ensure_ascii=False, indent=2))
@@ -0,0 +1,561 @@
+import os
+import re
+import ast
+import sqlite3
+import argparse
+
+from db import DB_PATH
+from auth import hash_many, is_hashed
+from attendance import STATUSES, ATTENDED
+
+# модули, чьи запросы попадают в отчёт EXPLAIN и в bench.py
+APP_SOURCES = ["app.py", "attendance.py", "reports.py", "dashboard.py", "timetable.py",
+               "analytics.py", "refcache.py"]
+# функции и методы, которым SQL передаётся строковым литералом: имя -> номер аргумента
+SQL_CALLS = {"db_query": 0, "load_tree": 1, "query": 0}
+_SQL = re.compile(r"^\s*(SELECT|WITH|INSERT|UPDATE|DELETE)\b", re.I)
+
+# ============================
+# СХЕМА (версия 0)
+# ============================
+# Исходные таблицы; всё остальное (индексы, журналы, сводки) добавляют миграции.
+BASE_SCHEMA = """
+    DROP TABLE IF EXISTS ATTENDANCE;
+    DROP TABLE IF EXISTS SCHEDULE;
+    DROP TABLE IF EXISTS GROUP_STUDENTS;
+    DROP TABLE IF EXISTS SUBJECT;
+    DROP TABLE IF EXISTS "GROUP";
+    DROP TABLE IF EXISTS USERS;
+
+    CREATE TABLE USERS (
+        user_id     INTEGER PRIMARY KEY AUTOINCREMENT,
+        username    TEXT NOT NULL UNIQUE,
+        password    TEXT NOT NULL,
+        role        TEXT CHECK(role IN ('admin', 'teacher', 'student')) NOT NULL,
+        email       TEXT
+    );
+
+    CREATE TABLE "GROUP" (
+        group_id    INTEGER PRIMARY KEY AUTOINCREMENT,
+        group_name  TEXT NOT NULL
+    );
+
+    CREATE TABLE GROUP_STUDENTS (
+        id          INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id     INTEGER NOT NULL,
+        group_id    INTEGER NOT NULL,
+        FOREIGN KEY (user_id) REFERENCES USERS(user_id),
+        FOREIGN KEY (group_id) REFERENCES "GROUP"(group_id)
+    );
+
+    CREATE TABLE SUBJECT (
+        subject_id    INTEGER PRIMARY KEY AUTOINCREMENT,
+        subject_name  TEXT NOT NULL
+    );
+
+    CREATE TABLE SCHEDULE (
+        schedule_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        subject_id  INTEGER NOT NULL,
+        teacher_id  INTEGER NOT NULL,
+        group_id    INTEGER NOT NULL,
+        date        TEXT NOT NULL,
+        time        TEXT NOT NULL,
+        room        TEXT,
+        FOREIGN KEY (subject_id) REFERENCES SUBJECT(subject_id),
+        FOREIGN KEY (teacher_id) REFERENCES USERS(user_id),
+        FOREIGN KEY (group_id) REFERENCES "GROUP"(group_id)
+    );
+
+    CREATE TABLE ATTENDANCE (
+        attendance_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        schedule_id   INTEGER NOT NULL,
+        user_id       INTEGER NOT NULL,
+        status        TEXT NOT NULL,
+        FOREIGN KEY (schedule_id) REFERENCES SCHEDULE(schedule_id),
+        FOREIGN KEY (user_id) REFERENCES USERS(user_id)
+    );
+"""
+
+# ============================
+# МИГРАЦИИ
+# ============================
+# Версия схемы хранится в PRAGMA user_version.
+# Каждая миграция — (версия, описание, SQL-скрипт или функция f(conn)).
+
+def execute_script(conn, script):
+    """
+    Выполняет несколько SQL-операторов внутри текущей транзакции.
+    (conn.executescript() сначала делает COMMIT, поэтому для миграций не подходит.)
+    """
+    buf = ""
+    for line in script.splitlines(keepends=True):
+        buf += line
+        if sqlite3.complete_statement(buf):
+            conn.execute(buf)
+            buf = ""
+    if buf.strip():
+        conn.execute(buf)
+
+def _dedupe(conn, table, key_cols, id_col):
+    """Удаляет дубликаты по key_cols, оставляя строку с максимальным id_col."""
+    keys = ", ".join(key_cols)
+    conn.execute(f"""
+        DELETE FROM {table}
+        WHERE {id_col} NOT IN (SELECT MAX({id_col}) FROM {table} GROUP BY {keys})
+    """)
+
+def _m1_indexes(conn):
+    # уникальность нельзя включить, пока в таблицах есть дубликаты
+    _dedupe(conn, "ATTENDANCE", ["schedule_id", "user_id"], "attendance_id")
+    _dedupe(conn, "GROUP_STUDENTS", ["user_id", "group_id"], "id")
+    execute_script(conn, """
+    -- UNIQUE(schedule_id, user_id): поиск отметки и цель для ON CONFLICT
+    CREATE UNIQUE INDEX IF NOT EXISTS ux_attendance_schedule_user
+        ON ATTENDANCE(schedule_id, user_id);
+    -- UNIQUE(user_id, group_id): группа студента
+    CREATE UNIQUE INDEX IF NOT EXISTS ux_group_students_user_group
+        ON GROUP_STUDENTS(user_id, group_id);
+    -- студенты группы (окно отметки)
+    CREATE INDEX IF NOT EXISTS ix_group_students_group
+        ON GROUP_STUDENTS(group_id, user_id);
+    -- посещаемость студента, покрывающий
+    CREATE INDEX IF NOT EXISTS ix_attendance_user
+        ON ATTENDANCE(user_id, schedule_id, status);
+    -- расписание преподавателя / группы в порядке вывода
+    CREATE INDEX IF NOT EXISTS ix_schedule_teacher
+        ON SCHEDULE(teacher_id, date, time);
+    CREATE INDEX IF NOT EXISTS ix_schedule_group
+        ON SCHEDULE(group_id, date, time);
+    CREATE INDEX IF NOT EXISTS ix_schedule_date
+        ON SCHEDULE(date, time);
+    -- поиск по имени в диалогах
+    CREATE INDEX IF NOT EXISTS ix_users_role
+        ON USERS(role, username);
+    CREATE INDEX IF NOT EXISTS ix_group_name
+        ON "GROUP"(group_name);
+    CREATE INDEX IF NOT EXISTS ix_subject_name
+        ON SUBJECT(subject_name);
+    """)
+
+# Журнал изменений ATTENDANCE для инкрементального экспорта.
+# Новые строки видны по attendance_id (AUTOINCREMENT), сюда пишутся только изменения и удаления.
+_M2_ATTENDANCE_CHANGES = """
+CREATE TABLE IF NOT EXISTS ATTENDANCE_CHANGES (
+    change_id     INTEGER PRIMARY KEY AUTOINCREMENT,
+    attendance_id INTEGER NOT NULL,
+    op            TEXT CHECK(op IN ('U', 'D')) NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS trg_attendance_changes_update
+AFTER UPDATE ON ATTENDANCE
+BEGIN
+    INSERT INTO ATTENDANCE_CHANGES (attendance_id, op) VALUES (NEW.attendance_id, 'U');
+END;
+CREATE TRIGGER IF NOT EXISTS trg_attendance_changes_delete
+AFTER DELETE ON ATTENDANCE
+BEGIN
+    INSERT INTO ATTENDANCE_CHANGES (attendance_id, op) VALUES (OLD.attendance_id, 'D');
+END;
+"""
+
+def _m4_ref_version(conn):
+    # счётчик версий справочников для кэша в refcache.py
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS REF_VERSION (
+            id      INTEGER PRIMARY KEY CHECK(id = 1),
+            version INTEGER NOT NULL
+        )
+    """)
+    conn.execute("INSERT OR IGNORE INTO REF_VERSION (id, version) VALUES (1, 0)")
+    for table, name in (("USERS", "users"), ('"GROUP"', "group"), ("SUBJECT", "subject")):
+        for op in ("INSERT", "UPDATE", "DELETE"):
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_ref_version_{name}_{op.lower()}
+                AFTER {op} ON {table}
+                BEGIN
+                    UPDATE REF_VERSION SET version = version + 1 WHERE id = 1;
+                END
+            """)
+
+# Измерения сводной таблицы ATTENDANCE_STATS: имя -> выражение ключа.
+# a — строка ATTENDANCE, s — её занятие в SCHEDULE.
+STATS_DIMENSIONS = {
+    "student": "a.user_id",
+    "group": "s.group_id",
+    "subject": "s.subject_id",
+    "teacher": "s.teacher_id",
+    "week": "strftime('%Y-W%W', s.date)",
+}
+
+def _stats_delta(row, delta, status="status"):
+    """
+    INSERT ... ON CONFLICT, прибавляющий delta к счётчикам всех измерений
+    для одной строки посещаемости (row — NEW или OLD в триггере).
+    - status: столбец статуса (status до миграции 7, затем status_id)
+    """
+    selects = " UNION ALL ".join(
+        f"SELECT '{dim}', {expr.replace('a.', row + '.')}, {row}.{status}, {delta} "
+        f"FROM SCHEDULE s WHERE s.schedule_id = {row}.schedule_id"
+        for dim, expr in STATS_DIMENSIONS.items())
+    return f"""
+        INSERT INTO ATTENDANCE_STATS (dim, key, {status}, cnt)
+        SELECT * FROM ({selects}) WHERE true
+        ON CONFLICT(dim, key, {status}) DO UPDATE SET cnt = cnt + excluded.cnt;"""
+
+def _schedule_delta(row, delta, status="status"):
+    """То же для всех отметок занятия, когда в SCHEDULE меняются группа/предмет/преподаватель/дата."""
+    selects = " UNION ALL ".join(
+        f"SELECT '{dim}', {expr.replace('s.', row + '.')}, a.{status}, {delta} * COUNT(*) "
+        f"FROM ATTENDANCE a WHERE a.schedule_id = {row}.schedule_id GROUP BY a.{status}"
+        for dim, expr in STATS_DIMENSIONS.items() if dim != "student")
+    return f"""
+        INSERT INTO ATTENDANCE_STATS (dim, key, {status}, cnt)
+        SELECT * FROM ({selects}) WHERE true
+        ON CONFLICT(dim, key, {status}) DO UPDATE SET cnt = cnt + excluded.cnt;"""
+
+def _attendance_stats(conn, status, status_type):
+    """Создаёт и заполняет ATTENDANCE_STATS и триггеры, которые её поддерживают."""
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS ATTENDANCE_STATS (
+            dim     TEXT NOT NULL,
+            key     NOT NULL,
+            {status}  {status_type} NOT NULL,
+            cnt     INTEGER NOT NULL,
+            PRIMARY KEY (dim, key, {status})
+        ) WITHOUT ROWID
+    """)
+    conn.execute("DELETE FROM ATTENDANCE_STATS")
+    for dim, expr in STATS_DIMENSIONS.items():
+        conn.execute(f"""
+            INSERT INTO ATTENDANCE_STATS (dim, key, {status}, cnt)
+            SELECT '{dim}', {expr}, a.{status}, COUNT(*)
+            FROM ATTENDANCE a JOIN SCHEDULE s ON s.schedule_id = a.schedule_id
+            GROUP BY {expr}, a.{status}
+        """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_stats_attendance_insert
+        AFTER INSERT ON ATTENDANCE
+        BEGIN {_stats_delta("NEW", 1, status)}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_stats_attendance_delete
+        AFTER DELETE ON ATTENDANCE
+        BEGIN {_stats_delta("OLD", -1, status)}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_stats_attendance_update
+        AFTER UPDATE OF schedule_id, user_id, {status} ON ATTENDANCE
+        WHEN OLD.{status} IS NOT NEW.{status} OR OLD.schedule_id <> NEW.schedule_id OR OLD.user_id <> NEW.user_id
+        BEGIN {_stats_delta("OLD", -1, status)} {_stats_delta("NEW", 1, status)}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_stats_schedule_update
+        AFTER UPDATE OF group_id, subject_id, teacher_id, date ON SCHEDULE
+        BEGIN {_schedule_delta("OLD", -1, status)} {_schedule_delta("NEW", 1, status)}
+        END
+    """)
+
+def _m5_attendance_stats(conn):
+    # счётчики отметок по измерениям, поддерживаются триггерами
+    _attendance_stats(conn, "status", "TEXT")
+
+def _m6_hash_passwords(conn):
+    # пароли в открытом виде заменяются на scrypt-хэши; уже захэшированные не трогаем
+    rows = [(uid, pw) for uid, pw in conn.execute("SELECT user_id, password FROM USERS") if not is_hashed(pw)]
+    hashes = hash_many([pw for _, pw in rows])
+    conn.executemany("UPDATE USERS SET password = ? WHERE user_id = ?",
+                     [(h, uid) for h, (uid, _) in zip(hashes, rows)])
+
+def _m7_status_codes(conn):
+    # справочник статусов; ATTENDANCE пересобирается с целочисленным status_id вместо текста
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS STATUS (
+            status_id INTEGER PRIMARY KEY,
+            name      TEXT NOT NULL UNIQUE,
+            attended  INTEGER NOT NULL CHECK(attended IN (0, 1))
+        )
+    """)
+    conn.executemany("INSERT OR IGNORE INTO STATUS (status_id, name, attended) VALUES (?, ?, ?)",
+                     [(code, name, int(code in ATTENDED)) for code, name in STATUSES.items()])
+    names = dict(conn.execute("SELECT status_id, name FROM STATUS"))
+    codes = {name.lower(): code for code, name in names.items()}
+
+    # 'присутствует', 'Присутствует ' и т.п. -> один код. Незнакомые статусы попадают
+    # в справочник как есть (attended = 0), чтобы миграция не теряла данные.
+    # lower() в SQLite не знает кириллицу, поэтому сопоставление — в Python.
+    conn.execute("CREATE TEMP TABLE status_map (status TEXT PRIMARY KEY, status_id INTEGER NOT NULL, changed INTEGER NOT NULL)")
+    for (status,) in conn.execute("SELECT DISTINCT status FROM ATTENDANCE").fetchall():
+        key = status.strip().lower()
+        if key not in codes:
+            codes[key] = conn.execute("INSERT INTO STATUS (name, attended) VALUES (?, 0)", (status.strip(),)).lastrowid
+            names[codes[key]] = status.strip()
+        conn.execute("INSERT INTO temp.status_map VALUES (?, ?, ?)",
+                     (status, codes[key], int(names[codes[key]] != status)))
+    # строки, текст которых меняется, — в журнал, чтобы инкрементальный экспорт их перевыгрузил
+    conn.execute("""
+        INSERT INTO ATTENDANCE_CHANGES (attendance_id, op)
+        SELECT a.attendance_id, 'U' FROM ATTENDANCE a JOIN temp.status_map m ON m.status = a.status
+        WHERE m.changed ORDER BY a.attendance_id
+    """)
+
+    # пересборка таблицы: триггеры и индексы удаляются вместе со старой ATTENDANCE
+    for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'ATTENDANCE'").fetchall():
+        conn.execute(f"DROP TRIGGER {name}")
+    conn.execute("DROP TRIGGER IF EXISTS trg_stats_schedule_update")
+    conn.execute("DROP TABLE IF EXISTS ATTENDANCE_STATS")
+    seq = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'ATTENDANCE'").fetchone()
+    execute_script(conn, """
+    CREATE TABLE ATTENDANCE_NEW (
+        attendance_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        schedule_id   INTEGER NOT NULL,
+        user_id       INTEGER NOT NULL,
+        status_id     INTEGER NOT NULL,
+        FOREIGN KEY (schedule_id) REFERENCES SCHEDULE(schedule_id),
+        FOREIGN KEY (user_id) REFERENCES USERS(user_id),
+        FOREIGN KEY (status_id) REFERENCES STATUS(status_id)
+    );
+    INSERT INTO ATTENDANCE_NEW (attendance_id, schedule_id, user_id, status_id)
+        SELECT a.attendance_id, a.schedule_id, a.user_id, m.status_id
+        FROM ATTENDANCE a JOIN temp.status_map m ON m.status = a.status
+        ORDER BY a.attendance_id;
+    DROP TABLE ATTENDANCE;
+    ALTER TABLE ATTENDANCE_NEW RENAME TO ATTENDANCE;
+    DROP TABLE temp.status_map;
+    CREATE UNIQUE INDEX ux_attendance_schedule_user ON ATTENDANCE(schedule_id, user_id);
+    CREATE INDEX ix_attendance_user ON ATTENDANCE(user_id, schedule_id, status_id);
+    """)
+    if seq is not None:
+        # AUTOINCREMENT не должен выдать id удалённых строк (водяной знак экспорта)
+        conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'ATTENDANCE'", seq)
+    execute_script(conn, _M2_ATTENDANCE_CHANGES)
+    _attendance_stats(conn, "status_id", "INTEGER")
+
+# Счётчики изменений для кэшей (dashboard.py): scope 'student' — отметки и группы
+# студента, scope 'group' — расписание группы. Таблица -> (scope, столбец ключа).
+DATA_VERSION_SOURCES = {
+    "ATTENDANCE": ("student", "user_id"),
+    "GROUP_STUDENTS": ("student", "user_id"),
+    "SCHEDULE": ("group", "group_id"),
+}
+
+def _bump(scope, key, when="true"):
+    return f"""
+        INSERT INTO DATA_VERSION (scope, key, version) SELECT '{scope}', {key}, 1 WHERE {when}
+        ON CONFLICT(scope, key) DO UPDATE SET version = version + 1;"""
+
+def _m8_data_version(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS DATA_VERSION (
+            scope   TEXT NOT NULL,
+            key     INTEGER NOT NULL,
+            version INTEGER NOT NULL,
+            PRIMARY KEY (scope, key)
+        ) WITHOUT ROWID
+    """)
+    for table, (scope, column) in DATA_VERSION_SOURCES.items():
+        for op, rows in (("INSERT", ["NEW"]), ("UPDATE", ["NEW", "OLD"]), ("DELETE", ["OLD"])):
+            # при UPDATE старый ключ — только если строка сменила владельца
+            body = "".join(_bump(scope, f"{row}.{column}", f"OLD.{column} IS NOT NEW.{column}" if i else "true")
+                           for i, row in enumerate(rows))
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_data_version_{table.lower()}_{op.lower()}
+                AFTER {op} ON {table}
+                BEGIN {body}
+                END
+            """)
+    # перенос или удаление занятия меняет историю всех, у кого на нём есть отметки
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_data_version_schedule_attendees
+        AFTER UPDATE OF subject_id, teacher_id, group_id, date, time, room ON SCHEDULE
+        BEGIN
+            INSERT INTO DATA_VERSION (scope, key, version)
+            SELECT 'student', user_id, 1 FROM ATTENDANCE WHERE schedule_id = NEW.schedule_id AND true
+            ON CONFLICT(scope, key) DO UPDATE SET version = version + 1;
+        END
+    """)
+
+# Журнал изменений для внешних потребителей (cdc.py): таблица -> столбцы, первый — ключ строки.
+# Для вставок и изменений в data пишется json_array значений NEW в этом порядке.
+CDC_TABLES = {
+    "ATTENDANCE": ["attendance_id", "schedule_id", "user_id", "status_id"],
+    "SCHEDULE": ["schedule_id", "subject_id", "teacher_id", "group_id", "date", "time", "room"],
+    "GROUP_STUDENTS": ["id", "user_id", "group_id"],
+}
+
+def _m10_change_log(conn):
+    execute_script(conn, """
+    -- AUTOINCREMENT: номера не переиспользуются после очистки, позиция потребителя остаётся верной
+    CREATE TABLE IF NOT EXISTS CHANGE_LOG (
+        change_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        tbl       TEXT NOT NULL,
+        op        TEXT CHECK(op IN ('I', 'U', 'D')) NOT NULL,
+        row_key   INTEGER NOT NULL,
+        data      TEXT
+    );
+    CREATE TABLE IF NOT EXISTS CDC_CONSUMERS (
+        name      TEXT PRIMARY KEY,
+        position  INTEGER NOT NULL,
+        acked_at  TEXT
+    );
+    """)
+    # Без зарегистрированных потребителей журнал никто не читает и не очищает:
+    # триггеры пишут в него, только если есть хотя бы один потребитель.
+    has_consumers = "EXISTS (SELECT 1 FROM CDC_CONSUMERS)"
+    for table, columns in CDC_TABLES.items():
+        key, name = columns[0], table.lower()
+        data = "json_array(" + ", ".join(f"NEW.{c}" for c in columns) + ")"
+        changed = " OR ".join(f"OLD.{c} IS NOT NEW.{c}" for c in columns)
+        for op, code, when, row, value in (("INSERT", "I", has_consumers, "NEW", data),
+                                           ("UPDATE", "U", f"{has_consumers} AND ({changed})", "NEW", data),
+                                           ("DELETE", "D", has_consumers, "OLD", "NULL")):
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_change_log_{name}_{op.lower()}
+                AFTER {op} ON {table} WHEN {when}
+                BEGIN
+                    INSERT INTO CHANGE_LOG (tbl, op, row_key, data) VALUES ('{name}', '{code}', {row}.{key}, {value});
+                END
+            """)
+
+MIGRATIONS = [
+    (1, "indexes and unique constraints for hot queries", _m1_indexes),
+    (2, "attendance change log for incremental export", _M2_ATTENDANCE_CHANGES),
+    (3, "subject filter index for the paged attendance report", """
+        CREATE INDEX IF NOT EXISTS ix_schedule_subject ON SCHEDULE(subject_id, date);
+    """),
+    (4, "reference data version counter", _m4_ref_version),
+    (5, "trigger-maintained attendance summary", _m5_attendance_stats),
+    (6, "salted scrypt password hashes", _m6_hash_passwords),
+    (7, "status lookup table with integer codes", _m7_status_codes),
+    (8, "per-student and per-group data versions for caches", _m8_data_version),
+    (9, "sortable session start and teacher time-window index", """
+        -- 'YYYY-MM-DD HH:MM': диапазон по времени — один поиск по индексу вместо date/time по отдельности
+        ALTER TABLE SCHEDULE ADD COLUMN starts_at TEXT GENERATED ALWAYS AS (date || ' ' || time) VIRTUAL;
+        CREATE INDEX IF NOT EXISTS ix_schedule_teacher_starts ON SCHEDULE(teacher_id, starts_at);
+        -- заменён ix_schedule_teacher_starts
+        DROP INDEX IF EXISTS ix_schedule_teacher;
+    """),
+    (10, "change log for downstream consumers", _m10_change_log),
+]
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(conn, target=None, verbose=True):
+    """
+    Применяет недостающие миграции к открытому соединению.
+    - target: до какой версии мигрировать (по умолчанию — до последней)
+    - возвращает список применённых версий
+    """
+    applied = []
+    current = schema_version(conn)
+    for version, description, step in MIGRATIONS:
+        if version <= current or (target is not None and version > target):
+            continue
+        if verbose:
+            print(f"Миграция {version}: {description}")
+        conn.commit()
+        try:
+            conn.execute("BEGIN")
+            if callable(step):
+                step(conn)
+            else:
+                execute_script(conn, step)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+    if applied:
+        conn.execute("ANALYZE")
+        conn.commit()
+    return applied
+
+# ============================
+# EXPLAIN QUERY PLAN
+# ============================
+def _sql_literal(node):
+    """SQL из строкового литерала или None; шаблоны с {} (заполняются .format) пропускаются."""
+    if (isinstance(node, ast.Constant) and isinstance(node.value, str)
+            and _SQL.match(node.value) and "{" not in node.value):
+        return " ".join(node.value.split())
+    return None
+
+def app_queries(sources=None):
+    """
+    Находит SQL-строки в исходниках приложения: литералы, передаваемые в db_query(...) /
+    load_tree(...) / query(...), и готовые запросы-константы модуля (QUERY = "...",
+    REF_QUERIES = {...: "..."}).
+    Возвращает список (файл:строка, sql).
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    found = []
+    for name in sources or APP_SOURCES:
+        path = os.path.join(here, name)
+        with open(path, encoding="utf-8") as f:
+            tree = ast.parse(f.read(), filename=name)
+        literals = []
+        for node in ast.walk(tree):
+            if not isinstance(node, ast.Call):
+                continue
+            func = node.func.id if isinstance(node.func, ast.Name) else getattr(node.func, "attr", None)
+            index = SQL_CALLS.get(func)
+            if index is not None and len(node.args) > index:
+                literals.append(node.args[index])
+        for node in tree.body:
+            # *_SELECT — заготовки, к которым WHERE / ORDER BY дописываются при вызове
+            if (isinstance(node, ast.Assign) and len(node.targets) == 1
+                    and isinstance(node.targets[0], ast.Name) and node.targets[0].id.isupper()
+                    and not node.targets[0].id.endswith("_SELECT")):
+                literals.extend(node.value.values if isinstance(node.value, ast.Dict) else [node.value])
+        for node in literals:
+            sql = _sql_literal(node)
+            if sql is not None:
+                found.append((f"{name}:{node.lineno}", sql))
+    found.sort(key=lambda item: (item[0].split(":")[0], int(item[0].split(":")[1])))
+    return found
+
+def explain(conn, sql):
+    """Возвращает план запроса в виде списка строк (параметры подставляются как NULL)."""
+    named = re.findall(r"(?<![\w:]):([A-Za-z_]\w*)", sql)
+    params = dict.fromkeys(named) if named else (None,) * sql.count("?")
+    try:
+        rows = conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+    except sqlite3.Error as e:
+        return [f"error: {e}"]
+    return [row[-1] for row in rows]
+
+def explain_all(conn, queries=None):
+    return {loc: explain(conn, sql) for loc, sql in (queries or app_queries())}
+
+def print_plans(queries, before, after):
+    for loc, sql in queries:
+        print(f"--- {loc}: {sql[:100]}")
+        if before is not None:
+            print("  before:")
+            for line in before[loc]:
+                print(f"    {line}")
+            print("  after:")
+        for line in after[loc]:
+            print(f"    {line}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Миграции схемы attendance.db")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--target", type=int, default=None, help="версия схемы")
+    parser.add_argument("--explain", action="store_true", help="показать EXPLAIN QUERY PLAN до/после")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        raise SystemExit(f"База данных не найдена: {args.db}")
+    conn = sqlite3.connect(args.db)
+    queries = app_queries() if args.explain else None
+    before = explain_all(conn, queries) if args.explain else None
+    print(f"Текущая версия схемы: {schema_version(conn)}")
+    applied = migrate(conn, args.target)
+    print(f"Применено миграций: {len(applied)}, версия схемы: {schema_version(conn)}")
+    if args.explain:
+        print_plans(queries, before if applied else None, explain_all(conn, queries))
+    conn.close()
@@ -0,0 +1,174 @@
+import re
+import json
+import time
+import argparse
+import threading
+from bisect import bisect_left
+from collections import deque
+from functools import lru_cache
+
+# -------------------------
+# SQL profiler
+# -------------------------
+# db_query / db_transaction сообщают сюда время каждого запроса. Статистика
+# группируется по нормализованному SQL (литералы -> ?, списки IN (?, ?, ...) -> IN (?...)),
+# так что один и тот же экран даёт одну строку отчёта независимо от параметров.
+
+# верхние границы корзин гистограммы, мс (последняя — всё, что дольше)
+BUCKETS_MS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+SLOW_MS = 100      # порог медленного запроса
+SLOW_LOG_SIZE = 200
+PARAMS_REPR = 200  # сколько символов параметров сохранять в журнале
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?![\w.])")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE = re.compile(r"\s+")
+
+@lru_cache(maxsize=4096)
+def normalize(sql):
+    """Ключ запроса для статистики: без литералов и лишних пробелов."""
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _SPACE.sub(" ", sql).strip()
+    return _IN_LIST.sub("(?...)", sql)
+
+
+class QueryStats:
+    __slots__ = ("sql", "calls", "errors", "total", "min", "max", "rows",
+                 "retries", "backoff", "buckets")
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.calls = 0
+        self.errors = 0
+        self.total = 0.0
+        self.min = None
+        self.max = 0.0
+        self.rows = 0
+        self.retries = 0
+        self.backoff = 0.0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+
+    def percentile(self, q):
+        """Оценка перцентиля по гистограмме — верхняя граница корзины (мс)."""
+        if not self.calls:
+            return None
+        target = q * self.calls
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if seen >= target:
+                return BUCKETS_MS[i] if i < len(BUCKETS_MS) else round(self.max * 1000, 3)
+        return round(self.max * 1000, 3)
+
+    def as_dict(self):
+        return {"sql": self.sql, "calls": self.calls, "errors": self.errors,
+                "total_ms": round(self.total * 1000, 3),
+                "avg_ms": round(self.total * 1000 / self.calls, 3) if self.calls else None,
+                "min_ms": round(self.min * 1000, 3) if self.min is not None else None,
+                "max_ms": round(self.max * 1000, 3),
+                "p50_ms": self.percentile(0.5), "p95_ms": self.percentile(0.95),
+                "rows": self.rows, "retries": self.retries, "backoff_ms": round(self.backoff * 1000, 3),
+                "histogram": dict(zip([f"<={b}" for b in BUCKETS_MS] + [f">{BUCKETS_MS[-1]}"], self.buckets))}
+
+
+class Profiler:
+    """
+    Накапливает статистику запросов и журнал медленных запросов.
+    - slow_ms: порог для журнала (None — журнал выключен)
+    - explain: для медленных запросов сохранять EXPLAIN QUERY PLAN
+    """
+
+    def __init__(self, slow_ms=SLOW_MS, explain=False, enabled=True):
+        self.enabled = enabled
+        self.slow_ms = slow_ms
+        self.explain = explain
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.slow = deque(maxlen=SLOW_LOG_SIZE)
+        self.started = time.time()
+
+    def configure(self, slow_ms=..., explain=None, enabled=None):
+        if slow_ms is not ...:
+            self.slow_ms = slow_ms
+        if explain is not None:
+            self.explain = explain
+        if enabled is not None:
+            self.enabled = enabled
+
+    def is_slow(self, seconds):
+        return self.slow_ms is not None and seconds * 1000 >= self.slow_ms
+
+    def record(self, sql, seconds, rows=0, retries=0, backoff=0.0, error=None, params=None, plan=None):
+        """Вызывается db_query после каждого запроса (включая неудачные)."""
+        if not self.enabled:
+            return
+        key = normalize(sql)
+        bucket = bisect_left(BUCKETS_MS, seconds * 1000)
+        with self.lock:
+            st = self.stats.get(key)
+            if st is None:
+                st = self.stats[key] = QueryStats(key)
+            st.calls += 1
+            st.total += seconds
+            st.min = seconds if st.min is None else min(st.min, seconds)
+            st.max = max(st.max, seconds)
+            st.rows += rows or 0
+            st.retries += retries
+            st.backoff += backoff
+            st.buckets[bucket] += 1
+            if error is not None:
+                st.errors += 1
+            if self.is_slow(seconds):
+                self.slow.append({"at": time.strftime("%Y-%m-%d %H:%M:%S"), "ms": round(seconds * 1000, 3),
+                                  "sql": key, "params": repr(params)[:PARAMS_REPR] if params else "",
+                                  "rows": rows, "retries": retries,
+                                  "error": str(error) if error is not None else None, "plan": plan})
+
+    def report(self, sort="total_ms", limit=None):
+        with self.lock:
+            items = [st.as_dict() for st in self.stats.values()]
+            slow = list(self.slow)
+        items.sort(key=lambda item: item[sort] or 0, reverse=True)
+        return {"since": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.started)),
+                "slow_ms": self.slow_ms,
+                "queries": items[:limit] if limit else items,
+                "slow": slow}
+
+    def reset(self):
+        with self.lock:
+            self.stats.clear()
+            self.slow.clear()
+            self.started = time.time()
+
+    def dump(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=2)
+
+
+profiler = Profiler()
+
+def print_report(report, limit=20):
+    print(f"с {report['since']}, порог медленных запросов {report['slow_ms']} мс")
+    print(f"{'calls':>8} {'total ms':>11} {'avg':>9} {'p95':>8} {'max':>9} {'rows':>9} {'retry':>6}  sql")
+    for q in report["queries"][:limit]:
+        print(f"{q['calls']:>8} {q['total_ms']:>11.1f} {q['avg_ms']:>9.3f} {q['p95_ms']:>8} "
+              f"{q['max_ms']:>9.3f} {q['rows']:>9} {q['retries']:>6}  {q['sql'][:100]}")
+    if report["slow"]:
+        print(f"\nмедленные запросы ({len(report['slow'])}):")
+        for s in report["slow"][-limit:]:
+            print(f"  {s['at']} {s['ms']:>9.1f} ms  {s['sql'][:100]}")
+            for line in s["plan"] or []:
+                print(f"      {line}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Отчёт профилировщика SQL (JSON из Profiler.dump)")
+    parser.add_argument("dump", help="файл, сохранённый Profiler.dump() или кнопкой в админ-панели")
+    parser.add_argument("--sort", default="total_ms", choices=["total_ms", "avg_ms", "max_ms", "calls", "retries"])
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+    with open(args.dump, encoding="utf-8") as f:
+        report = json.load(f)
+    report["queries"].sort(key=lambda q: q[args.sort] or 0, reverse=True)
+    print_report(report, args.limit)
@@ -0,0 +1,92 @@
+import threading
+
+from db import db_query
+
+# -------------------------
+# Reference data cache
+# -------------------------
+# Справочники (группы, предметы, преподаватели, студенты) меняются редко, а читаются
+# каждым диалогом. Кэш сбрасывается, когда меняется REF_VERSION.version — счётчик,
+# который триггеры (миграция 4) увеличивают при любой записи в USERS, "GROUP", SUBJECT.
+
+REF_QUERIES = {
+    "groups": 'SELECT group_id, group_name FROM "GROUP" ORDER BY group_id',
+    "subjects": "SELECT subject_id, subject_name FROM SUBJECT ORDER BY subject_id",
+    "teachers": "SELECT user_id, username FROM USERS WHERE role='teacher' ORDER BY user_id",
+    "students": "SELECT user_id, username FROM USERS WHERE role='student' ORDER BY user_id",
+}
+
+
+class RefMap:
+    """Двусторонний справочник name <-> id. При повторяющихся именах побеждает меньший id."""
+
+    def __init__(self, rows):
+        self.names = [name for _, name in rows]
+        self.by_id = dict(rows)
+        self.by_name = {}
+        for id_, name in rows:
+            self.by_name.setdefault(name, id_)
+
+    def id(self, name):
+        return self.by_name.get(name)
+
+    def name(self, id_):
+        return self.by_id.get(id_)
+
+
+class ReferenceCache:
+
+    def __init__(self, query=db_query):
+        self.query = query
+        self.version = None
+        self.maps = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _current_version(self):
+        rows = self.query("SELECT version FROM REF_VERSION WHERE id = 1")
+        return rows[0][0] if rows else None
+
+    def get(self, kind):
+        version = self._current_version()
+        with self.lock:
+            if version != self.version:
+                if self.maps:
+                    self.invalidations += 1
+                self.maps = {}
+                self.version = version
+            ref = self.maps.get(kind)
+            if ref is not None:
+                self.hits += 1
+                return ref
+            self.misses += 1
+        ref = RefMap(self.query(REF_QUERIES[kind]))
+        with self.lock:
+            if self.version == version:
+                self.maps[kind] = ref
+        return ref
+
+    def groups(self):
+        return self.get("groups")
+
+    def subjects(self):
+        return self.get("subjects")
+
+    def teachers(self):
+        return self.get("teachers")
+
+    def students(self):
+        return self.get("students")
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {"version": self.version, "cached": sorted(self.maps),
+                    "hits": self.hits, "misses": self.misses,
+                    "hit_rate": self.hits / total if total else 0.0,
+                    "invalidations": self.invalidations}
+
+
+refs = ReferenceCache()
@@ -0,0 +1,212 @@
+import os
+import time
+import sqlite3
+import argparse
+import tempfile
+import threading
+
+from db import DB_PATH, PRAGMAS, db_query, get_pool, close_pool
+
+# насколько копия может отставать от основной БД (сек)
+REPLICA_MAX_AGE = 30
+# соединения к копии только читают; journal_mode не трогаем — копия в режиме DELETE
+REPLICA_PRAGMAS = [(name, value) for name, value in PRAGMAS if name in ("cache_size", "mmap_size")] + \
+                  [("query_only", "ON")]
+
+# -------------------------
+# Read replica for reports
+# -------------------------
+class _Generation:
+    """Один файл копии и число запросов, которые сейчас его читают."""
+
+    def __init__(self, path, version, copied):
+        self.path = path
+        self.version = version  # PRAGMA data_version источника на момент копии
+        self.copied = copied    # time.monotonic()
+        self.readers = 0
+        self.retired = False
+
+
+class Replica:
+    """
+    Копия БД для тяжёлых отчётов, обновляемая через sqlite3 backup().
+    Отчёты читают копию, поэтому не держат снимок основной БД во время длинных
+    JOIN и не мешают окну отметок.
+    - max_age: сколько секунд копия считается свежей; устаревшая копия обновляется
+      при следующем запросе, если основная БД с тех пор менялась (PRAGMA data_version)
+    - directory: где создавать файлы копий (по умолчанию — временный каталог системы)
+
+    backup() выполняется одним шагом: в режиме WAL это одна читающая транзакция,
+    писатели её не ждут. Пошаговое копирование начиналось бы заново после каждой
+    чужой записи и под нагрузкой могло бы не закончиться.
+    Каждое обновление пишет новый файл; старый удаляется, когда его дочитают.
+    """
+
+    def __init__(self, path=None, max_age=REPLICA_MAX_AGE, directory=None):
+        self.path = path or DB_PATH
+        self.max_age = max_age
+        self.directory = directory
+        self.lock = threading.Lock()       # состояние поколений
+        self.copy_lock = threading.Lock()  # одно копирование за раз
+        self.source = None
+        self.current = None
+        self.refreshes = 0
+        self.skipped = 0
+        self.copy_seconds = 0.0
+        self.closed = False
+
+    def _source(self):
+        if self.source is None:
+            self.source = sqlite3.connect(f"file:{os.path.abspath(self.path)}?mode=ro", uri=True,
+                                          timeout=5, check_same_thread=False)
+        return self.source
+
+    def _stale(self):
+        return self.current is None or time.monotonic() - self.current.copied >= self.max_age
+
+    def refresh(self, force=False):
+        """
+        Обновляет копию, если она устарела (или force=True) и основная БД менялась.
+        Возвращает True, если был сделан новый файл.
+        """
+        with self.copy_lock:
+            if self.closed:
+                raise sqlite3.ProgrammingError("Replica закрыта")
+            if not force and not self._stale():
+                return False
+            source = self._source()
+            version = source.execute("PRAGMA data_version").fetchone()[0]
+            if self.current is not None and version == self.current.version:
+                # с прошлой копии никто не писал — она всё ещё точная
+                self.current.copied = time.monotonic()
+                self.skipped += 1
+                return False
+
+            fd, path = tempfile.mkstemp(prefix="attendance-replica-", suffix=".db", dir=self.directory)
+            os.close(fd)
+            started = time.perf_counter()
+            try:
+                target = sqlite3.connect(path)
+                try:
+                    source.backup(target)
+                    target.execute("PRAGMA journal_mode = DELETE")
+                finally:
+                    target.close()
+            except Exception:
+                _remove(path)
+                raise
+            get_pool(path, pragmas=REPLICA_PRAGMAS)
+            with self.lock:
+                old, self.current = self.current, _Generation(path, version, time.monotonic())
+                self.refreshes += 1
+                self.copy_seconds += time.perf_counter() - started
+                if old is not None:
+                    old.retired = True
+            if old is not None:
+                self._drop_if_unused(old)
+            return True
+
+    def _acquire(self):
+        if self._stale():
+            self.refresh()
+        with self.lock:
+            gen = self.current
+            gen.readers += 1
+            return gen
+
+    def _release(self, gen):
+        with self.lock:
+            gen.readers -= 1
+        self._drop_if_unused(gen)
+
+    def _drop_if_unused(self, gen):
+        with self.lock:
+            if not gen.retired or gen.readers or gen.path is None:
+                return
+            path, gen.path = gen.path, None
+        close_pool(path)
+        _remove(path)
+
+    def query(self, sql, params=()):
+        """Как db_query, но читает копию (подходит как query= для reports/analytics)."""
+        gen = self._acquire()
+        try:
+            return db_query(sql, params, retries=1, path=gen.path)
+        finally:
+            self._release(gen)
+
+    def stats(self):
+        with self.lock:
+            gen = self.current
+            return {"path": gen.path if gen else None,
+                    "age_s": round(time.monotonic() - gen.copied, 1) if gen else None,
+                    "bytes": os.path.getsize(gen.path) if gen and gen.path else 0,
+                    "max_age_s": self.max_age,
+                    "refreshes": self.refreshes, "skipped": self.skipped,
+                    "avg_copy_ms": round(self.copy_seconds * 1000 / self.refreshes, 1) if self.refreshes else None}
+
+    def close(self):
+        with self.copy_lock:
+            self.closed = True
+            with self.lock:
+                gen, self.current = self.current, None
+                if gen is not None:
+                    gen.retired = True
+            if gen is not None:
+                self._drop_if_unused(gen)
+            if self.source is not None:
+                self.source.close()
+                self.source = None
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+# -------------------------
+# CLI: отчёт с основной БД и с копии, пока идут отметки
+# -------------------------
+def _bench(path, seconds, max_age):
+    from reports import ALL_ATTENDANCE_SELECT
+    from attendance import UPSERT_ATTENDANCE, STATUSES
+
+    report = ALL_ATTENDANCE_SELECT + "ORDER BY s.date DESC, a.attendance_id DESC"
+    marks = db_query("SELECT schedule_id, user_id FROM ATTENDANCE ORDER BY attendance_id DESC LIMIT 2000", path=path)
+    codes = list(STATUSES)
+    replica = Replica(path, max_age=max_age)
+    for label, query in (("main db", lambda sql: db_query(sql, path=path)), ("replica", replica.query)):
+        stop = threading.Event()
+        writes = {"marks": 0, "worst_ms": 0.0}
+
+        def marker():
+            i = 0
+            while not stop.is_set():
+                s, u = marks[i % len(marks)]
+                started = time.perf_counter()
+                db_query(UPSERT_ATTENDANCE, (s, u, codes[i % len(codes)]), fetch=False, path=path)
+                writes["worst_ms"] = max(writes["worst_ms"], (time.perf_counter() - started) * 1000)
+                writes["marks"] += 1
+                i += 1
+
+        thread = threading.Thread(target=marker)
+        thread.start()
+        reports, started = 0, time.perf_counter()
+        while time.perf_counter() - started < seconds:
+            query(report)
+            reports += 1
+        stop.set()
+        thread.join()
+        elapsed = time.perf_counter() - started
+        print(f"{label:<8}: {reports / elapsed:6.2f} reports/s, {writes['marks'] / elapsed:8.0f} marks/s, "
+              f"worst mark {writes['worst_ms']:.1f} ms")
+    print(replica.stats())
+    replica.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Копия БД для отчётов: замер под нагрузкой отметок")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--max-age", type=float, default=REPLICA_MAX_AGE, help="свежесть копии, сек")
+    args = parser.parse_args()
+    _bench(args.db, args.seconds, args.max_age)
@@ -0,0 +1,58 @@
+from db import db_query
+from attendance import status_id
+
+PAGE_SIZE = 200
+
+# Отчёт «все посещения» в порядке (date DESC, attendance_id DESC).
+# Ключ строки — (date, attendance_id); страницы выбираются keyset-пагинацией,
+# поэтому стоимость страницы не зависит от того, как далеко пролистан отчёт.
+ALL_ATTENDANCE_SELECT = """
+    SELECT a.attendance_id, u.username, g.group_name, s.date, s.time, sub.subject_name, st.name
+    FROM ATTENDANCE a
+    JOIN STATUS st ON st.status_id = a.status_id
+    JOIN USERS u ON a.user_id = u.user_id
+    JOIN SCHEDULE s ON a.schedule_id = s.schedule_id
+    JOIN SUBJECT sub ON s.subject_id = sub.subject_id
+    JOIN "GROUP" g ON s.group_id = g.group_id
+"""
+
+def _attendance_filters(filters):
+    where, params = [], []
+    if filters.get("group_id"):
+        where.append("s.group_id = ?"); params.append(filters["group_id"])
+    if filters.get("subject_id"):
+        where.append("s.subject_id = ?"); params.append(filters["subject_id"])
+    if filters.get("date_from"):
+        where.append("s.date >= ?"); params.append(filters["date_from"])
+    if filters.get("date_to"):
+        where.append("s.date <= ?"); params.append(filters["date_to"])
+    if filters.get("status"):
+        where.append("a.status_id = ?"); params.append(status_id(filters["status"]))
+    return where, params
+
+def attendance_page(filters=None, direction="next", key=None, limit=PAGE_SIZE, query=db_query):
+    """
+    Страница отчёта «все посещения».
+    - filters: dict с необязательными group_id, subject_id, date_from, date_to, status (код или название)
+    - direction: "next" — строки после key, "prev" — строки перед key
+    - key: (date, attendance_id) крайней загруженной строки; None — с начала отчёта
+    - возвращает список (key, values) в порядке отображения
+    """
+    where, params = _attendance_filters(filters or {})
+    if key is None and direction == "prev":
+        return []
+    if direction == "next":
+        if key is not None:
+            where.append("(s.date, a.attendance_id) < (?, ?)"); params.extend(key)
+        order = "s.date DESC, a.attendance_id DESC"
+    else:
+        where.append("(s.date, a.attendance_id) > (?, ?)"); params.extend(key)
+        order = "s.date ASC, a.attendance_id ASC"
+    sql = ALL_ATTENDANCE_SELECT
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {order} LIMIT ?"
+    rows = query(sql, tuple(params) + (limit,))
+    if direction == "prev":
+        rows.reverse()
+    return [((r[3], r[0]), r) for r in rows]
@@ -0,0 +1,560 @@
+import re
+import json
+import time
+import asyncio
+import sqlite3
+import secrets
+import argparse
+import functools
+import threading
+import traceback
+from collections import OrderedDict
+from urllib.parse import urlsplit, parse_qs
+from concurrent.futures import ThreadPoolExecutor
+
+from db import DB_PATH, PRAGMAS
+from migrations import migrate, STATS_DIMENSIONS
+from attendance import UPSERT_ATTENDANCE, status_id
+from reports import attendance_page, PAGE_SIZE
+from analytics import attendance_rates
+from dashboard import student_dashboard, dashboards
+from timetable import teacher_window, next_session
+import cdc
+from writequeue import WriteQueue, GROUP_COMMIT_MS, MAX_BATCH
+from auth import authenticate, REHASH_QUERY, sessions as login_cache
+from profiler import profiler
+
+HOST = "127.0.0.1"
+PORT = 8080
+READERS = 4
+HASHERS = 4  # потоков для проверки паролей (scrypt отпускает GIL)
+MAX_BODY = 1024 * 1024
+# Токен действует, пока им пользуются чаще, чем раз в TOKEN_TTL секунд; хранится не больше TOKEN_MAX
+TOKEN_TTL = 8 * 3600
+TOKEN_MAX = 50_000
+
+# Те же запросы, что у соответствующих окон app.py
+GROUP_SCHEDULE_QUERY = """
+    SELECT s.schedule_id, s.date, s.time, sub.subject_name, u.username, s.room
+    FROM SCHEDULE s
+    JOIN SUBJECT sub ON s.subject_id=sub.subject_id
+    JOIN USERS u ON s.teacher_id=u.user_id
+    WHERE s.group_id=?
+    ORDER BY s.date, s.time
+"""
+SESSION_STUDENTS_QUERY = """
+    SELECT u.user_id, u.username, st.name
+    FROM GROUP_STUDENTS gs
+    JOIN USERS u ON gs.user_id = u.user_id
+    JOIN SCHEDULE s ON s.group_id = gs.group_id
+    LEFT JOIN ATTENDANCE a ON a.schedule_id = s.schedule_id AND a.user_id = u.user_id
+    LEFT JOIN STATUS st ON st.status_id = a.status_id
+    WHERE s.schedule_id = ?
+    ORDER BY u.username
+"""
+STUDENT_ATTENDANCE_QUERY = """
+    SELECT s.date, s.time, sub.subject_name, st.name
+    FROM ATTENDANCE a
+    JOIN SCHEDULE s ON a.schedule_id=s.schedule_id
+    JOIN SUBJECT sub ON s.subject_id=sub.subject_id
+    JOIN STATUS st ON st.status_id=a.status_id
+    WHERE a.user_id=?
+    ORDER BY s.date
+"""
+SCHEDULE_TEACHER_QUERY = "SELECT teacher_id FROM SCHEDULE WHERE schedule_id = ?"
+GROUP_MEMBER_QUERY = "SELECT 1 FROM GROUP_STUDENTS WHERE user_id = ? AND group_id = ?"
+
+REASONS = {200: "OK", 400: "Bad Request", 401: "Unauthorized", 403: "Forbidden",
+           404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+           500: "Internal Server Error"}
+
+
+class NDJSON(list):
+    """Ответ обработчика, который отдаётся как application/x-ndjson (по объекту в строке)."""
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class Request:
+    def __init__(self, method, target, headers, body):
+        url = urlsplit(target)
+        self.method = method
+        self.path = url.path
+        self.args = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        self.headers = headers
+        self.body = body
+        self.user = None
+
+    def json(self):
+        try:
+            return json.loads(self.body or b"{}")
+        except ValueError:
+            raise HTTPError(400, "Тело запроса — не JSON")
+
+    def int_arg(self, name, default=None):
+        value = self.args.get(name)
+        if value is None:
+            return default
+        try:
+            return int(value)
+        except ValueError:
+            raise HTTPError(400, f"{name}: ожидается число")
+
+
+def connect(path, readonly=False):
+    """Соединение с PRAGMA приложения; readonly — через URI mode=ro."""
+    if readonly:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=5, check_same_thread=False)
+        conn.execute("PRAGMA query_only = ON")
+    else:
+        conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+    for name, value in PRAGMAS:
+        if not (readonly and name == "journal_mode"):
+            conn.execute(f"PRAGMA {name} = {value}")
+    return conn
+
+# -------------------------
+# Read pool
+# -------------------------
+class ReadPool:
+    """Потоки-читатели; у каждого своё соединение только для чтения."""
+
+    def __init__(self, path, size=READERS):
+        self.path = path
+        self.executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="db-reader")
+        self.local = threading.local()
+        self.conns = []
+        self.lock = threading.Lock()
+
+    def _conn(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.local.conn = connect(self.path, readonly=True)
+            with self.lock:
+                self.conns.append(conn)
+        return conn
+
+    def query(self, sql, params=()):
+        """Синхронный запрос на соединении текущего потока-читателя (с записью в profiler)."""
+        started = time.perf_counter()
+        try:
+            rows = self._conn().execute(sql, params).fetchall()
+        except sqlite3.Error as e:
+            profiler.record(sql, time.perf_counter() - started, error=e, params=params)
+            raise
+        profiler.record(sql, time.perf_counter() - started, len(rows), params=params)
+        return rows
+
+    async def run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+
+    async def fetch(self, sql, params=()):
+        return await self.run(self.query, sql, params)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        with self.lock:
+            for conn in self.conns:
+                conn.close()
+            self.conns.clear()
+
+# -------------------------
+# Bearer tokens
+# -------------------------
+class TokenStore:
+    """
+    Токены входа: token -> пользователь. Каждое обращение продлевает токен на ttl
+    секунд; токены без обращений дольше ttl удаляются. Порядок OrderedDict — порядок
+    последнего обращения, поэтому просроченные токены всегда в начале, а при
+    переполнении (max_size) вытесняется давно не использовавшийся.
+    Вызывается только из цикла событий — без блокировок.
+    """
+
+    def __init__(self, ttl=TOKEN_TTL, max_size=TOKEN_MAX):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries = OrderedDict()  # token -> (expires, user)
+        self.expired = 0
+        self.evicted = 0
+
+    def _expire(self, now):
+        while self.entries:
+            token, (expires, _) = next(iter(self.entries.items()))
+            if expires > now:
+                break
+            del self.entries[token]
+            self.expired += 1
+
+    def add(self, user):
+        now = time.monotonic()
+        self._expire(now)
+        while len(self.entries) >= self.max_size:
+            self.entries.popitem(last=False)
+            self.evicted += 1
+        token = secrets.token_urlsafe(24)
+        self.entries[token] = (now + self.ttl, user)
+        return token
+
+    def get(self, token):
+        now = time.monotonic()
+        self._expire(now)
+        entry = self.entries.get(token)
+        if entry is None:
+            return None
+        self.entries[token] = (now + self.ttl, entry[1])
+        self.entries.move_to_end(token)
+        return entry[1]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self):
+        self._expire(time.monotonic())
+        return {"active": len(self.entries), "max": self.max_size, "ttl_s": self.ttl,
+                "expired": self.expired, "evicted": self.evicted}
+
+# -------------------------
+# HTTP server
+# -------------------------
+class AttendanceServer:
+    """
+    HTTP/JSON API с теми же операциями, что и окна app.py.
+    Авторизация: POST /login возвращает token, остальные запросы передают
+    заголовок «Authorization: Bearer <token>».
+    """
+
+    def __init__(self, path=DB_PATH, readers=READERS, delay_ms=GROUP_COMMIT_MS, max_batch=MAX_BATCH):
+        self.path = path
+        self.reads = ReadPool(path, readers)
+        # scrypt на отдельных потоках: волна входов в начале пары не задерживает чтение
+        self.hashers = ThreadPoolExecutor(max_workers=HASHERS, thread_name_prefix="auth")
+        self.delay_ms, self.max_batch = delay_ms, max_batch
+        self.writes = None  # WriteQueue, создаётся в start() после миграций
+        self.sessions = TokenStore()  # token -> {"id", "username", "role"}
+        self.requests = 0
+        self.errors = 0
+        self.started = time.time()
+        self.routes = [
+            ("POST", r"/login", self.login, None),
+            ("GET", r"/health", self.health, None),
+            ("GET", r"/teachers/(\d+)/schedule", self.teacher_schedule, ("teacher", "admin")),
+            ("GET", r"/teachers/(\d+)/next", self.teacher_next, ("teacher", "admin")),
+            ("GET", r"/groups/(\d+)/schedule", self.group_schedule, None),
+            ("GET", r"/schedule/(\d+)/students", self.session_students, ("teacher", "admin")),
+            ("POST", r"/schedule/(\d+)/attendance", self.mark, ("teacher", "admin")),
+            ("GET", r"/students/(\d+)/attendance", self.student_attendance, None),
+            ("GET", r"/students/(\d+)/dashboard", self.student_dashboard, None),
+            ("GET", r"/reports/attendance", self.report_attendance, ("teacher", "admin")),
+            ("GET", r"/reports/stats", self.report_stats, ("teacher", "admin")),
+            ("GET", r"/admin/profile", self.profile, ("admin",)),
+            ("GET", r"/changes", self.changes, ("admin",)),
+            ("POST", r"/changes/ack", self.ack_changes, ("admin",)),
+        ]
+
+    async def start(self, host=HOST, port=PORT):
+        conn = connect(self.path)
+        try:
+            migrate(conn, verbose=False)
+        finally:
+            conn.close()
+        self.writes = WriteQueue(self.path, self.delay_ms, self.max_batch)
+        return await asyncio.start_server(self.handle, host, port)
+
+    async def close(self):
+        if self.writes is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self.writes.close)
+        self.hashers.shutdown(wait=True)
+        self.reads.close()
+
+    # --- handlers ---
+    async def login(self, request):
+        data = request.json()
+        login = functools.partial(authenticate, str(data.get("username", "")), str(data.get("password", "")),
+                                  str(data.get("role", "")), query=self.reads.query, rehash=self._rehash)
+        user = await asyncio.get_running_loop().run_in_executor(self.hashers, login)
+        if user is None:
+            raise HTTPError(401, "Неверный логин или пароль")
+        user = dict(user)
+        return {"token": self.sessions.add(user), "user": user}
+
+    def _rehash(self, user_id, new_hash, old_hash):
+        # читатели работают только на чтение — пересчитанный хэш пишет очередь записи
+        self.writes.execute(REHASH_QUERY, (new_hash, user_id, old_hash))
+
+    async def health(self, request):
+        return {"status": "ok", "uptime": round(time.time() - self.started, 1),
+                "requests": self.requests, "errors": self.errors,
+                "sessions": self.sessions.stats(), "login_cache": login_cache.stats(),
+                "writes": self.writes.stats(), "dashboards": dashboards.stats()}
+
+    async def teacher_schedule(self, request, teacher_id):
+        """Параметры: date_from, date_to (YYYY-MM-DD, включительно); без них — всё расписание."""
+        if request.user["role"] == "teacher" and request.user["id"] != teacher_id:
+            raise HTTPError(403, "Можно смотреть только своё расписание")
+        try:
+            rows = await self.reads.run(teacher_window, teacher_id, request.args.get("date_from"),
+                                        request.args.get("date_to"), query=self.reads.query)
+        except ValueError:
+            raise HTTPError(400, "date_from / date_to: ожидается YYYY-MM-DD")
+        return [dict(zip(("schedule_id", "date", "time", "subject", "group", "room"), r)) for r in rows]
+
+    async def teacher_next(self, request, teacher_id):
+        """Текущее или ближайшее занятие преподавателя; null, если занятий больше нет."""
+        if request.user["role"] == "teacher" and request.user["id"] != teacher_id:
+            raise HTTPError(403, "Можно смотреть только своё расписание")
+        row = await self.reads.run(next_session, teacher_id, query=self.reads.query)
+        return dict(zip(("schedule_id", "date", "time", "subject", "group", "room"), row)) if row else None
+
+    async def group_schedule(self, request, group_id):
+        if request.user["role"] == "student" and not await self.reads.fetch(
+                GROUP_MEMBER_QUERY, (request.user["id"], group_id)):
+            raise HTTPError(403, "Студент не состоит в этой группе")
+        rows = await self.reads.fetch(GROUP_SCHEDULE_QUERY, (group_id,))
+        return [dict(zip(("schedule_id", "date", "time", "subject", "teacher", "room"), r)) for r in rows]
+
+    async def session_students(self, request, schedule_id):
+        rows = await self.reads.fetch(SESSION_STUDENTS_QUERY, (schedule_id,))
+        return [dict(zip(("user_id", "username", "status"), r)) for r in rows]
+
+    async def mark(self, request, schedule_id):
+        """
+        Тело: {"marks": {"<user_id>": <status>, ...}} или {"marks": [[user_id, status], ...]};
+        status — код из справочника STATUS или его название.
+        """
+        marks = request.json().get("marks")
+        if isinstance(marks, dict):
+            marks = marks.items()
+        try:
+            rows = [(schedule_id, int(uid), status) for uid, status in marks or ()]
+        except (TypeError, ValueError):
+            raise HTTPError(400, "marks: ожидается {user_id: status}")
+        if not rows:
+            raise HTTPError(400, "Нет отметок")
+        coded, bad = [], set()
+        for sid, uid, status in rows:
+            try:
+                coded.append((sid, uid, status_id(status)))
+            except ValueError:
+                bad.add(str(status))
+        if bad:
+            raise HTTPError(400, f"Неизвестный статус: {', '.join(sorted(bad))}")
+        rows = coded
+        user = request.user
+
+        def work(conn):
+            found = conn.execute(SCHEDULE_TEACHER_QUERY, (schedule_id,)).fetchone()
+            if not found:
+                raise HTTPError(404, "Занятие не найдено")
+            if user["role"] == "teacher" and found[0] != user["id"]:
+                raise HTTPError(403, "Занятие другого преподавателя")
+            conn.executemany(UPSERT_ATTENDANCE, rows)
+            return len(rows)
+
+        return {"marked": await asyncio.wrap_future(self.writes.submit(work))}
+
+    async def student_attendance(self, request, user_id):
+        if request.user["role"] == "student" and request.user["id"] != user_id:
+            raise HTTPError(403, "Можно смотреть только свою посещаемость")
+        rows = await self.reads.fetch(STUDENT_ATTENDANCE_QUERY, (user_id,))
+        return [dict(zip(("date", "time", "subject", "status"), r)) for r in rows]
+
+    async def student_dashboard(self, request, user_id):
+        """Расписание, посещения и процент посещаемости одним ответом (dashboard.py, с кэшем)."""
+        if request.user["role"] == "student" and request.user["id"] != user_id:
+            raise HTTPError(403, "Можно смотреть только свой кабинет")
+        return await self.reads.run(student_dashboard, user_id, query=self.reads.query)
+
+    async def report_attendance(self, request):
+        """
+        Страница отчёта «все посещения» (reports.attendance_page).
+        Параметры: group_id, subject_id, date_from, date_to, status, limit,
+        direction=next|prev и after=<date>,<attendance_id> — ключ крайней строки.
+        """
+        filters = {"group_id": request.int_arg("group_id"), "subject_id": request.int_arg("subject_id"),
+                   "date_from": request.args.get("date_from"), "date_to": request.args.get("date_to"),
+                   "status": request.args.get("status")}
+        if filters["status"]:
+            try:
+                filters["status"] = status_id(int(filters["status"]) if filters["status"].isdigit()
+                                              else filters["status"])
+            except ValueError as e:
+                raise HTTPError(400, str(e))
+        direction = request.args.get("direction", "next")
+        if direction not in ("next", "prev"):
+            raise HTTPError(400, "direction: next или prev")
+        key = None
+        if "after" in request.args:
+            date, _, attendance_id = request.args["after"].rpartition(",")
+            if not date or not attendance_id.isdigit():
+                raise HTTPError(400, "after: ожидается <date>,<attendance_id>")
+            key = (date, int(attendance_id))
+        limit = min(max(request.int_arg("limit", PAGE_SIZE), 1), 1000)
+        page = await self.reads.run(attendance_page, filters, direction, key, limit, query=self.reads.query)
+        return {"rows": [dict(zip(("attendance_id", "student", "group", "date", "time", "subject", "status"),
+                                  values)) for _, values in page],
+                "next": f"{page[-1][0][0]},{page[-1][0][1]}" if len(page) == limit else None}
+
+    async def report_stats(self, request):
+        dim = request.args.get("by", "group")
+        if dim not in STATS_DIMENSIONS:
+            raise HTTPError(400, f"by: одно из {', '.join(STATS_DIMENSIONS)}")
+        return await self.reads.run(attendance_rates, dim, query=self.reads.query)
+
+    async def profile(self, request):
+        """Профиль SQL этого процесса (profiler.py); ?reset=1 — обнулить после выдачи."""
+        report = profiler.report(limit=request.int_arg("limit"))
+        if request.args.get("reset") == "1":
+            profiler.reset()
+        return report
+
+    async def changes(self, request):
+        """
+        Журнал изменений (cdc.py) в NDJSON. Параметры: consumer=<имя> — после его позиции,
+        или after=<номер>; limit. id последней строки — позиция для POST /changes/ack.
+        """
+        limit = min(max(request.int_arg("limit", cdc.BATCH_SIZE), 1), 10000)
+        consumer = request.args.get("consumer")
+        if consumer:
+            try:
+                after = await self.reads.run(cdc.position, consumer, query=self.reads.query)
+            except KeyError as e:
+                raise HTTPError(404, e.args[0])
+        else:
+            after = request.int_arg("after", 0)
+        return NDJSON(await self.reads.run(cdc.changes, after, limit, query=self.reads.query))
+
+    async def ack_changes(self, request):
+        """Тело: {"consumer": <имя>, "position": <номер>}; журнал очищается до общей позиции."""
+        data = request.json()
+        consumer, upto = data.get("consumer"), data.get("position")
+        if not isinstance(consumer, str) or not isinstance(upto, int):
+            raise HTTPError(400, "ожидается {consumer: str, position: int}")
+        try:
+            position, removed = await asyncio.wrap_future(self.writes.submit(
+                lambda conn: cdc.ack(conn, consumer, upto)))
+        except KeyError as e:
+            raise HTTPError(404, e.args[0])
+        except ValueError as e:
+            raise HTTPError(400, str(e))
+        return {"consumer": consumer, "position": position, "truncated": removed}
+
+    # --- HTTP ---
+    async def dispatch(self, request):
+        allowed = False
+        for method, pattern, handler, roles in self.routes:
+            m = re.fullmatch(pattern, request.path)
+            if not m:
+                continue
+            allowed = True
+            if method != request.method:
+                continue
+            if handler not in (self.login, self.health):
+                request.user = self._authorize(request, roles)
+            return await handler(request, *map(int, m.groups()))
+        raise HTTPError(405 if allowed else 404, f"{request.method} {request.path}")
+
+    def _authorize(self, request, roles):
+        auth = request.headers.get("authorization", "")
+        user = self.sessions.get(auth[7:]) if auth.startswith("Bearer ") else None
+        if user is None:
+            raise HTTPError(401, "Требуется вход")
+        if roles is not None and user["role"] not in roles:
+            raise HTTPError(403, "Недостаточно прав")
+        return user
+
+    async def _read_request(self, reader):
+        line = await reader.readline()
+        if not line.strip():
+            return None
+        try:
+            method, target, version = line.decode("latin-1").split()
+        except ValueError:
+            raise HTTPError(400, "Некорректная строка запроса")
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get("content-length") or 0)
+        except ValueError:
+            raise HTTPError(400, "Content-Length: ожидается число")
+        if length < 0:
+            raise HTTPError(400, "Content-Length: ожидается число")
+        if length > MAX_BODY:
+            raise HTTPError(413, "Слишком большое тело запроса")
+        body = await reader.readexactly(length) if length else b""
+        request = Request(method.upper(), target, headers, body)
+        connection = headers.get("connection", "").lower()
+        request.keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+        return request
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                keep_alive = False
+                try:
+                    request = await self._read_request(reader)
+                    if request is None:
+                        break
+                    keep_alive = request.keep_alive
+                    self.requests += 1
+                    status, payload = 200, await self.dispatch(request)
+                except HTTPError as e:
+                    status, payload = e.status, {"error": str(e)}
+                except sqlite3.Error as e:
+                    status, payload = 500, {"error": f"Ошибка базы данных: {e}"}
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    raise
+                except Exception:
+                    # ошибка в обработчике: клиент получает 500, а не оборванное соединение
+                    traceback.print_exc()
+                    status, payload = 500, {"error": "Внутренняя ошибка сервера"}
+                if status >= 500:
+                    self.errors += 1
+                if isinstance(payload, NDJSON):
+                    body, content_type = cdc.to_ndjson(payload).encode("utf-8"), "application/x-ndjson"
+                else:
+                    body, content_type = json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json"
+                writer.write((f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                              f"Content-Type: {content_type}; charset=utf-8\r\n"
+                              f"Content-Length: {len(body)}\r\n"
+                              f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n").encode("latin-1") + body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+async def serve(path, host, port, readers, delay_ms, max_batch):
+    server = AttendanceServer(path, readers, delay_ms, max_batch)
+    listener = await server.start(host, port)
+    print(f"listening on http://{host}:{port} (db {path})")
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        await server.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HTTP/JSON API посещаемости")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--readers", type=int, default=READERS, help="потоков-читателей")
+    parser.add_argument("--group-commit-ms", type=int, default=GROUP_COMMIT_MS)
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.db, args.host, args.port, args.readers, args.group_commit_ms, args.max_batch))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,398 @@
+import os
+import sys
+import json
+import mmap
+import time
+import sqlite3
+import argparse
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+
+from db import DB_PATH
+from attendance import STATUSES, status_id
+from reports import PAGE_SIZE
+
+# ============================
+# COLUMNAR SNAPSHOT
+# ============================
+# Снимок ATTENDANCE для архива и аналитики. Строки упорядочены по (date, attendance_id) —
+# так же, как отчёт «все посещения» (в обратном порядке).
+#
+# Файл: MAGIC, uint32 длина заголовка, заголовок JSON (utf-8), затем секции, выровненные
+# по 8 байт. Заголовок описывает каждую секцию: смещение, длину, typecode массива.
+# - столбцы: attendance_id (q), schedule_id (q), student/group/subject/date/time/status —
+#   коды словарей; размер кода выбирается по числу значений (B/H/I)
+# - словари: строки UTF-8 подряд + смещения (I); у student/group/subject ещё и id (q).
+#   Словарь дат отсортирован, поэтому порядок кодов дат совпадает с порядком строк дат,
+#   и фильтр по диапазону дат — это бинарный поиск
+# - индексы by_student / by_group / by_subject (CSR): для ключа k номера строк
+#   rows[offsets[k]:offsets[k + 1]] в порядке возрастания
+# Числа записаны в порядке байт машины, которая писала снимок (поле byteorder).
+
+MAGIC = b"ATTSNAP1"
+ALIGN = 8
+
+SNAPSHOT_QUERY = """
+    SELECT a.attendance_id, a.schedule_id, a.user_id, u.username, s.group_id, g.group_name,
+           s.subject_id, sub.subject_name, s.date, s.time, a.status_id, st.name
+    FROM ATTENDANCE a
+    JOIN STATUS st ON st.status_id = a.status_id
+    JOIN USERS u ON a.user_id = u.user_id
+    JOIN SCHEDULE s ON a.schedule_id = s.schedule_id
+    JOIN SUBJECT sub ON s.subject_id = sub.subject_id
+    JOIN "GROUP" g ON s.group_id = g.group_id
+    ORDER BY s.date, a.attendance_id
+"""
+
+# «Моя посещаемость» из БД — для сверки со снимком (порядок как у dashboard.DASHBOARD_QUERY)
+STUDENT_ATTENDANCE_QUERY = """
+    SELECT s.date, s.time, sub.subject_name, st.name
+    FROM ATTENDANCE a
+    JOIN STATUS st ON st.status_id = a.status_id
+    JOIN SCHEDULE s ON a.schedule_id = s.schedule_id
+    JOIN SUBJECT sub ON s.subject_id = sub.subject_id
+    WHERE a.user_id = ?
+    ORDER BY s.date, s.time, s.schedule_id
+"""
+
+DICTS = ["student", "group", "subject", "date", "time", "status"]
+ID_DICTS = ["student", "group", "subject"]  # словари, у которых есть id в БД
+INDEXES = ["student", "group", "subject"]
+
+def _code_type(n):
+    return "B" if n <= 0xFF else "H" if n <= 0xFFFF else "I"
+
+# -------------------------
+# Writer
+# -------------------------
+class _Dict:
+    def __init__(self):
+        self.codes = {}   # ключ (id или строка) -> код
+        self.values = []  # код -> строка
+        self.ids = []     # код -> id в БД (для ID_DICTS)
+
+    def code(self, key, value, id_=None):
+        code = self.codes.get(key)
+        if code is None:
+            code = self.codes[key] = len(self.values)
+            self.values.append(value)
+            if id_ is not None:
+                self.ids.append(id_)
+        return code
+
+def _csr(codes, n_keys):
+    """Индекс ключ -> номера строк (по возрастанию) для столбца кодов."""
+    counts = array("I", bytes(4 * n_keys))
+    for c in codes:
+        counts[c] += 1
+    offsets = array("I", [0]) * (n_keys + 1)
+    total = 0
+    for k in range(n_keys):
+        offsets[k] = total
+        total += counts[k]
+    offsets[n_keys] = total
+    pos = array("I", offsets[:n_keys])
+    rows = array("I", bytes(4 * len(codes)))
+    for i, c in enumerate(codes):
+        rows[pos[c]] = i
+        pos[c] += 1
+    return offsets, rows
+
+def write_snapshot(conn, path, batch_size=10000):
+    """
+    Пишет снимок ATTENDANCE в path (через временный файл).
+    Возвращает dict {"rows", "bytes", "seconds"}.
+    """
+    started = time.perf_counter()
+    dicts = {name: _Dict() for name in DICTS}
+    cols = {"attendance_id": array("q"), "schedule_id": array("q")}
+    raw = {name: array("I") for name in DICTS}  # коды до сжатия до B/H/I
+
+    cur = conn.execute(SNAPSHOT_QUERY)
+    while True:
+        batch = cur.fetchmany(batch_size)
+        if not batch:
+            break
+        for (aid, sid, uid, username, gid, group, subid, subject, date, tm, stid, status) in batch:
+            cols["attendance_id"].append(aid)
+            cols["schedule_id"].append(sid)
+            raw["student"].append(dicts["student"].code(uid, username, uid))
+            raw["group"].append(dicts["group"].code(gid, group, gid))
+            raw["subject"].append(dicts["subject"].code(subid, subject, subid))
+            # строки идут по возрастанию даты — коды дат сразу в отсортированном порядке
+            raw["date"].append(dicts["date"].code(date, date))
+            raw["time"].append(dicts["time"].code(tm, tm))
+            raw["status"].append(dicts["status"].code(stid, status))
+
+    rows = len(cols["attendance_id"])
+    sections = {}
+    blobs = []
+
+    def add(name, arr):
+        sections[name] = [arr.typecode, len(arr)]
+        blobs.append((name, arr))
+
+    for name, arr in cols.items():
+        add(f"col.{name}", arr)
+    for name in DICTS:
+        d = dicts[name]
+        add(f"col.{name}", array(_code_type(len(d.values)), raw[name]))
+        encoded = [v.encode("utf-8") if v is not None else b"" for v in d.values]
+        offsets = array("I", [0])
+        for e in encoded:
+            offsets.append(offsets[-1] + len(e))
+        add(f"dict.{name}.offsets", offsets)
+        add(f"dict.{name}.data", array("B", b"".join(encoded)))
+        if name in ID_DICTS:
+            add(f"dict.{name}.ids", array("q", d.ids))
+    for name in INDEXES:
+        offsets, row_ids = _csr(raw[name], len(dicts[name].values))
+        add(f"index.{name}.offsets", offsets)
+        add(f"index.{name}.rows", row_ids)
+    del raw
+
+    header = {"rows": rows, "byteorder": sys.byteorder, "created": datetime.now().isoformat(timespec="seconds"),
+              "watermark": max(cols["attendance_id"]) if rows else 0, "sections": sections}
+    # смещения зависят от длины заголовка — считаем, пока не сойдётся
+    offset_base = 0
+    while True:
+        pos = offset_base
+        for name, arr in blobs:
+            pos = -(-pos // ALIGN) * ALIGN
+            sections[name] = [arr.typecode, len(arr), pos]
+            pos += len(arr) * arr.itemsize
+        head = json.dumps(header, ensure_ascii=False).encode("utf-8")
+        base = -(-(len(MAGIC) + 4 + len(head)) // ALIGN) * ALIGN
+        if base == offset_base:
+            break
+        offset_base = base
+
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC + len(head).to_bytes(4, "little") + head)
+        for name, arr in blobs:
+            f.write(b"\0" * (sections[name][2] - f.tell()))
+            arr.tofile(f)
+    os.replace(tmp, path)
+    return {"rows": rows, "bytes": os.path.getsize(path), "seconds": round(time.perf_counter() - started, 3)}
+
+# -------------------------
+# Reader
+# -------------------------
+class Snapshot:
+    """
+    Снимок, открытый через mmap: столбцы — memoryview поверх файла, в память
+    читаются только словари (и только при первом обращении).
+    Методы повторяют запросы приложения, но без обращения к БД.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mm[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{path}: не снимок посещаемости")
+        n = int.from_bytes(self.mm[len(MAGIC):len(MAGIC) + 4], "little")
+        self.header = json.loads(self.mm[len(MAGIC) + 4:len(MAGIC) + 4 + n].decode("utf-8"))
+        self.rows = self.header["rows"]
+        self.swap = self.header["byteorder"] != sys.byteorder
+        self._dicts = {}
+        self._id_codes = {}
+        self.cols = {name[4:]: self._section(name) for name in self.header["sections"] if name.startswith("col.")}
+
+    def _section(self, name):
+        typecode, length, offset = self.header["sections"][name]
+        size = array(typecode).itemsize
+        view = memoryview(self.mm)[offset:offset + length * size]
+        if not self.swap:
+            return view.cast(typecode)
+        arr = array(typecode, view.tobytes())  # чужой порядок байт — копия с перестановкой
+        arr.byteswap()
+        return arr
+
+    def close(self):
+        self.cols = {}
+        if getattr(self, "mm", None) is not None:
+            try:
+                self.mm.close()
+            except BufferError:
+                pass  # на mmap ещё ссылаются memoryview вызывающего кода
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def values(self, name):
+        """Словарь name: список строк по коду."""
+        if name not in self._dicts:
+            offsets = self._section(f"dict.{name}.offsets")
+            data = self._section(f"dict.{name}.data").tobytes()
+            self._dicts[name] = [data[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+        return self._dicts[name]
+
+    def code_of_id(self, name, id_):
+        """Код словаря student/group/subject по id из БД (None — нет в снимке)."""
+        if name not in self._id_codes:
+            self._id_codes[name] = {id_: code for code, id_ in enumerate(self._section(f"dict.{name}.ids"))}
+        return self._id_codes[name].get(id_)
+
+    def _index(self, name, code):
+        offsets = self._section(f"index.{name}.offsets")
+        return self._section(f"index.{name}.rows")[offsets[code]:offsets[code + 1]]
+
+    def _date_bounds(self, date_from, date_to):
+        """Диапазон кодов дат [lo, hi) для фильтра по строкам дат."""
+        dates = self.values("date")
+        lo = bisect_left(dates, date_from) if date_from else 0
+        hi = bisect_right(dates, date_to) if date_to else len(dates)
+        return lo, hi
+
+    def _row(self, i):
+        c = self.cols
+        return (c["attendance_id"][i], self.values("student")[c["student"][i]], self.values("group")[c["group"][i]],
+                self.values("date")[c["date"][i]], self.values("time")[c["time"][i]],
+                self.values("subject")[c["subject"][i]], self.values("status")[c["status"][i]])
+
+    def student_attendance(self, user_id):
+        """
+        Как окно «Моя посещаемость»: (date, time, subject, status) по (date, time, schedule_id).
+        Индекс by_student упорядочен по (date, attendance_id), поэтому строки студента
+        досортировываются; коды времени не упорядочены — сравниваются сами строки.
+        """
+        code = self.code_of_id("student", user_id)
+        if code is None:
+            return []
+        c, d = self.cols, {n: self.values(n) for n in ("date", "time", "subject", "status")}
+        rows = sorted(self._index("student", code),
+                      key=lambda i: (c["date"][i], d["time"][c["time"][i]], c["schedule_id"][i]))
+        return [(d["date"][c["date"][i]], d["time"][c["time"][i]], d["subject"][c["subject"][i]],
+                 d["status"][c["status"][i]]) for i in rows]
+
+    def attendance_page(self, filters=None, direction="next", key=None, limit=PAGE_SIZE):
+        """
+        Как reports.attendance_page: строки (date DESC, attendance_id DESC) с теми же фильтрами
+        и keyset-ключом (date, attendance_id). Возвращает список (key, values).
+        """
+        filters = filters or {}
+        if key is None and direction == "prev":
+            return []
+        c = self.cols
+        lo, hi = self._date_bounds(filters.get("date_from"), filters.get("date_to"))
+        wanted = {}
+        for name in ("group", "subject"):
+            if filters.get(f"{name}_id"):
+                wanted[name] = self.code_of_id(name, filters[f"{name}_id"])
+                if wanted[name] is None:
+                    return []
+        if filters.get("status"):
+            name = STATUSES[status_id(filters["status"])]
+            try:
+                wanted["status"] = self.values("status").index(name)
+            except ValueError:
+                return []
+
+        # кандидаты — самый узкий индекс или все строки; в любом случае по возрастанию (date, id)
+        candidates = range(self.rows)
+        for name in ("group", "subject"):
+            if name in wanted:
+                rows = self._index(name, wanted[name])
+                if len(rows) < len(candidates):
+                    candidates = rows
+        dates, ids = c["date"], c["attendance_id"]
+        start = bisect_left(candidates, lo, key=lambda i: dates[i])
+        end = bisect_left(candidates, hi, key=lambda i: dates[i])
+        if key is not None:
+            kd = bisect_left(self.values("date"), key[0])
+            exact = kd < len(self.values("date")) and self.values("date")[kd] == key[0]
+            pos = bisect_left(candidates, (kd, key[1] if exact else 0), key=lambda i: (dates[i], ids[i]))
+            if direction == "next":
+                end = min(end, pos)
+            else:
+                if exact and pos < len(candidates) and (dates[candidates[pos]], ids[candidates[pos]]) == (kd, key[1]):
+                    pos += 1
+                start = max(start, pos)
+
+        checks = [(c[name], code) for name, code in wanted.items()]
+        found = []
+        positions = range(end - 1, start - 1, -1) if direction == "next" else range(start, end)
+        for p in positions:
+            i = candidates[p]
+            if all(col[i] == code for col, code in checks):
+                found.append(i)
+                if len(found) >= limit:
+                    break
+        if direction == "prev":
+            found.reverse()
+        return [((self.values("date")[dates[i]], ids[i]), self._row(i)) for i in found]
+
+    def verify(self, conn):
+        """
+        Сверяет student_attendance каждого студента снимка с тем же запросом к БД.
+        Снимок и БД должны быть одного состояния (сразу после write_snapshot).
+        Возвращает список расхождений (user_id, из снимка, из БД).
+        """
+        mismatches = []
+        for user_id in self._section("dict.student.ids"):
+            got = self.student_attendance(user_id)
+            expected = [tuple(r) for r in conn.execute(STUDENT_ATTENDANCE_QUERY, (user_id,))]
+            if got != expected:
+                mismatches.append((user_id, got, expected))
+        return mismatches
+
+    def info(self):
+        return {"rows": self.rows, "bytes": self.mm.size(), "created": self.header["created"],
+                "watermark": self.header["watermark"],
+                "dictionaries": {n: len(self._section(f"dict.{n}.offsets")) - 1 for n in DICTS}}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Колоночный снимок посещаемости")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("write", help="записать снимок из БД")
+    p.add_argument("path")
+    p.add_argument("--db", default=DB_PATH)
+    p = sub.add_parser("info", help="сведения о снимке")
+    p.add_argument("path")
+    p = sub.add_parser("student", help="посещаемость студента")
+    p.add_argument("path")
+    p.add_argument("user_id", type=int)
+    p = sub.add_parser("verify", help="сверить снимок с БД")
+    p.add_argument("path")
+    p.add_argument("--db", default=DB_PATH)
+    p = sub.add_parser("report", help="страница отчёта «все посещения»")
+    p.add_argument("path")
+    for name in ("group-id", "subject-id"):
+        p.add_argument(f"--{name}", type=int)
+    for name in ("date-from", "date-to", "status"):
+        p.add_argument(f"--{name}")
+    p.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.command == "write":
+        if not os.path.exists(args.db):
+            raise SystemExit(f"База данных не найдена: {args.db}")
+        conn = sqlite3.connect(args.db)
+        print(write_snapshot(conn, args.path))
+        conn.close()
+    else:
+        with Snapshot(args.path) as snap:
+            if args.command == "info":
+                print(json.dumps(snap.info(), ensure_ascii=False, indent=2))
+            elif args.command == "student":
+                for row in snap.student_attendance(args.user_id):
+                    print(*row, sep="\t")
+            elif args.command == "verify":
+                conn = sqlite3.connect(args.db)
+                problems = snap.verify(conn)
+                conn.close()
+                for user_id, got, expected in problems:
+                    print(f"mismatch: user_id {user_id}: снимок {len(got)} строк, БД {len(expected)}")
+                print("OK" if not problems else f"{len(problems)} расхождений")
+            else:
+                filters = {"group_id": args.group_id, "subject_id": args.subject_id,
+                           "date_from": args.date_from, "date_to": args.date_to, "status": args.status}
+                for _, row in snap.attendance_page(filters, limit=args.limit):
+                    print(*row, sep="\t")
@@ -0,0 +1,340 @@
+import re
+import time
+import sqlite3
+import argparse
+from bisect import bisect_right
+from datetime import date, datetime, timedelta
+
+from db import DB_PATH, db_query, db_transaction
+
+# Длительность пары; в SCHEDULE хранится только начало
+LESSON_MINUTES = 90
+WEEKDAYS = ["пн", "вт", "ср", "чт", "пт", "сб", "вс"]
+CONFLICT_MODES = ("abort", "skip", "check")
+_TIME = re.compile(r"^([01]\d|2[0-3]):[0-5]\d$")
+
+INSERT_SESSION = """
+    INSERT INTO SCHEDULE (subject_id, teacher_id, group_id, date, time, room)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+# ix_schedule_date
+EXISTING_QUERY = """
+    SELECT schedule_id, subject_id, teacher_id, group_id, date, time, room
+    FROM SCHEDULE
+    WHERE date BETWEEN ? AND ?
+"""
+
+# Занятия преподавателя за период: SCHEDULE.starts_at ('YYYY-MM-DD HH:MM', миграция 9),
+# поиск по ix_schedule_teacher_starts — время не зависит от длины истории
+TEACHER_WINDOW_QUERY = """
+    SELECT s.schedule_id, s.date, s.time, sub.subject_name, g.group_name, s.room
+    FROM SCHEDULE s
+    JOIN SUBJECT sub ON s.subject_id = sub.subject_id
+    JOIN "GROUP" g ON s.group_id = g.group_id
+    WHERE s.teacher_id = ? AND s.starts_at >= ? AND s.starts_at < ?
+    ORDER BY s.starts_at
+"""
+NEXT_SESSION_QUERY = """
+    SELECT s.schedule_id, s.date, s.time, sub.subject_name, g.group_name, s.room
+    FROM SCHEDULE s
+    JOIN SUBJECT sub ON s.subject_id = sub.subject_id
+    JOIN "GROUP" g ON s.group_id = g.group_id
+    WHERE s.teacher_id = ? AND s.starts_at >= ?
+    ORDER BY s.starts_at
+    LIMIT 1
+"""
+
+def _date(value):
+    return value if isinstance(value, date) else date.fromisoformat(value)
+
+def weekday(value):
+    """Номер дня недели (0 — понедельник) по числу или сокращению: пн, вт, ..."""
+    if isinstance(value, str) and not value.strip().isdigit():
+        name = value.strip().lower()[:2]
+        if name not in WEEKDAYS:
+            raise ValueError(f"Неизвестный день недели: {value!r}")
+        return WEEKDAYS.index(name)
+    day = int(value)
+    if not 0 <= day <= 6:
+        raise ValueError(f"День недели должен быть 0-6: {value!r}")
+    return day
+
+# -------------------------
+# Rules -> sessions
+# -------------------------
+def expand(rules, date_from, date_to, skip_dates=()):
+    """
+    Разворачивает недельные правила в занятия за период [date_from, date_to].
+    - rules: dict с subject_id, teacher_id, group_id, weekday, time (HH:MM),
+      необязательными room и every (раз в every недель, по умолчанию каждую)
+    - skip_dates: даты без занятий (праздники)
+    - возвращает список (subject_id, teacher_id, group_id, date, time, room) по дате и времени
+    """
+    start, end = _date(date_from), _date(date_to)
+    if end < start:
+        raise ValueError("Конец периода раньше начала")
+    skip = {_date(d) for d in skip_dates}
+    sessions = []
+    for rule in rules:
+        day = weekday(rule["weekday"])
+        tm = str(rule["time"]).strip()
+        if not _TIME.match(tm):
+            raise ValueError(f"Время должно быть в формате HH:MM: {tm!r}")
+        every = int(rule.get("every") or 1)
+        if every < 1:
+            raise ValueError("every должно быть не меньше 1")
+        room = (rule.get("room") or "").strip() or None
+        step = timedelta(weeks=every)
+        current = start + timedelta(days=(day - start.weekday()) % 7)
+        while current <= end:
+            if current not in skip:
+                sessions.append((rule["subject_id"], rule["teacher_id"], rule["group_id"],
+                                 current.isoformat(), tm, room))
+            current += step
+    sessions.sort(key=lambda s: (s[3], s[4], s[2]))
+    return sessions
+
+# -------------------------
+# Conflict detection
+# -------------------------
+class _Minutes:
+    """
+    Начало занятия в минутах от начала эпохи; дата разбирается один раз.
+    Старые строки SCHEDULE могли сохраниться со временем вроде "9:00" или пустым —
+    они разбираются через strptime; ValueError, если дата или время не разбираются.
+    """
+
+    def __init__(self):
+        self.days = {}
+
+    def __call__(self, day, tm):
+        base = self.days.get(day)
+        if base is None:
+            base = self.days[day] = datetime.strptime(str(day), "%Y-%m-%d").toordinal() * 1440
+        if isinstance(tm, str) and _TIME.match(tm):
+            return base + int(tm[:2]) * 60 + int(tm[3:5])
+        t = datetime.strptime(str(tm).strip(), "%H:%M")
+        return base + t.hour * 60 + t.minute
+
+def _resources(session):
+    """Что занимает занятие: преподаватель, группа и (если указана) аудитория."""
+    _, teacher_id, group_id, _, _, room = session
+    slots = [("teacher", teacher_id), ("group", group_id)]
+    if room:
+        slots.append(("room", room.strip().casefold()))
+    return slots
+
+def find_conflicts(sessions, existing=(), minutes=LESSON_MINUTES, invalid=None):
+    """
+    Пересечения новых занятий по преподавателю, группе и аудитории.
+    Сохранённые занятия — интервальный индекс: по каждому ресурсу отсортированные
+    начала, пересечение ищется bisect'ом. Новые занятия проходятся одним sweep'ом по
+    времени начала: занятие принимается, если все его ресурсы свободны, иначе это конфликт.
+    - sessions: новые занятия (как из expand)
+    - existing: строки (schedule_id, subject_id, teacher_id, group_id, date, time, room);
+      строки с неразборчивыми датой или временем пропускаются, их schedule_id
+      добавляются в список invalid, если он передан
+    - возвращает список dict {resource, key, date, time, session, other_session, schedule_id}:
+      session — индекс отклонённого занятия в sessions; с чем оно пересеклось — другое
+      новое занятие (other_session) или сохранённое (schedule_id)
+    """
+    minute = _Minutes()
+    parsed = []
+    for schedule_id, *row in existing:
+        try:
+            parsed.append((minute(row[3], row[4]), schedule_id, row))
+        except ValueError:
+            if invalid is not None:
+                invalid.append(schedule_id)
+    # сортировка по разобранному началу: строкой "13:00" < "9:00", и bisect промахнётся
+    parsed.sort(key=lambda p: (p[0], p[1]))
+    index = {}  # ресурс -> (начала по возрастанию, schedule_id)
+    for start, schedule_id, row in parsed:
+        for slot in _resources(row):
+            starts, ids = index.setdefault(slot, ([], []))
+            starts.append(start)
+            ids.append(schedule_id)
+
+    starts_of = [minute(s[3], s[4]) for s in sessions]
+    busy = {}  # ресурс -> (конец последнего принятого занятия, его индекс)
+    conflicts = []
+    for i in sorted(range(len(sessions)), key=starts_of.__getitem__):
+        start, slots = starts_of[i], _resources(sessions[i])
+        clash = None
+        for slot in slots:
+            taken = index.get(slot)
+            if taken is not None:
+                # пары одинаковой длины пересекаются, если начала ближе minutes
+                j = bisect_right(taken[0], start - minutes)
+                if j < len(taken[0]) and taken[0][j] < start + minutes:
+                    clash = (slot, None, taken[1][j])
+                    break
+            end, other = busy.get(slot, (None, None))
+            if end is not None and start < end:
+                clash = (slot, other, None)
+                break
+        if clash is None:
+            for slot in slots:
+                busy[slot] = (start + minutes, i)
+            continue
+        (resource, key), other, schedule_id = clash
+        conflicts.append({"resource": resource, "key": key, "date": sessions[i][3], "time": sessions[i][4],
+                          "session": i, "other_session": other, "schedule_id": schedule_id})
+    conflicts.sort(key=lambda c: c["session"])
+    return conflicts
+
+def self_check(minutes=LESSON_MINUTES):
+    """
+    Прогоняет find_conflicts на сохранённых занятиях со смешанным форматом времени
+    ("9:00" рядом с "09:30" и "13:00") и сверяет с ожидаемым.
+    Возвращает список расхождений (случай, ожидалось, получено).
+    """
+    day = "2024-09-02"
+    cases = [
+        # (название, сохранённые занятия, новое занятие, ожидаемые schedule_id конфликтов, ожидаемые invalid)
+        ("без ведущего нуля", [(1, 1, 7, 1, day, "13:00", None), (2, 1, 7, 2, day, "9:00", None)],
+         (1, 7, 3, day, "09:30", None), [2], []),
+        ("с ведущим нулём", [(1, 1, 7, 1, day, "9:00", None), (2, 1, 7, 2, day, "13:00", None)],
+         (1, 7, 3, day, "12:00", None), [2], []),
+        ("аудитория", [(1, 1, 5, 1, day, "8:00", "101"), (2, 1, 6, 2, day, "10:30", "101")],
+         (1, 7, 3, day, "09:00", " 101 "), [1], []),
+        ("свободно", [(1, 1, 7, 1, day, "13:00", None), (2, 1, 7, 2, day, "9:00", None)],
+         (1, 7, 3, day, "10:30", None), [], []),
+        ("неразборчивое время", [(1, 1, 7, 1, day, "", None), (2, 1, 7, 2, day, "9:00", None)],
+         (1, 7, 3, day, "09:30", None), [2], [1]),
+    ]
+    problems = []
+    for name, existing, session, expected, expected_invalid in cases:
+        invalid = []
+        got = [c["schedule_id"] for c in find_conflicts([session], existing, minutes, invalid)]
+        if got != expected or invalid != expected_invalid:
+            problems.append((name, (expected, expected_invalid), (got, invalid)))
+    return problems
+
+# -------------------------
+# Generate
+# -------------------------
+def generate_schedule(rules, date_from, date_to, skip_dates=(), on_conflict="abort",
+                      minutes=LESSON_MINUTES, path=None):
+    """
+    Создаёт занятия по недельным правилам одной транзакцией. Проверка и вставка идут
+    в одной транзакции BEGIN IMMEDIATE, так что параллельная запись не проскочит между ними.
+    - on_conflict: "abort" — при любом пересечении ничего не записывать;
+      "skip" — записать всё, кроме отклонённых занятий; "check" — только проверить
+    - возвращает dict {sessions, inserted, conflicts, invalid, seconds}; sessions — список
+      занятий, invalid — schedule_id сохранённых занятий, которые не удалось проверить
+      (дата или время в БД не в формате YYYY-MM-DD / HH:MM)
+    """
+    if on_conflict not in CONFLICT_MODES:
+        raise ValueError(f"on_conflict: одно из {', '.join(CONFLICT_MODES)}")
+    started = time.perf_counter()
+    sessions = expand(rules, date_from, date_to, skip_dates)
+    invalid = []
+
+    def work(conn):
+        existing = conn.execute(EXISTING_QUERY, (sessions[0][3], sessions[-1][3])).fetchall() if sessions else []
+        del invalid[:]  # db_transaction может повторить work
+        conflicts = find_conflicts(sessions, existing, minutes, invalid)
+        if on_conflict == "check" or (conflicts and on_conflict == "abort"):
+            return 0, conflicts
+        rejected = {c["session"] for c in conflicts}
+        rows = [s for i, s in enumerate(sessions) if i not in rejected]
+        conn.executemany(INSERT_SESSION, rows)
+        return len(rows), conflicts
+
+    inserted, conflicts = db_transaction(work, path=path, label="TRANSACTION generate_schedule")
+    return {"sessions": sessions, "inserted": inserted, "conflicts": conflicts, "invalid": invalid,
+            "seconds": round(time.perf_counter() - started, 4)}
+
+def describe(conflict, sessions, names=None):
+    """
+    Строка для пользователя: какое занятие и с чем пересеклось.
+    - names: {"teacher": f(id) -> имя, "group": ...}, чтобы вместо id выводить имена
+    """
+    what = {"teacher": "преподаватель", "group": "группа", "room": "аудитория"}[conflict["resource"]]
+    key = (names or {}).get(conflict["resource"], lambda key: key)(conflict["key"])
+    if conflict["schedule_id"] is not None:
+        other = f"занятием #{conflict['schedule_id']}"
+    else:
+        other = f"новым занятием {sessions[conflict['other_session']][4]}"
+    return f"{conflict['date']} {conflict['time']}: {what} {key} уже занят(а) {other}"
+
+# -------------------------
+# Teacher views
+# -------------------------
+def teacher_window(teacher_id, date_from=None, date_to=None, query=db_query):
+    """
+    Занятия преподавателя с date_from по date_to включительно, по времени начала.
+    - date_from / date_to: дата (date или 'YYYY-MM-DD'); None — без границы
+    - возвращает строки (schedule_id, date, time, subject_name, group_name, room)
+    """
+    start = _date(date_from).isoformat() if date_from else ""
+    end = (_date(date_to) + timedelta(days=1)).isoformat() if date_to else "9999"
+    return query(TEACHER_WINDOW_QUERY, (teacher_id, start, end))
+
+def next_session(teacher_id, now=None, minutes=LESSON_MINUTES, query=db_query):
+    """
+    Текущее (начавшееся меньше minutes назад) или ближайшее занятие преподавателя.
+    - now: datetime (по умолчанию — сейчас)
+    - возвращает строку как у teacher_window или None
+    """
+    since = (now or datetime.now()) - timedelta(minutes=minutes)
+    rows = query(NEXT_SESSION_QUERY, (teacher_id, since.strftime("%Y-%m-%d %H:%M")))
+    return rows[0] if rows else None
+
+# -------------------------
+# CLI: правила из CSV / JSON
+# -------------------------
+def _resolve(records, conn):
+    """Правила с именами (group_name, subject_name, teacher) -> правила с id."""
+    from importer import Lookups
+
+    lk = Lookups(conn)
+    rules = []
+    for n, rec in enumerate(records, start=1):
+        try:
+            rules.append({"group_id": lk.group_id(rec["group_name"]), "subject_id": lk.subject_id(rec["subject_name"]),
+                          "teacher_id": lk.user_id(rec["teacher"], "teacher"), "weekday": rec["weekday"],
+                          "time": rec["time"], "room": rec.get("room"), "every": rec.get("every")})
+        except (KeyError, ValueError) as e:
+            raise SystemExit(f"правило #{n}: {e}")
+    return rules
+
+if __name__ == "__main__":
+    from importer import read_records
+
+    parser = argparse.ArgumentParser(
+        description="Генерация расписания по недельным правилам",
+        epilog="Поля правила: group_name, subject_name, teacher, weekday (0-6 или пн..вс), time (HH:MM), "
+               "room, every (раз в N недель)")
+    parser.add_argument("rules", nargs="?", help="CSV / JSON / NDJSON с правилами")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--from", dest="date_from")
+    parser.add_argument("--to", dest="date_to")
+    parser.add_argument("--skip", default="", help="даты без занятий через запятую")
+    parser.add_argument("--on-conflict", choices=CONFLICT_MODES, default="abort")
+    parser.add_argument("--self-check", action="store_true", help="проверить поиск пересечений и выйти")
+    args = parser.parse_args()
+
+    if args.self_check:
+        problems = self_check()
+        for p in problems:
+            print("mismatch:", p)
+        print("OK" if not problems else f"{len(problems)} расхождений")
+        raise SystemExit(1 if problems else 0)
+    if not (args.rules and args.date_from and args.date_to):
+        parser.error("нужны rules, --from и --to")
+
+    conn = sqlite3.connect(args.db)
+    rules = _resolve(read_records(args.rules), conn)
+    conn.close()
+    report = generate_schedule(rules, args.date_from, args.date_to,
+                               [d for d in args.skip.split(",") if d.strip()], args.on_conflict, path=args.db)
+    print(f"занятий {len(report['sessions'])}, записано {report['inserted']}, "
+          f"конфликтов {len(report['conflicts'])}, {report['seconds']:.3f} s")
+    for c in report["conflicts"][:20]:
+        print("  " + describe(c, report["sessions"]))
+    if len(report["conflicts"]) > 20:
+        print(f"  ... ещё {len(report['conflicts']) - 20}")
+    if report["invalid"]:
+        print(f"не проверены (дата/время не в формате): schedule_id {', '.join(map(str, report['invalid'][:20]))}")
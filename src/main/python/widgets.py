@@ -0,0 +1,118 @@
+import tkinter as tk
+from tkinter import ttk, messagebox
+from collections import deque
+
+# -------------------------
+# Loading overlay
+# -------------------------
+class LoadingOverlay:
+    """Надпись «Загрузка…» поверх виджета, пока идёт фоновый запрос."""
+
+    def __init__(self, widget, text="Загрузка…"):
+        self.label = tk.Label(widget, text=text, font=("Segoe UI", 11, "italic"), fg="gray")
+
+    def show(self):
+        self.label.place(relx=0.5, rely=0.5, anchor="center")
+        self.label.lift()
+
+    def hide(self):
+        self.label.place_forget()
+
+# -------------------------
+# Paged Treeview
+# -------------------------
+class PagedTreeview(ttk.Frame):
+    """
+    Treeview, который подгружает строки страницами при прокрутке
+    и держит в виджете не больше max_rows строк.
+    - fetch(direction, key, limit): direction — "next" или "prev", key — ключ крайней
+      загруженной строки (None — начало). Возвращает список (key, values) в порядке отображения.
+    - adb: AsyncDB; если задан, fetch выполняется в фоновом потоке
+    """
+
+    def __init__(self, parent, columns, headers, widths, fetch, page_size=200, max_rows=1000, adb=None):
+        super().__init__(parent)
+        self.fetch = fetch
+        self.adb = adb
+        self.page_size = page_size
+        self.max_rows = max_rows
+        self.tree = ttk.Treeview(self, columns=columns, show="headings")
+        for c, h, w in zip(columns, headers, widths):
+            self.tree.heading(c, text=h); self.tree.column(c, width=w)
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self._on_scroll)
+        self.tree.pack(side="left", fill="both", expand=True)
+        self.scrollbar.pack(side="right", fill="y")
+        self.items = deque()  # (item_id, key) в порядке отображения
+        self.at_start = True
+        self.at_end = False
+        self._pending = None
+        self._task = None
+        self.overlay = LoadingOverlay(self.tree)
+
+    def reload(self):
+        """Сбрасывает окно и загружает первую страницу (незавершённая загрузка отменяется)."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._pending is not None:
+            self.after_cancel(self._pending)
+            self._pending = None
+        self.tree.delete(*self.tree.get_children())
+        self.items.clear()
+        self.at_start, self.at_end = True, False
+        self._load("next")
+
+    def _on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        if self._pending is not None or self._task is not None:
+            return
+        if float(last) > 0.9 and not self.at_end:
+            self._pending = self.after_idle(self._load, "next")
+        elif float(first) < 0.1 and not self.at_start:
+            self._pending = self.after_idle(self._load, "prev")
+
+    def _load(self, direction):
+        self._pending = None
+        if direction == "next":
+            key = self.items[-1][1] if self.items else None
+        else:
+            key = self.items[0][1]
+        if self.adb is None:
+            self._apply(direction, self.fetch(direction, key, self.page_size))
+            return
+
+        def done(rows):
+            self._task = None
+            self.overlay.hide()
+            self._apply(direction, rows)
+
+        def failed(error):
+            self._task = None
+            self.overlay.hide()
+            messagebox.showerror("Ошибка", f"Не удалось загрузить данные:\n{error}", parent=self)
+
+        if not self.items:
+            self.overlay.show()
+        self._task = self.adb.submit(self.fetch, direction, key, self.page_size,
+                                     on_done=done, on_error=failed, owner=self)
+
+    def _apply(self, direction, rows):
+        anchor = self.tree.identify_row(1)
+        if direction == "next":
+            for key, values in rows:
+                self.items.append((self.tree.insert("", "end", values=values), key))
+            self.at_end = len(rows) < self.page_size
+            while len(self.items) > self.max_rows:
+                self.tree.delete(self.items.popleft()[0])
+                self.at_start = False
+        else:
+            for key, values in reversed(rows):
+                self.items.appendleft((self.tree.insert("", 0, values=values), key))
+            self.at_start = len(rows) < self.page_size
+            while len(self.items) > self.max_rows:
+                self.tree.delete(self.items.pop()[0])
+                self.at_end = False
+        # возвращаем на экран строку, которая была сверху до подгрузки
+        if anchor and self.tree.exists(anchor):
+            self.tree.yview_moveto(self.tree.index(anchor) / max(len(self.items), 1))
@@ -0,0 +1,241 @@
+import time
+import queue
+import sqlite3
+import argparse
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from db import DB_PATH, PRAGMAS, db_query
+
+# записи, пришедшие за это время, коммитятся одной транзакцией
+GROUP_COMMIT_MS = 5
+MAX_BATCH = 500
+LATENCY_SAMPLES = 1000  # сколько последних замеров задержки хранить для перцентилей
+
+# -------------------------
+# Group-commit write queue
+# -------------------------
+class WriteQueue:
+    """
+    Очередь записи с групповым коммитом. Все записи выполняет один поток со своим
+    соединением: он берёт из очереди то, что пришло за delay_ms (не больше max_batch),
+    и выполняет одной транзакцией. Каждая запись — в своём SAVEPOINT, так что ошибка
+    одной не откатывает остальные. Соединение писателя работает с synchronous=FULL:
+    fsync делается один раз на пачку, и Future завершается, когда запись уже на диске.
+    - submit(work): work(conn) выполняется в транзакции; возвращает concurrent.futures.Future
+    - при 'database is locked' (пишет другой процесс) пачка повторяется целиком с backoff
+    """
+
+    def __init__(self, path=None, delay_ms=GROUP_COMMIT_MS, max_batch=MAX_BATCH, retries=6, base_delay=0.1):
+        self.path = path or DB_PATH
+        self.delay = delay_ms / 1000
+        self.max_batch = max_batch
+        self.retries = retries
+        self.base_delay = base_delay
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.batches = 0
+        self.writes = 0
+        self.failed = 0
+        self.retried = 0
+        self.largest = 0
+        self.max_depth = 0
+        self.commit_ms = deque(maxlen=LATENCY_SAMPLES)
+        self.wait_ms = deque(maxlen=LATENCY_SAMPLES)  # от submit() до COMMIT
+        self.sizes = deque(maxlen=LATENCY_SAMPLES)
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self.thread.start()
+
+    def submit(self, work):
+        if self.closed:
+            raise RuntimeError("WriteQueue закрыта")
+        future = Future()
+        self.queue.put((work, future, time.perf_counter()))
+        depth = self.queue.qsize()
+        if depth > self.max_depth:
+            with self.lock:
+                self.max_depth = max(self.max_depth, depth)
+        return future
+
+    def execute(self, sql, params=()):
+        """Одна команда через очередь; Future возвращает rowcount."""
+        return self.submit(lambda conn: conn.execute(sql, params).rowcount)
+
+    def executemany(self, sql, seq):
+        seq = list(seq)
+        return self.submit(lambda conn: conn.executemany(sql, seq).rowcount)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        for name, value in PRAGMAS:
+            conn.execute(f"PRAGMA {name} = {value}")
+        conn.execute("PRAGMA synchronous = FULL")
+        return conn
+
+    def _take_batch(self, first):
+        batch = [first]
+        deadline = time.perf_counter() + self.delay
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is None:
+                self.queue.put(None)  # остановка — после этой пачки
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        conn = self._connect()
+        try:
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    break
+                batch = [(work, future, queued) for work, future, queued in self._take_batch(item)
+                         if future.set_running_or_notify_cancel()]
+                if batch:
+                    self._commit(conn, batch)
+        finally:
+            conn.close()
+
+    def _commit(self, conn, batch):
+        for attempt in range(1, self.retries + 1):
+            started = time.perf_counter()
+            try:
+                results = self._transaction(conn, [work for work, _, _ in batch])
+                break
+            except sqlite3.OperationalError as e:
+                if "locked" in str(e).lower() and attempt < self.retries:
+                    with self.lock:
+                        self.retried += 1
+                    time.sleep(self.base_delay * (2 ** (attempt - 1)))
+                    continue
+                results = [(False, e)] * len(batch)
+                break
+            except Exception as e:
+                results = [(False, e)] * len(batch)
+                break
+        done = time.perf_counter()
+
+        with self.lock:
+            self.batches += 1
+            self.writes += len(batch)
+            self.failed += sum(1 for ok, _ in results if not ok)
+            self.largest = max(self.largest, len(batch))
+            self.sizes.append(len(batch))
+            self.commit_ms.append((done - started) * 1000)
+            self.wait_ms.extend((done - queued) * 1000 for _, _, queued in batch)
+        for (_, future, _), (ok, value) in zip(batch, results):
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    def _transaction(self, conn, works):
+        results = []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for work in works:
+                conn.execute("SAVEPOINT write")
+                try:
+                    results.append((True, work(conn)))
+                    conn.execute("RELEASE write")
+                except sqlite3.OperationalError as e:
+                    if "locked" in str(e).lower():
+                        raise
+                    conn.execute("ROLLBACK TO write")
+                    conn.execute("RELEASE write")
+                    results.append((False, e))
+                except Exception as e:
+                    conn.execute("ROLLBACK TO write")
+                    conn.execute("RELEASE write")
+                    results.append((False, e))
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        return results
+
+    def stats(self):
+        """Размер пачек, глубина очереди, задержка коммита и ожидания (мс, по последним замерам)."""
+        with self.lock:
+            return {"batches": self.batches, "writes": self.writes, "failed": self.failed,
+                    "retried_batches": self.retried,
+                    "avg_batch": round(self.writes / self.batches, 2) if self.batches else 0.0,
+                    "largest_batch": self.largest,
+                    "batch_p50": _percentile(self.sizes, 0.5),
+                    "queue_depth": self.queue.qsize(), "max_queue_depth": self.max_depth,
+                    "commit_ms_p50": _percentile(self.commit_ms, 0.5),
+                    "commit_ms_p95": _percentile(self.commit_ms, 0.95),
+                    "commit_ms_max": round(max(self.commit_ms), 3) if self.commit_ms else None,
+                    "wait_ms_p50": _percentile(self.wait_ms, 0.5),
+                    "wait_ms_p95": _percentile(self.wait_ms, 0.95)}
+
+    def close(self):
+        """Дописывает всё, что уже в очереди, и останавливает поток."""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
+        self.thread.join()
+
+def _percentile(samples, q):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * q))], 3)
+
+# -------------------------
+# CLI: отметки из нескольких потоков — db_query на каждую против очереди
+# -------------------------
+def _bench(path, threads, marks):
+    from attendance import UPSERT_ATTENDANCE, STATUSES
+
+    rows = db_query("SELECT schedule_id, user_id FROM ATTENDANCE ORDER BY attendance_id LIMIT ?",
+                    (threads * marks,), path=path)
+    if not rows:
+        raise SystemExit("В ATTENDANCE нет строк для замера")
+    statuses = list(STATUSES)
+    chunks = [[(s, u, statuses[(i + k) % 3]) for k, (s, u) in enumerate(rows[i::threads])] for i in range(threads)]
+
+    def direct(chunk):
+        for params in chunk:
+            db_query(UPSERT_ATTENDANCE, params, fetch=False, path=path)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(direct, chunks))
+    per_call = time.perf_counter() - started
+
+    writes = WriteQueue(path)
+
+    def queued(chunk):
+        for f in [writes.execute(UPSERT_ATTENDANCE, params) for params in chunk]:
+            f.result()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(queued, [[(s, u, statuses[(statuses.index(st) + 1) % 3]) for s, u, st in c] for c in chunks]))
+    grouped = time.perf_counter() - started
+    writes.close()
+
+    total = sum(len(c) for c in chunks)
+    print(f"db_query per mark: {total / per_call:8.0f} marks/s")
+    print(f"write queue:       {total / grouped:8.0f} marks/s")
+    print(writes.stats())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Очередь записи с групповым коммитом")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--marks", type=int, default=200, help="отметок на поток")
+    args = parser.parse_args()
+    _bench(args.db, args.threads, args.marks)